@@ -1,8 +1,8 @@
 import streamlit as st
 import time
 import random
-from database import load_db, save_db
-from logic import sync_user_state, save_current_user_state
+from database import get_state, preload_state
+from logic import sync_user_state, register_user
 
 # [핵심] 방금 만든 ui.py를 여기서 불러옵니다.
 from ui import render_ui
@@ -72,72 +72,26 @@ st.markdown("""
 
 
 # --- [데이터 초기화 및 로드] ---
+# 거래소 데이터는 프로세스 전체가 공유하는 get_state() 하나뿐이고, 세션에는 로그인 정보만 둡니다.
 if 'initialized' not in st.session_state:
     st.session_state['initialized'] = True
     st.session_state['logged_in'] = False 
     st.session_state['user_info'] = {}
     st.session_state['view_profile_id'] = None
-    
-    with st.spinner('클라우드 서버(Google Sheets)에서 데이터 불러오는 중...'):
-        saved_data = load_db()
-    
-    if saved_data:
-        st.session_state['user_db'] = saved_data['user_db']
-        st.session_state['user_names'] = saved_data['user_names']
-        st.session_state['market_data'] = saved_data['market_data']
-        st.session_state['trade_history'] = saved_data['trade_history']
-        st.session_state['board_messages'] = saved_data['board_messages']
-        st.session_state['user_states'] = saved_data['user_states']
-        st.session_state['pending_orders'] = saved_data.get('pending_orders', [])
-        st.session_state['interested_codes'] = set(saved_data.get('interested_codes', ['IU', 'G_DRAGON', 'ELON', 'DEV_MASTER']))
-    else:
-        st.session_state['user_db'] = {'test': '1234'} 
-        st.session_state['user_names'] = {'test': '테스터'}
-        st.session_state['user_states'] = {
-            'test': {
-                'balance_id': 10000000.0,
-                'my_elpis_locked': 1000000,
-                'portfolio': {},
-                'my_profile': {'vision': '', 'sns': '', 'photo': None},
-                'last_mining_time': None
-            }
-        }
-        st.session_state['market_data'] = {
-            'IU': {'name': '아이유', 'price': 50000, 'change': 2.5, 'desc': '국내 원탑 솔로 가수', 'history': [48000, 49000, 50000]},
-            'G_DRAGON': {'name': '지드래곤', 'price': 45000, 'change': -1.2, 'desc': 'K-POP의 아이콘', 'history': [46000, 45500, 45000]},
-            'ELON': {'name': '일론 머스크', 'price': 120000, 'change': 5.8, 'desc': '화성으로 가는 남자', 'history': [110000, 115000, 120000]},
-            'DEV_MASTER': {'name': '50년코딩장인', 'price': 10000, 'change': 0.0, 'desc': '이 앱을 만든 개발자', 'history': [10000]}
-        }
-        for i in range(5):
-            bot_id = f"pppp{i+1}" 
-            name = f"Bot_{i+1}"
-            st.session_state['user_db'][bot_id] = '1234'
-            st.session_state['user_names'][bot_id] = name
-            st.session_state['user_states'][bot_id] = {
-                'balance_id': 10000000.0,
-                'my_elpis_locked': 1000000, 
-                'portfolio': {},
-                'my_profile': {'vision': 'AI Trader', 'sns': '', 'photo': None},
-                'last_mining_time': None
-            }
-            st.session_state['market_data'][bot_id] = {
-                'name': name,
-                'price': 10000, 
-                'change': 0.0,
-                'desc': 'AI Bot',
-                'history': [10000]
-            }
-        st.session_state['trade_history'] = []
-        st.session_state['board_messages'] = [
-            {'code': 'IU', 'user': 'Fan_001', 'msg': '아이유 10만 전자 가즈아!!', 'time': '12:00'},
-            {'code': 'ELON', 'user': 'Mars_Lover', 'msg': '화성 갈끄니까~', 'time': '12:05'}
-        ]
-        st.session_state['pending_orders'] = []
-        st.session_state['interested_codes'] = {'IU', 'G_DRAGON', 'ELON', 'DEV_MASTER'}
-        save_db()
-
     st.session_state['selected_code'] = 'IU'
 
+# 로그인 화면은 데이터 없이 바로 그리고, 거래소 상태는 그동안 백그라운드에서 불러옵니다.
+preload_state()
+
+def loaded_state():
+    with st.spinner('클라우드 서버(Google Sheets)에서 데이터 불러오는 중...'):
+        try:
+            return get_state()
+        except Exception as e:
+            print(f"DB Load Error: {e}")
+            st.error("데이터를 불러오지 못했습니다. 잠시 후 다시 시도해 주세요.")
+            st.stop()
+
 # ==========================================
 # [앱 UI 시작]
 # ==========================================
@@ -193,10 +147,8 @@ if not st.session_state['logged_in']:
             l_pw = st.text_input("비밀번호", type="password", key="login_pw", placeholder="비밀번호를 입력하세요")
             st.markdown("<div style='height: 10px;'></div>", unsafe_allow_html=True)
             if st.button("ELPIS 시작하기", type="primary"):
-                if not st.session_state['user_db']:
-                     st.session_state['user_db'] = load_db()['user_db']
-                
-                if l_id in st.session_state['user_db'] and st.session_state['user_db'][l_id] == l_pw:
+                state = loaded_state()
+                if l_id in state.user_db and state.user_db[l_id] == l_pw:
                     st.session_state['logged_in'] = True
                     st.session_state['user_info']['id'] = l_id
                     sync_user_state(l_id)
@@ -215,14 +167,12 @@ if not st.session_state['logged_in']:
             
             if st.button("가입하고 1,000만 이드(ID) 받기", type="primary"):
                 if r_name and r_rrn and r_phone and r_id and r_pw:
-                    if r_id in st.session_state['user_db']:
-                        st.warning("이미 사용 중인 아이디입니다.")
+                    loaded_state()
+                    ok, msg = register_user(r_id, r_pw, r_name)
+                    if ok:
+                        st.success(msg)
                     else:
-                        st.session_state['user_db'][r_id] = r_pw
-                        st.session_state['user_names'][r_id] = r_name
-                        sync_user_state(r_id) 
-                        save_current_user_state(r_id)
-                        st.success("환영합니다! 가입이 완료되었습니다.")
+                        st.warning(msg)
                 else:
                     st.warning("모든 정보를 정확히 입력해주세요.")
         
@@ -0,0 +1,221 @@
+import argparse
+import datetime
+import json
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+
+from state import ExchangeState, default_data, new_account_state
+from events import update_price_match
+from exchange import Exchange
+from storage import SqliteBackend
+
+# --- [매칭 엔진 벤치마크] ---
+# Streamlit 없이 헤드리스 엔진(Exchange)에 주문을 직접 넣어서 잽니다.
+# logic.place_order()가 세션에서 유저 ID만 꺼내 Exchange.submit()을 부르는 것과 같은 경로이고,
+# 저장은 임시 파일의 SQLite 저장소로 대신하므로 네트워크/구글 인증 없이 돌아갑니다.
+#   python bench.py                      -> 모든 시나리오
+#   python bench.py -s deep_book -n 5000 -> 시나리오 하나, 주문 수 지정
+#   python bench.py --out bench_output.txt
+BASE_TIME = datetime.datetime(2026, 1, 1, 9, 0, 0)
+TICK = 100
+START_PRICE = 10000
+
+# --- [합성 상태] ---
+# 유저마다 잔고와 모든 종목 보유분을 넉넉히 줘서, 검증에 걸려 튕기는 주문 없이 매칭 경로만 재도록 합니다.
+def build_state(n_markets, n_users):
+    data = default_data()
+    codes = [f"M{i:04d}" for i in range(n_markets)]
+    users = [f"u{i:03d}" for i in range(n_users)]
+    data['market_data'] = {code: {'name': code, 'price': START_PRICE, 'change': 0.0, 'desc': 'bench', 'history': [START_PRICE]}
+                           for code in codes}
+    for user_id in users:
+        acct = new_account_state()
+        acct['balance_id'] = 10.0 ** 15
+        acct['portfolio'] = {code: {'qty': 10 ** 9, 'avg_price': START_PRICE} for code in codes}
+        data['user_db'][user_id] = 'bench'
+        data['user_names'][user_id] = user_id
+        data['user_states'][user_id] = acct
+    return Exchange(ExchangeState(data)), codes, users
+
+# Exchange.submit() 인자 (가상 시각은 주문마다 1초씩 흐릅니다)
+def order_args(i, user_id, side, code, price, qty):
+    return (user_id, side, code, price, qty, (BASE_TIME + datetime.timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S"))
+
+# 종목마다 중심가가 한 틱씩 오르내리고, 주문은 중심가 근처 ±spread 틱에 들어옵니다.
+def random_walk_flow(rnd, n_orders, codes, users, spread=5, owner_share=0.0):
+    mids = {code: START_PRICE for code in codes}
+    for i in range(n_orders):
+        code = rnd.choice(codes)
+        mids[code] = max(TICK, mids[code] + rnd.choice((-TICK, 0, TICK)))
+        user_id = users[0] if rnd.random() < owner_share else rnd.choice(users)
+        side = rnd.choice(('BUY', 'SELL'))
+        price = max(TICK, mids[code] + rnd.randint(-spread, spread) * TICK)
+        yield order_args(i, user_id, side, code, price, rnd.randint(1, 20))
+
+# 호가창을 미리 깊게 쌓아 둡니다 (매수는 중심가 아래, 매도는 위로 levels개 레벨, 레벨마다 per_level개 주문)
+def prefill(exchange, rnd, codes, users, levels, per_level):
+    i = 0
+    for code in codes:
+        for level in range(1, levels + 1):
+            for _ in range(per_level):
+                exchange.submit(*order_args(i, rnd.choice(users), 'BUY', code, START_PRICE - level * TICK, rnd.randint(1, 20)))
+                exchange.submit(*order_args(i, rnd.choice(users), 'SELL', code, START_PRICE + level * TICK, rnd.randint(1, 20)))
+                i += 1
+
+# --- [시나리오] ---
+# 이름 -> (엔진과 주문 이터레이터를 만드는 함수). 같은 seed면 항상 같은 주문 흐름이 나옵니다.
+def scenario_random_walk(rnd, n_orders):
+    exchange, codes, users = build_state(8, 50)
+    return exchange, random_walk_flow(rnd, n_orders, codes, users)
+
+def scenario_deep_book(rnd, n_orders):
+    exchange, codes, users = build_state(2, 50)
+    prefill(exchange, rnd, codes, users, levels=200, per_level=5)
+    return exchange, random_walk_flow(rnd, n_orders, codes, users, spread=20)
+
+def scenario_many_markets(rnd, n_orders):
+    exchange, codes, users = build_state(500, 50)
+    return exchange, random_walk_flow(rnd, n_orders, codes, users)
+
+# 한 유저가 호가창 대부분을 차지하고 그 유저가 다시 주문을 넣어서, 본인 주문을 건너뛰는 경로를 계속 밟게 합니다.
+def scenario_self_trade(rnd, n_orders):
+    exchange, codes, users = build_state(2, 4)
+    prefill(exchange, rnd, codes, users[:1], levels=50, per_level=10)
+    return exchange, random_walk_flow(rnd, n_orders, codes, users, spread=10, owner_share=0.9)
+
+SCENARIOS = {
+    'random_walk': scenario_random_walk,
+    'deep_book': scenario_deep_book,
+    'many_markets': scenario_many_markets,
+    'self_trade': scenario_self_trade,
+}
+
+# --- [측정 도구] ---
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * pct / 100))]
+
+def fmt_us(seconds):
+    return f"{seconds * 1e6:,.1f}us"
+
+# 스냅샷 한 번에 쓰일 전체 줄(계정/종목/주문/카운터)의 JSON 크기
+def snapshot_bytes(state):
+    with state.lock:
+        keys = {'users': state.user_states, 'markets': state.market_data, 'orders': state.open_orders,
+                'meta': ('counters', 'interested_codes')}
+        return sum(len(json.dumps(state._row(entity, key), ensure_ascii=False))
+                   for entity, entity_keys in keys.items() for key in list(entity_keys))
+
+def book_depth(state):
+    levels = sum(len(book.levels['BUY']) + len(book.levels['SELL']) for book in state.order_books.values())
+    return levels, len(state.open_orders)
+
+# --- [시나리오 실행] ---
+# 주문마다 submit() 지연을 재고, flush_every개마다 save_db()가 하는 것과 같은 저장(take_changes + write)을 잽니다.
+def run_scenario(name, n_orders, seed, flush_every, out):
+    exchange, flow = SCENARIOS[name](random.Random(seed), n_orders)
+    state = exchange.state
+    events = list(flow)
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    store = SqliteBackend(path, legacy_path=None)
+    latencies = []
+    write_latencies = []
+    write_bytes = []
+    checkpoints = []
+    marks = {max(1, n_orders * k // 4) for k in range(1, 5)}
+    try:
+        started = time.perf_counter()
+        for i, event in enumerate(events, start=1):
+            t0 = time.perf_counter()
+            exchange.submit(*event)
+            latencies.append(time.perf_counter() - t0)
+            if i % flush_every == 0 or i == len(events):
+                t0 = time.perf_counter()
+                with state.lock:
+                    changes = state.take_changes(state.snapshot_due())
+                store.write(changes)
+                write_latencies.append(time.perf_counter() - t0)
+                write_bytes.append(len(json.dumps(changes, ensure_ascii=False)))
+            if i in marks:
+                levels, resting = book_depth(state)
+                checkpoints.append((i, levels, resting, len(state.trades), snapshot_bytes(state)))
+        elapsed = time.perf_counter() - started
+    finally:
+        store.conn.close()
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+    latencies.sort()
+    write_latencies.sort()
+    out(f"== {name} (orders={len(events):,}, seed={seed}) ==")
+    out(f"  throughput      {len(events) / elapsed:,.0f} orders/s (incl. storage writes)")
+    out(f"  order latency   p50 {fmt_us(percentile(latencies, 50))}  p99 {fmt_us(percentile(latencies, 99))}  max {fmt_us(latencies[-1])}")
+    out(f"  save latency    p50 {fmt_us(percentile(write_latencies, 50))}  p99 {fmt_us(percentile(write_latencies, 99))}  "
+        f"(every {flush_every} orders, avg payload {sum(write_bytes) // max(1, len(write_bytes)):,} B)")
+    out(f"  trades          {len(state.trades):,}")
+    out("  orders  levels  resting  trades  snapshot")
+    for i, levels, resting, trades, size in checkpoints:
+        out(f"  {i:>6,}  {levels:>6,}  {resting:>7,}  {trades:>6,}  {size / 1024:>8,.1f} KB")
+    measure_allocations(name, seed, min(n_orders, 2000), out)
+
+# 같은 주문 흐름 앞부분을 tracemalloc 아래에서 다시 돌려 주문당 할당량을 봅니다. (tracemalloc이 느려서 따로 잽니다)
+def measure_allocations(name, seed, n_orders, out):
+    exchange, flow = SCENARIOS[name](random.Random(seed), n_orders)
+    events = list(flow)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.take_snapshot()
+        base, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        for event in events:
+            exchange.submit(*event)
+        current, peak = tracemalloc.get_traced_memory()
+        after = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+    blocks = sum(stat.count_diff for stat in after.compare_to(before, 'filename') if stat.count_diff > 0)
+    out(f"  allocations     {(current - base) / len(events):,.0f} B/order retained, {blocks / len(events):,.1f} blocks/order, "
+        f"peak +{(peak - base) / 1024:,.0f} KB over {len(events):,} orders")
+
+# update_price_match 단독 (최근 체결가 링 버퍼 + 캔들 3종 + 24시간 통계/시장 동향 순위 갱신)
+def bench_price_match(n, out):
+    exchange, codes, _ = build_state(1, 1)
+    state = exchange.state
+    code = codes[0]
+    times = [(BASE_TIME + datetime.timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S") for i in range(n)]
+    started = time.perf_counter()
+    for i, ts in enumerate(times):
+        update_price_match(state, code, START_PRICE + (i % 50) * TICK, 1, ts)
+    elapsed = time.perf_counter() - started
+    out(f"== update_price_match ==")
+    out(f"  {elapsed / n * 1e6:,.2f}us/call over {n:,} calls, market row {len(json.dumps(state._row('markets', code))) / 1024:,.1f} KB")
+
+def main():
+    parser = argparse.ArgumentParser(description="ELPIS 매칭 엔진 벤치마크 (오프라인)")
+    parser.add_argument('-s', '--scenario', choices=sorted(SCENARIOS), action='append', help="돌릴 시나리오 (여러 번 지정 가능, 기본: 전부)")
+    parser.add_argument('-n', '--orders', type=int, default=20000, help="시나리오당 주문 수")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--flush-every', type=int, default=50, help="이 주문 수마다 한 번씩 저장")
+    parser.add_argument('--out', help="결과를 이 파일에도 기록 (예: bench_output.txt)")
+    args = parser.parse_args()
+
+    lines = []
+    def out(line):
+        print(line, flush=True)
+        lines.append(line)
+
+    for name in args.scenario or SCENARIOS:
+        run_scenario(name, args.orders, args.seed, args.flush_every, out)
+    bench_price_match(min(args.orders, 20000), out)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+if __name__ == '__main__':
+    main()
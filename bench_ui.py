@@ -0,0 +1,189 @@
+import argparse
+import datetime
+import os
+import tempfile
+import time
+
+import streamlit as st
+from streamlit.testing.v1 import AppTest
+
+import database
+from state import ExchangeState, default_data
+from exchange import Exchange
+from storage import SqliteBackend
+
+# --- [UI 렌더링 벤치마크] ---
+# AppTest로 app.py를 실제로 다시 실행(rerun)하면서, 상호작용마다 걸린 시간과 화면 요소 수를 잽니다.
+# 규모(종목/관심 종목/토론방 메시지/체결 수)별로 임시 SQLite DB를 미리 채워 두고 그 위에서 앱을 띄우므로
+# 구글 시트나 네트워크 없이 돌아갑니다.
+#   python bench_ui.py                   -> 모든 규모
+#   python bench_ui.py -s small -r 5     -> 규모 하나, 단계마다 5번씩 재서 중앙값
+#   python bench_ui.py --out bench_output.txt
+APP_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app.py')
+USER = 'test'
+PASSWORD = '1234'
+TARGET = 'IU'           # 로그인 직후 선택되는 종목 (현재가/주문 탭)
+BASE_TIME = datetime.datetime(2026, 1, 1, 9, 0, 0)
+
+# 이름 -> (종목 수, 관심 종목 수, 현재 종목 토론방 메시지 수, 체결 수)
+SCALES = {
+    'small': (10, 5, 20, 100),
+    'medium': (100, 30, 150, 2000),
+    'large': (500, 100, 200, 20000),
+}
+
+# --- [규모별 DB 채우기] ---
+# 헤드리스 엔진으로 종목 상장, 관심 종목, 메시지, 체결을 만든 뒤 스냅샷 한 번으로 저장합니다.
+def seed_db(path, n_markets, n_watch, n_messages, n_trades):
+    exchange = Exchange(ExchangeState(default_data()))
+    state = exchange.state
+    for i in range(n_markets):
+        user_id = f"m{i:04d}"
+        exchange.register(user_id, 'bench', f"종목{i}")
+        exchange.list_ipo(user_id, 10000 + i * 10, 100)
+    codes = [code for code in state.market_data if code != USER]
+    exchange.update_profile(USER, likes=codes[:n_watch])
+    for i in range(n_messages):
+        exchange.post_message(f"pppp{i % 5 + 1}", TARGET, f"메시지 {i}", time="12:00")
+
+    # 체결: test와 봇이 번갈아 사고팔도록 양쪽 잔고/보유분을 넉넉히 채워 둡니다.
+    for user_id in (USER, 'pppp1'):
+        acct = state.account(user_id)
+        acct['balance_id'] = 10.0 ** 12
+        acct['portfolio'][TARGET] = {'qty': 10 ** 6, 'avg_price': 50000}
+    for i in range(n_trades):
+        seller, buyer = (USER, 'pppp1') if i % 2 else ('pppp1', USER)
+        ts = (BASE_TIME + datetime.timedelta(seconds=i)).strftime("%Y-%m-%d %H:%M:%S")
+        price = 50000 + (i % 20 - 10) * 100
+        exchange.submit(seller, 'SELL', TARGET, price, 1, time=ts)
+        exchange.submit(buyer, 'BUY', TARGET, price, 1, time=ts)
+
+    store = SqliteBackend(path, legacy_path=None)
+    state.mark_all_dirty()
+    with state.lock:
+        store.write(state.take_changes(snapshot=True))
+    store.conn.close()
+
+# --- [측정 도구] ---
+def count_elements(node):
+    children = getattr(node, 'children', None)
+    if not children:
+        return 1
+    return sum(count_elements(child) for child in children.values())
+
+def button(at, label):
+    return next(b for b in at.button if label in (b.label or ''))
+
+# 한 단계(상호작용 + rerun)를 repeat번 재서 (중앙값 시간, 요소 수)를 돌려줍니다.
+# 단계마다 AppTest 하나를 새로 띄워 같은 상태에서 시작합니다.
+def measure(prepare, action, repeat):
+    times = []
+    elements = 0
+    for _ in range(repeat):
+        at = AppTest.from_file(APP_PATH, default_timeout=120)
+        prepare(at)
+        action(at)
+        started = time.perf_counter()
+        at.run()
+        times.append(time.perf_counter() - started)
+        if at.exception:
+            raise RuntimeError(at.exception[0].value)
+        elements = count_elements(at._tree)
+    times.sort()
+    return times[len(times) // 2], elements
+
+# --- [흐름] ---
+# 각 흐름: (이름, 준비 단계, 잴 상호작용). 준비 단계는 시간에 넣지 않습니다.
+def no_prep(at):
+    pass
+
+def logged_out(at):
+    at.run()
+
+def logged_in(at):
+    at.run()
+    at.text_input(key='login_id').input(USER)
+    at.text_input(key='login_pw').input(PASSWORD)
+    button(at, 'ELPIS 시작하기').click()
+    at.run()
+
+# 탭은 선택된 것만 실행되므로, 탭 선택 상태(main_tab)를 바꿔서 원하는 화면으로 갑니다.
+def on_tab(name):
+    def prepare(at):
+        logged_in(at)
+        at.session_state['main_tab'] = name
+        at.run()
+    return prepare
+
+def open_tab(name):
+    def action(at):
+        at.session_state['main_tab'] = name
+    return action
+
+def do_nothing(at):
+    pass
+
+def click_login(at):
+    at.text_input(key='login_id').input(USER)
+    at.text_input(key='login_pw').input(PASSWORD)
+    button(at, 'ELPIS 시작하기').click()
+
+def submit_order(at):
+    at.number_input(key='buy_qty_main').set_value(1)
+    button(at, '매수 주문 전송').click()
+
+def next_trade_page(at):
+    page = [n for n in at.number_input if n.key == 'trade_page']
+    if page:
+        page[0].set_value(2)
+
+FLOWS = [
+    ('cold start (login screen)', no_prep, do_nothing),
+    ('login -> main view', logged_out, click_login),
+    ('idle rerun (main tab)', logged_in, do_nothing),
+    ('open current-price tab', logged_in, open_tab('현재가')),
+    ('submit buy order', on_tab('주문'), submit_order),
+    ('history: next page', on_tab('내역'), next_trade_page),
+]
+
+def run_scale(name, repeat, out):
+    n_markets, n_watch, n_messages, n_trades = SCALES[name]
+    fd, path = tempfile.mkstemp(suffix='.sqlite')
+    os.close(fd)
+    os.remove(path)
+    try:
+        seed_db(path, n_markets, n_watch, n_messages, n_trades)
+        os.environ['ELPIS_STORAGE'] = 'sqlite'
+        os.environ['ELPIS_SQLITE_PATH'] = path
+        st.cache_resource.clear()   # 앞 규모의 공유 상태/저장소를 버리고 새 DB에서 다시 로드
+        out(f"== {name}: markets={n_markets:,} watchlist={n_watch:,} messages={n_messages:,} trades={n_trades:,} ==")
+        out("  flow                          median    elements")
+        for label, prepare, action in FLOWS:
+            seconds, elements = measure(prepare, action, repeat)
+            out(f"  {label:<28}  {seconds * 1000:>7,.0f}ms  {elements:>8,}")
+        database.flush(30)
+    finally:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+def main():
+    parser = argparse.ArgumentParser(description="ELPIS UI 렌더링 벤치마크 (AppTest, 오프라인)")
+    parser.add_argument('-s', '--scale', choices=list(SCALES), action='append', help="돌릴 규모 (여러 번 지정 가능, 기본: 전부)")
+    parser.add_argument('-r', '--repeat', type=int, default=3, help="단계마다 잴 횟수 (중앙값을 보고)")
+    parser.add_argument('--out', help="결과를 이 파일에도 기록 (예: bench_output.txt)")
+    args = parser.parse_args()
+
+    lines = []
+    def out(line):
+        print(line, flush=True)
+        lines.append(line)
+
+    for name in args.scale or SCALES:
+        run_scale(name, args.repeat, out)
+    if args.out:
+        with open(args.out, 'w') as f:
+            f.write("\n".join(lines) + "\n")
+
+if __name__ == '__main__':
+    main()
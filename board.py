@@ -0,0 +1,37 @@
+import bisect
+from collections import deque
+
+BOARD_RETENTION = 200   # 종목마다 남겨 둘 최근 메시지 수
+
+# --- [종목별 토론방 저장소] ---
+# 메시지는 종목 코드별로 (순번, 메시지)를 시간순으로 담고, 보관 한도를 넘으면 가장 오래된 것부터 밀어냅니다.
+# 화면은 순번을 커서로 써서 '이 순번보다 오래된 메시지 n개'씩 최신순으로 가져갑니다.
+class BoardStore:
+    def __init__(self, retention=BOARD_RETENTION):
+        self.retention = retention
+        self.by_code = {}
+
+    # 밀려난 메시지의 순번을 돌려줍니다 (저장소에서도 지우도록)
+    def add(self, seq, message):
+        entries = self.by_code.get(message['code'])
+        if entries is None:
+            entries = self.by_code[message['code']] = deque()
+        entries.append((seq, message))
+        if len(entries) > self.retention:
+            return entries.popleft()[0]
+        return None
+
+    def count(self, code):
+        return len(self.by_code.get(code, ()))
+
+    def rows(self):
+        for entries in self.by_code.values():
+            yield from entries
+
+    # before 순번보다 오래된 메시지를 최신순으로 limit개, 다음 페이지 커서(없으면 None)와 함께 돌려줍니다.
+    def page(self, code, before=None, limit=20):
+        entries = self.by_code.get(code, ())
+        end = len(entries) if before is None else bisect.bisect_left(entries, before, key=lambda e: e[0])
+        start = max(end - limit, 0)
+        messages = [entries[i][1] for i in range(end - 1, start - 1, -1)]
+        return messages, (entries[start][0] if start > 0 else None)
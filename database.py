@@ -1,7 +1,17 @@
 import streamlit as st
-import json
+import os
+import time
+import atexit
+import contextlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import gspread
+import metrics
 from google.oauth2.service_account import Credentials
+from state import ExchangeState, default_data, data_from_rows
+from events import replay, record
+from exchange import Exchange
+from storage import SheetsBackend, SqliteBackend, WriteConflict, CORE_ENTITIES, HISTORY_ENTITIES
 
 # --- [구글 시트 DB 연결 설정] ---
 @st.cache_resource
@@ -16,37 +26,275 @@ def init_connection():
     client = gspread.authorize(creds)
     return client
 
+# --- [저장소 선택] ---
+# 기본은 구글 시트. ELPIS_STORAGE=sqlite 로 실행하면 로컬 SQLite 파일(ELPIS_SQLITE_PATH)을 씁니다.
+# 시트의 긴 값은 압축해서 저장합니다. ELPIS_SHEETS_COMPRESS=0 이면 JSON 그대로 씁니다 (읽기는 둘 다 됩니다).
+# 같은 저장소를 서버 여러 대가 함께 쓰면 ELPIS_MULTI_WORKER=1 로 실행합니다 (시트 저널 확인 + 주기적 따라잡기).
+MULTI_WORKER = os.environ.get("ELPIS_MULTI_WORKER", "0") == "1"
+SYNC_INTERVAL = float(os.environ.get("ELPIS_SYNC_INTERVAL", "3"))   # 다른 서버의 이벤트를 읽어 오는 간격(초)
+CONFLICT_RETRIES = 5
+
+@st.cache_resource
+def get_store():
+    if os.environ.get("ELPIS_STORAGE", "sheets") == "sqlite":
+        return SqliteBackend(os.environ.get("ELPIS_SQLITE_PATH", "elpis_db.sqlite"))
+    return SheetsBackend(lambda: init_connection().open("ELPIS_DB"), compress=os.environ.get("ELPIS_SHEETS_COMPRESS", "1") != "0",
+                         check_journal=MULTI_WORKER)
+
 # --- [데이터 로드] ---
+# 매칭과 로그인에 필요한 줄(계정/종목/주문/카운터)만 먼저 읽고, 마지막 스냅샷 뒤에 쌓인 저널 이벤트(journal_tail)를
+# 체결/토론방 기록(history, Future)과 동시에 받아 옵니다. 기록은 상태를 띄운 뒤에 붙입니다 (attach_history).
+# 예전 통짜 JSON 형식이 남아 있으면 그것을 읽고, 첫 저장 때 새 형식으로 옮겨집니다.
+# 저장소가 비어 있으면 None입니다. 읽다가 난 오류는 삼키지 않고 올립니다 (빈 저장소로 착각하고 기본 데이터로
+# 덮어쓰면 안 되므로). get_state의 cache_resource는 예외를 캐시하지 않아서 다음 호출이 다시 읽습니다.
+_loader = ThreadPoolExecutor(max_workers=2, thread_name_prefix="elpis-loader")
+
 def load_db():
+    with metrics.span('load_db'):
+        store = get_store()
+        rows = store.load(CORE_ENTITIES)
+        if rows:
+            data = data_from_rows(rows)
+            data['history'] = _loader.submit(store.load, HISTORY_ENTITIES)
+            data['journal_tail'] = store.load_journal(data.get('next_event_seq', 1))
+            return data
+        return store.load_legacy()
+
+def _attach_history(state, future):
     try:
-        client = init_connection()
-        sh = client.open("ELPIS_DB")
-        worksheet = sh.worksheet("JSON_DATA")
-        raw_data = worksheet.acell('A1').value
-        if raw_data:
-            return json.loads(raw_data)
-        return None
+        state.attach_history(future.result() or {})
+    except Exception as e:
+        state.history_error = e
+        print(f"DB History Load Error: {e}")
+
+# --- [공유 거래소 상태] ---
+# init_connection과 같은 cache_resource로 프로세스당 한 번만 로드하고, 모든 세션이 같은 객체를 씁니다.
+# 기본 데이터는 저장소가 정말 비어 있을 때(load_db가 None)만 넣습니다. 로드 오류는 호출한 쪽으로 올라갑니다.
+@st.cache_resource
+def get_state():
+    saved_data = load_db()
+    if saved_data and saved_data.get('sharded'):
+        state = ExchangeState(saved_data)
+        replay(state, saved_data['journal_tail'])
+        saved_data['history'].add_done_callback(lambda future: _attach_history(state, future))
+    else:
+        state = ExchangeState(saved_data if saved_data is not None else default_data())
+        state.mark_all_dirty()
+        try:
+            _upload(state, snapshot=True)
+        except Exception as e:
+            print(f"DB Init Error: {e}")
+    _register_gauges(state)
+    if MULTI_WORKER:
+        threading.Thread(target=_follow, args=(state,), name="elpis-db-follower", daemon=True).start()
+    return state
+
+# 게이지는 내보낼 때 읽으므로 상태를 들고만 있습니다
+def _register_gauges(state):
+    metrics.gauge('resting_orders', lambda: len(state.open_orders))
+    metrics.gauge('users', lambda: len(state.user_db))
+    metrics.gauge('markets', lambda: len(state.market_data))
+    metrics.gauge('trades', lambda: len(state.trades))
+    metrics.gauge('journal_seq', lambda: state.next_event_seq - 1)
+
+# 첫 세션의 로그인 화면을 그리는 동안 백그라운드에서 상태를 미리 띄워 둡니다. (로그인 버튼은 get_state()를 기다립니다)
+_preload_lock = threading.Lock()
+_preload = []
+
+def _preload_state():
+    try:
+        get_state()
     except Exception as e:
         print(f"DB Load Error: {e}")
-        return None
+
+def preload_state():
+    with _preload_lock:
+        if not _preload:
+            thread = threading.Thread(target=_preload_state, name="elpis-preload", daemon=True)
+            thread.start()
+            _preload.append(thread)
+
+# Streamlit 쪽에서 쓰는 엔진 (공유 상태 위에 얹은 얇은 객체라 같이 캐시합니다)
+@st.cache_resource
+def get_exchange():
+    return Exchange(get_state())
+
+# --- [업로드 / 충돌 처리] ---
+# 저널이 기준입니다. 상태는 '저장소 저널 순서대로 이벤트를 적용한 결과'이므로, 저장할 때마다 저장소 저널이
+# 이 서버가 아는 곳(persisted_seq)에서 끝나 있는지 확인하고 씁니다 (base_seq).
+# 다른 서버가 먼저 썼으면 저장소에서 다시 읽고(그 서버의 이벤트 포함), 아직 못 올린 우리 이벤트를 그 위에 다시 적용한 뒤
+# 새 순번으로 다시 씁니다. 체결/주문 번호도 이벤트 순서에서 나오므로 함께 다시 매겨집니다.
+# 다시 적용한 우리 이벤트는 결과가 처음과 달라질 수 있습니다 (체결 가격/수량이 바뀌거나 잔고 부족으로 거절 등).
+# 결과가 바뀐 이벤트는 state.revisions에 유저별로 남기고, 화면(ui.show_revisions)이 다음 실행 때 그 유저에게 알립니다.
+def _upload(state, snapshot=False, store=None):
+    store = store or get_store()
+    for attempt in range(CONFLICT_RETRIES):
+        # 충돌 뒤에는 (저장소가 지원하면) 다른 서버의 쓰기를 막아 둔 채 다시 읽고 씁니다
+        with store.exclusive() if attempt else contextlib.nullcontext():
+            if attempt:
+                _, revised = _resync(state, store)
+                state.add_revisions(revised)
+            with state.lock:
+                changes = state.take_changes(snapshot or state.snapshot_due())
+                base_seq = state.persisted_seq
+                next_seq = state.next_event_seq
+            if not changes:
+                return
+            try:
+                store.write(changes, base_seq)
+            except WriteConflict as e:
+                print(f"DB Conflict: {e}")
+                metrics.count('save_conflicts')
+                state.requeue(changes)
+                continue
+            except Exception:
+                state.requeue(changes)
+                raise
+        state.mark_persisted(next_seq)
+        return
+    raise WriteConflict("다른 서버와의 저장 충돌이 계속됩니다")
+
+# 돌려주는 값: (다시 적용한 이벤트 [(새 순번, 이벤트, 결과)], 결과가 바뀐 것 [{'user', 'event', 'before', 'after'}])
+# 주의: 다시 적용한 주문은 새 주문 번호를 받으므로, 같은 묶음 안에서 그 주문을 옛 번호로 취소한 이벤트는
+# '취소할 수 없는 주문'이 되고 바뀐 결과로 알려집니다.
+def _resync(state, store=None):
+    store = store or get_store()
+    store.reset()
+    rows = store.load()
+    data = data_from_rows(rows)
+    tail = store.load_journal(data.get('next_event_seq', 1))
+    reapplied = []
+    revised = []
+    with state.lock:
+        # 못 올린 우리 이벤트와 처음 적용했을 때의 결과 (fill은 order를 다시 적용하면 다시 생깁니다)
+        pending = sorted(state.appended['journal'].items())
+        before = dict(state.results)
+        state.results.clear()
+        state.reset(data)
+        replay(state, tail)
+        for seq, event in pending:
+            if event['kind'] == 'fill':
+                continue
+            new_seq = state.next_event_seq
+            after = record(state, event)
+            reapplied.append((new_seq, event, after))
+            if seq in before and before[seq] != after:
+                revised.append({'user': event.get('user'), 'event': event, 'before': before[seq], 'after': after})
+        state.snapshot_requested = True
+    metrics.count('resync_revisions', len(revised))
+    print(f"DB Resync: 다른 서버의 이벤트까지 {state.persisted_seq - 1}번 반영, 우리 이벤트 {len(reapplied)}개 다시 적용 "
+          f"(결과가 바뀐 것 {len(revised)}개)")
+    return reapplied, revised
+
+# 다른 서버가 올린 이벤트를 주기적으로 읽어 와 적용합니다. 못 올린 우리 이벤트가 있으면 저장기(충돌 처리)에 맡깁니다.
+def _catch_up(state):
+    with state.lock:
+        start = state.next_event_seq
+        if state.persisted_seq != start:
+            return
+    tail = get_store().load_journal(start)
+    if not tail:
+        return
+    with state.lock:
+        if state.next_event_seq == start and state.persisted_seq == start:
+            replay(state, tail)
+
+def _follow(state):
+    while True:
+        time.sleep(SYNC_INTERVAL)
+        try:
+            _catch_up(state)
+        except Exception as e:
+            print(f"DB Sync Error: {e}")
+
+# --- [쓰기 지연(write-behind) 저장기] ---
+# save_db()는 '변경됨' 표시만 하고 바로 돌아갑니다. 백그라운드 스레드가 몰려온 저장 요청을 모아
+# 한 번에 업로드하므로, 체결이 여러 건인 주문도 시트 쓰기는 한 번이면 됩니다.
+COALESCE_DELAY = 0.2       # 첫 요청 후 같은 주문의 나머지 요청을 모으는 시간(초)
+MAX_PENDING = 500          # 반영 안 된 요청이 이만큼 쌓이면 호출한 쪽이 업로드를 기다립니다
+BACKPRESSURE_TIMEOUT = 10  # 위 대기의 최대 시간(초)
+
+class WriteBehind:
+    def __init__(self, write, interval):
+        self.write = write
+        self.interval = interval  # 연속 업로드 사이 최소 간격(초) - 저장소 쓰기 한도 준수
+        self.cond = threading.Condition()
+        self.pending = 0          # 아직 업로드에 포함되지 않은 저장 요청 수
+        self.started = 0          # 시작된 업로드 수
+        self.done = 0             # 끝난 업로드 수
+        self.last_write = 0.0
+        self.last_error = None
+        self.failures = 0         # 연속 실패 횟수 (실패할수록 재시도 간격을 늘립니다)
+        self.thread = threading.Thread(target=self._run, name="elpis-db-writer", daemon=True)
+        self.thread.start()
+
+    def mark_dirty(self):
+        with self.cond:
+            self.pending += 1
+            self.cond.notify_all()
+            if self.pending >= MAX_PENDING:
+                target = self.started + 1
+                self.cond.wait_for(lambda: self.done >= target, BACKPRESSURE_TIMEOUT)
+
+    # 지금까지 표시된 변경이 모두 업로드될 때까지 기다립니다. (종료 시 호출)
+    def flush(self, timeout=None):
+        with self.cond:
+            target = self.started + 1 if self.pending else self.started
+            return self.cond.wait_for(lambda: self.done >= target, timeout)
+
+    def _run(self):
+        while True:
+            with self.cond:
+                self.cond.wait_for(lambda: self.pending > 0)
+                interval = max(self.interval, 1.0 if self.failures else 0.0) * (2 ** min(self.failures, 6))
+                ready_at = max(time.monotonic() + COALESCE_DELAY, self.last_write + interval)
+                while (delay := ready_at - time.monotonic()) > 0:
+                    self.cond.wait(delay)
+                self.pending = 0
+                self.started += 1
+            error = None
+            try:
+                with metrics.span('save'):
+                    self.write()
+            except Exception as e:
+                error = e
+                metrics.count('save_errors')
+                print(f"DB Save Error: {e}")
+            if metrics.ENABLED:
+                try:
+                    metrics.write_prometheus()
+                except OSError as e:
+                    print(f"Metrics Write Error: {e}")
+            with self.cond:
+                if error is not None:
+                    self.pending += 1   # 다음 주기에 다시 시도
+                    self.failures += 1
+                else:
+                    self.failures = 0
+                self.last_error = error
+                self.last_write = time.monotonic()
+                self.done += 1
+                self.cond.notify_all()
+
+@st.cache_resource
+def get_writer():
+    state = get_state()
+    writer = WriteBehind(lambda: _upload(state), get_store().write_interval)
+    atexit.register(flush, 30)
+    return writer
 
 # --- [데이터 저장] ---
 def save_db():
-    data = {
-        'user_db': st.session_state['user_db'],
-        'user_names': st.session_state['user_names'],
-        'market_data': st.session_state['market_data'],
-        'trade_history': st.session_state['trade_history'],
-        'board_messages': st.session_state['board_messages'],
-        'user_states': st.session_state.get('user_states', {}),
-        'pending_orders': st.session_state.get('pending_orders', []),
-        'interested_codes': list(st.session_state.get('interested_codes', []))
-    }
-    try:
-        client = init_connection()
-        sh = client.open("ELPIS_DB")
-        worksheet = sh.worksheet("JSON_DATA")
-        json_str = json.dumps(data, ensure_ascii=False)
-        worksheet.update_acell('A1', json_str)
-    except Exception as e:
-        st.error(f"데이터 저장 실패 (네트워크 문제일 수 있음): {e}")
+    writer = get_writer()
+    writer.mark_dirty()
+    if writer.last_error is not None:
+        st.error(f"데이터 저장 실패 (네트워크 문제일 수 있음): {writer.last_error}")
+
+# 남은 변경을 스냅샷까지 포함해 모두 기록하고 끝날 때까지 기다립니다. (종료 시 호출)
+def flush(timeout=None):
+    state = get_state()
+    with state.lock:
+        state.snapshot_requested = True
+    writer = get_writer()
+    writer.mark_dirty()
+    return writer.flush(timeout)
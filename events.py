@@ -0,0 +1,406 @@
+import datetime
+from orderbook import get_book
+from pricehistory import to_ts
+import metrics
+
+MINING_REWARD = 100000
+MINING_COOLDOWN = 86400
+
+# --- [이벤트 저널] ---
+# 거래소 상태를 바꾸는 모든 동작은 이벤트(dict) 하나로 표현되고, record()가 저널에 추가한 뒤 적용합니다.
+# 콜드 스타트 때는 마지막 스냅샷 이후의 이벤트만 replay()로 다시 적용해서 상태를 복원합니다.
+# 시각 등 바깥 값은 이벤트 안에 들어 있으므로, 같은 이벤트를 같은 순서로 적용하면 항상 같은 상태가 됩니다.
+#   order    {'user', 'side', 'code', 'price', 'qty', 'time'}
+#   orders   {'user', 'orders': [{'side', 'code', 'price', 'qty'}], 'time'}  (묶음 주문)
+#   fill     {'order_id', 'code', 'price', 'qty', 'buyer', 'seller'}  (order가 만든 체결 기록, 감사용)
+#   cancel   {'user', 'order_id'}
+#   ipo      {'user', 'price', 'qty'}
+#   mining   {'user', 'time'}
+#   message  {'user', 'code', 'msg', 'time'}
+#   register {'user', 'pw', 'name'}
+#   profile  {'user', 'vision'?, 'sns'?, 'likes'?}
+# 저장소에 아직 못 올린 이벤트의 결과는 state.results에 남겨 둡니다 (충돌 후 다시 적용했을 때 비교용).
+# 모양이 잘못된 이벤트는 check_event()에서 거절하고 저널에 넣지 않습니다. 그래도 처리 중에 예외가 나면 이 이벤트가
+# 남긴 저널 줄을 지우고 예외를 그대로 올립니다 (저널에 남으면 콜드 스타트 replay가 매번 같은 예외로 멈춥니다).
+def record(state, event):
+    with state.lock:
+        rejected = check_event(state, event)
+        if rejected is not None:
+            return rejected
+        seq = state.next_event_seq
+        state.journal(event)
+        try:
+            result = apply_event(state, event)
+        except Exception:
+            state.drop_journal(seq)
+            raise
+        if not state.replaying:
+            state.results[seq] = result
+        return result
+
+def apply_event(state, event):
+    return HANDLERS[event['kind']](state, event)
+
+# 예전에 검사 없이 저널에 들어간 잘못된 이벤트는 건너뜁니다 (그 이벤트를 올린 서버도 예외로 적용하지 못했습니다).
+def replay(state, events):
+    with state.lock:
+        state.replaying = True
+        try:
+            for seq, event in events:
+                if check_event(state, event) is None:
+                    apply_event(state, event)
+                else:
+                    print(f"Replay: 잘못된 이벤트 {seq}번을 건너뜁니다 ({event.get('kind')})")
+                state.next_event_seq = seq + 1
+                state.persisted_seq = seq + 1
+        finally:
+            state.replaying = False
+
+# --- [이벤트 검사] ---
+# 처리 함수가 예외 없이 다룰 수 있는 이벤트인지 (종류, 시각 형식, 필드 타입) 봅니다. 잔고/보유 수량처럼 상태에 따라
+# 달라지는 거절은 처리 함수가 하고, 그런 이벤트는 replay해도 같은 결과로 거절되므로 저널에 남아도 됩니다.
+# 통과하면 None, 아니면 그 종류의 거절 결과를 돌려줍니다.
+def _is_time(value, fmt):
+    try:
+        datetime.datetime.strptime(value, fmt)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+def _is_positive(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and value > 0
+
+def _check_order_event(state, event):
+    return _is_time(event.get('time'), ORDER_TIME)
+
+def _check_orders_event(state, event):
+    orders = event.get('orders')
+    return (_is_time(event.get('time'), ORDER_TIME) and isinstance(orders, list)
+            and all(isinstance(o, dict) and {'side', 'code', 'price', 'qty'} <= o.keys() for o in orders))
+
+def _check_profile_event(state, event):
+    return (all(isinstance(event[f], str) for f in ('vision', 'sns') if f in event)
+            and ('likes' not in event or isinstance(event['likes'], (list, tuple))))
+
+ORDER_TIME = "%Y-%m-%d %H:%M:%S"
+MINING_TIME = "%Y-%m-%d %H:%M:%S.%f"
+CHECKS = {
+    'order': _check_order_event,
+    'orders': _check_orders_event,
+    'fill': lambda state, event: True,
+    'cancel': lambda state, event: 'order_id' in event,
+    'ipo': lambda state, event: _is_positive(event.get('price')) and _is_positive(event.get('qty')),
+    'mining': lambda state, event: _is_time(event.get('time'), MINING_TIME),
+    'message': lambda state, event: all(isinstance(event.get(f), str) for f in ('code', 'msg', 'time')),
+    'register': lambda state, event: all(isinstance(event.get(f), str) for f in ('user', 'pw', 'name')),
+    'profile': _check_profile_event,
+}
+
+def check_event(state, event):
+    check = CHECKS.get(event.get('kind'))
+    if check is not None and check(state, event):
+        return None
+    if event.get('kind') == 'orders':
+        return [(False, "잘못된 주문입니다.")] * len(event.get('orders') or ())
+    if event.get('kind') == 'mining':
+        return False, 0
+    return False, "잘못된 요청입니다."
+
+# --- [가격 업데이트] ---
+# 체결 시각 기준으로 최근 체결가/캔들을 갱신하고, 등락률은 직전 일봉 종가 대비로 계산합니다.
+# 최근 24시간 통계와 시장 동향 순위도 여기서 함께 갱신합니다.
+def update_price_match(state, market_code, price, qty, time):
+    with metrics.span('update_price_match'):
+        market = state.market_data[market_code]
+        history = state.history(market_code)
+        ts = to_ts(time)
+        history.record(price, qty, ts)
+        market['price'] = price
+        market['change'] = history.change_pct(price, ts)
+        state.refresh_stats(market_code, ts)
+        state.touch('markets', market_code)
+
+# --- [주문 처리 핵심 로직] ---
+# 주문 하나의 방향/종목/가격/수량 검사 (단건 주문과 묶음 주문이 같이 씁니다). 통과하면 None.
+def _check_order(state, order):
+    if order['side'] not in ('BUY', 'SELL') or order['code'] not in state.market_data:
+        return False, "잘못된 주문입니다."
+    if not (_is_positive(order['price']) and _is_positive(order['qty'])):
+        return False, "가격과 수량은 0보다 커야 합니다."
+    return None
+
+def _order(state, event):
+    rejected = _check_order(state, event)
+    if rejected is not None:
+        return rejected
+    user_id = event['user']
+    type = event['side']
+    code = event['code']
+    price = event['price']
+    qty = event['qty']
+    market = state.market_data[code]
+    acct = state.account(user_id)
+    
+    if type == 'BUY':
+        total_cost = price * qty
+        if acct['balance_id'] < total_cost:
+            return False, "이드(잔고)가 부족합니다."
+            
+        acct['balance_id'] -= total_cost
+        
+        book = get_book(state.order_books, code)
+        remaining_qty = qty
+        
+        for sell_order, match_qty in book.match('BUY', price, qty, user_id):
+            match_price = sell_order['price'] 
+            seller_id = sell_order['user']
+            
+            if code in acct['portfolio']:
+                old_qty = acct['portfolio'][code]['qty']
+                old_avg = acct['portfolio'][code]['avg_price']
+                new_avg = ((old_qty * old_avg) + (match_qty * match_price)) / (old_qty + match_qty)
+                acct['portfolio'][code]['qty'] += match_qty
+                acct['portfolio'][code]['avg_price'] = int(new_avg)
+            else:
+                acct['portfolio'][code] = {'qty': match_qty, 'avg_price': match_price}
+            
+            refund = (price - match_price) * match_qty
+            if refund > 0: acct['balance_id'] += refund
+            
+            if seller_id in state.user_states:
+                state.user_states[seller_id]['balance_id'] += (match_price * match_qty)
+                state.touch('users', seller_id, code)
+            state.touch_order(sell_order)
+            
+            remaining_qty -= match_qty
+            
+            update_price_match(state, code, match_price, match_qty, event['time'])
+            
+            trade_record = {
+                'time': event['time'], 
+                'type': '체결(매수)', 
+                'code': code,
+                'name': market['name'], 
+                'price': match_price, 
+                'qty': match_qty,
+                'buyer': user_id,      
+                'seller': seller_id    
+            }
+            state.add_trade(trade_record)
+            state.journal({'kind': 'fill', 'order_id': sell_order['id'], 'code': code, 'price': match_price, 'qty': match_qty, 'buyer': user_id, 'seller': seller_id})
+
+        if remaining_qty > 0:
+            state.add_order({'code': code, 'type': 'BUY', 'price': price, 'qty': remaining_qty, 'user': user_id})
+            state.touch('users', user_id, code)
+            return True, f"{qty-remaining_qty}주 체결, {remaining_qty}주 대기 중"
+        else:
+            state.touch('users', user_id, code)
+            return True, "전량 체결 완료!"
+
+    elif type == 'SELL':
+        # [CRITICAL FIX] 본인 종목일 경우 Locked 물량과 Portfolio 물량을 합산하여 검증 및 차감
+        pf_qty = acct['portfolio'].get(code, {}).get('qty', 0)
+        locked_qty = 0
+        if code == user_id:
+            locked_qty = acct['my_elpis_locked']
+            
+        total_avail = pf_qty + locked_qty
+        
+        if total_avail < qty:
+            return False, "보유 수량이 부족합니다."
+            
+        # 수량 차감 로직: Portfolio에서 먼저 빼고, 부족하면 Locked에서 뺌
+        remaining_deduct = qty
+        
+        if pf_qty > 0:
+            deduct_p = min(pf_qty, remaining_deduct)
+            acct['portfolio'][code]['qty'] -= deduct_p
+            if acct['portfolio'][code]['qty'] == 0:
+                del acct['portfolio'][code]
+            remaining_deduct -= deduct_p
+            
+        if remaining_deduct > 0 and code == user_id:
+            acct['my_elpis_locked'] -= remaining_deduct
+
+        # 이하 매칭 로직은 기존과 동일
+        book = get_book(state.order_books, code)
+        remaining_qty = qty
+        
+        for buy_order, match_qty in book.match('SELL', price, qty, user_id):
+            match_price = buy_order['price'] 
+            buyer_id = buy_order['user']
+            
+            acct['balance_id'] += (match_price * match_qty)
+            
+            if buyer_id in state.user_states:
+                b_state = state.user_states[buyer_id]
+                if 'portfolio' not in b_state: b_state['portfolio'] = {}
+                
+                if code in b_state['portfolio']:
+                    b_old_qty = b_state['portfolio'][code]['qty']
+                    b_old_avg = b_state['portfolio'][code]['avg_price']
+                    b_new_avg = ((b_old_qty * b_old_avg) + (match_qty * match_price)) / (b_old_qty + match_qty)
+                    b_state['portfolio'][code]['qty'] += match_qty
+                    b_state['portfolio'][code]['avg_price'] = int(b_new_avg)
+                else:
+                    b_state['portfolio'][code] = {'qty': match_qty, 'avg_price': match_price}
+                state.touch('users', buyer_id, code)
+            state.touch_order(buy_order)
+            
+            remaining_qty -= match_qty
+            
+            update_price_match(state, code, match_price, match_qty, event['time'])
+            
+            trade_record = {
+                'time': event['time'], 
+                'type': '체결(매도)', 
+                'code': code,
+                'name': market['name'], 
+                'price': match_price, 
+                'qty': match_qty,
+                'buyer': buyer_id,    
+                'seller': user_id     
+            }
+            state.add_trade(trade_record)
+            state.journal({'kind': 'fill', 'order_id': buy_order['id'], 'code': code, 'price': match_price, 'qty': match_qty, 'buyer': buyer_id, 'seller': user_id})
+            
+        if remaining_qty > 0:
+            state.add_order({'code': code, 'type': 'SELL', 'price': price, 'qty': remaining_qty, 'user': user_id})
+            state.touch('users', user_id, code)
+            return True, f"{qty-remaining_qty}주 체결, {remaining_qty}주 대기 중"
+        else:
+            state.touch('users', user_id, code)
+            return True, "전량 체결 완료!"
+
+# --- [묶음 주문] ---
+# 묶음 전체를 먼저 검사해서, 매수 대금 합계와 종목별 매도 수량 합계가 잔고/보유분 안에 드는 주문만 받습니다.
+# (앞 주문의 체결 대금이나 매수 물량은 아직 확정이 아니므로 검사에 넣지 않습니다)
+# 받은 주문은 lock을 한 번 잡은 채 순서대로 체결하고, 결과는 주문마다 (성공 여부, 메시지)로 돌려줍니다.
+def _orders(state, event):
+    user_id = event['user']
+    acct = state.account(user_id)
+    budget = acct['balance_id']
+    holdings = {}
+    checked = []
+    for order in event['orders']:
+        side, code, price, qty = order['side'], order['code'], order['price'], order['qty']
+        rejected = _check_order(state, order)
+        if rejected is not None:
+            checked.append(rejected)
+        elif side == 'BUY':
+            if budget < price * qty:
+                checked.append((False, "이드(잔고)가 부족합니다."))
+            else:
+                budget -= price * qty
+                checked.append(None)
+        else:
+            if code not in holdings:
+                holdings[code] = acct['portfolio'].get(code, {}).get('qty', 0) + (acct['my_elpis_locked'] if code == user_id else 0)
+            if holdings[code] < qty:
+                checked.append((False, "보유 수량이 부족합니다."))
+            else:
+                holdings[code] -= qty
+                checked.append(None)
+
+    results = []
+    for order, result in zip(event['orders'], checked):
+        if result is None:
+            result = _order(state, {'user': user_id, **order, 'time': event['time']})
+        results.append(result)
+    return results
+
+# 체결 기록은 order 이벤트를 다시 적용할 때 함께 만들어지므로 replay에서는 건너뜁니다.
+def _fill(state, event):
+    return None
+
+# --- [주문 취소] ---
+def _cancel(state, event):
+    user_id = event['user']
+    order = state.open_orders.get(event['order_id'])
+    if order is None or order['user'] != user_id:
+        return False, "취소할 수 없는 주문입니다."
+    get_book(state.order_books, order['code']).remove(order)
+    acct = state.account(user_id)
+    code = order['code']
+    if order['type'] == 'BUY':
+        acct['balance_id'] += order['price'] * order['qty']
+    elif code == user_id:
+        acct['my_elpis_locked'] += order['qty']
+    elif code in acct['portfolio']:
+        acct['portfolio'][code]['qty'] += order['qty']
+    else:
+        acct['portfolio'][code] = {'qty': order['qty'], 'avg_price': order['price']}
+    order['qty'] = 0
+    state.touch_order(order)
+    state.touch('users', user_id, code)
+    return True, "주문이 취소되었습니다."
+
+# --- [내 엘피스 상장 (IPO)] ---
+def _ipo(state, event):
+    user_id = event['user']
+    ipo_price = event['price']
+    ipo_qty = event['qty']
+    acct = state.account(user_id)
+    if acct['my_elpis_locked'] < ipo_qty:
+        return False, "보유 수량이 부족합니다."
+    acct['my_elpis_locked'] -= ipo_qty
+    if user_id in state.market_data:
+        state.market_data[user_id]['price'] = ipo_price
+        state.touch('markets', user_id)
+    else:
+        state.list_market(user_id, {'name': user_id, 'price': ipo_price, 'change': 0.0, 'desc': '신규 상장'})
+    state.add_order({'code': user_id, 'type': 'SELL', 'price': ipo_price, 'qty': ipo_qty, 'user': user_id})
+    state.touch('users', user_id, user_id)
+    return True, "상장 주문 등록 완료! (매수자가 나타나면 체결됩니다)"
+
+# --- [채굴] ---
+def _mining(state, event):
+    acct = state.account(event['user'])
+    now = datetime.datetime.strptime(event['time'], MINING_TIME)
+    last = acct.get('last_mining_time')
+    if last and isinstance(last, str):
+        last_dt = datetime.datetime.strptime(last, MINING_TIME)
+    else:
+        last_dt = None
+    if last_dt is not None and (now - last_dt).total_seconds() <= MINING_COOLDOWN:
+        return False, 0
+    acct['balance_id'] += MINING_REWARD
+    acct['last_mining_time'] = event['time']
+    state.touch('users', event['user'])
+    return True, MINING_REWARD
+
+# --- [토론방 메시지] ---
+def _message(state, event):
+    state.add_message({'code': event['code'], 'user': event['user'], 'msg': event['msg'], 'time': event['time']})
+    return True, ""
+
+# --- [회원가입 / 프로필] ---
+def _register(state, event):
+    user_id = event['user']
+    if user_id in state.user_db:
+        return False, "이미 사용 중인 아이디입니다."
+    state.user_db[user_id] = event['pw']
+    state.user_names[user_id] = event['name']
+    state.account(user_id)
+    state.touch('users', user_id)
+    return True, "환영합니다! 가입이 완료되었습니다."
+
+def _profile(state, event):
+    profile = state.account(event['user'])['my_profile']
+    for field in ('vision', 'sns', 'likes'):
+        if field in event:
+            profile[field] = list(event[field]) if field == 'likes' else event[field]
+    state.touch('users', event['user'])
+    return True, ""
+
+HANDLERS = {
+    'order': _order,
+    'orders': _orders,
+    'fill': _fill,
+    'cancel': _cancel,
+    'ipo': _ipo,
+    'mining': _mining,
+    'message': _message,
+    'register': _register,
+    'profile': _profile,
+}
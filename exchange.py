@@ -0,0 +1,155 @@
+import datetime
+from collections import namedtuple
+
+from state import ExchangeState, default_data
+from events import record
+import metrics
+
+# --- [조회 결과] ---
+Quote = namedtuple('Quote', 'code name price change bids asks version')        # bids/asks: ((가격, 잔량, 주문 수), ...)
+Holding = namedtuple('Holding', 'code name qty avg_price price value profit')
+
+# --- [계정 / 종목 뷰] ---
+# 저장 형식은 기존 dict 그대로 두고, 엔진 밖에서는 이 뷰로 필요한 값만 읽습니다.
+class Account:
+    def __init__(self, user_id, name, data):
+        self.user_id = user_id
+        self.name = name
+        self.data = data
+
+    @property
+    def balance(self):
+        return self.data['balance_id']
+
+    @property
+    def locked(self):
+        return self.data['my_elpis_locked']
+
+    @property
+    def holdings(self):
+        return self.data['portfolio']
+
+    @property
+    def profile(self):
+        return self.data['my_profile']
+
+    def available(self, code):
+        return self.holdings.get(code, {}).get('qty', 0) + (self.locked if code == self.user_id else 0)
+
+
+class Market:
+    def __init__(self, code, data, history):
+        self.code = code
+        self.data = data
+        self.history = history
+
+    @property
+    def name(self):
+        return self.data['name']
+
+    @property
+    def price(self):
+        return self.data['price']
+
+    @property
+    def change(self):
+        return self.data['change']
+
+    @property
+    def desc(self):
+        return self.data.get('desc', '')
+
+
+# --- [헤드리스 거래소 엔진] ---
+# Streamlit 없이 주문/취소/시세/잔고를 다룹니다. 상태 변경은 모두 events.record()를 거쳐 저널에 남고,
+# 저장은 호출한 쪽(Streamlit 어댑터는 save_db, 벤치마크는 직접 write)이 정합니다.
+# time을 넘기지 않으면 현재 시각을 씁니다. 봇/벤치마크는 가상 시각을 넘겨서 결과를 재현할 수 있습니다.
+class Exchange:
+    def __init__(self, state=None):
+        self.state = state if state is not None else ExchangeState(default_data())
+
+    def _now(self, fmt, time=None):
+        return time if time is not None else datetime.datetime.now().strftime(fmt)
+
+    # --- 주문 ---
+    def submit(self, user_id, side, code, price, qty, time=None):
+        with metrics.span('order.match', kind='order'):
+            return record(self.state, {'kind': 'order', 'user': user_id, 'side': side, 'code': code, 'price': price, 'qty': qty,
+                                       'time': self._now("%Y-%m-%d %H:%M:%S", time)})
+
+    # orders: [{'type', 'code', 'price', 'qty'}] -> 주문마다 (성공 여부, 메시지)
+    def submit_many(self, user_id, orders, time=None):
+        with metrics.span('order.match', kind='orders'):
+            return record(self.state, {'kind': 'orders', 'user': user_id,
+                                       'orders': [{'side': o['type'], 'code': o['code'], 'price': o['price'], 'qty': o['qty']} for o in orders],
+                                       'time': self._now("%Y-%m-%d %H:%M:%S", time)})
+
+    def cancel(self, user_id, order_id):
+        return record(self.state, {'kind': 'cancel', 'user': user_id, 'order_id': order_id})
+
+    # --- 상장 / 채굴 / 토론방 / 회원 ---
+    def list_ipo(self, user_id, price, qty):
+        return record(self.state, {'kind': 'ipo', 'user': user_id, 'price': price, 'qty': qty})
+
+    def mine(self, user_id, time=None):
+        return record(self.state, {'kind': 'mining', 'user': user_id, 'time': self._now("%Y-%m-%d %H:%M:%S.%f", time)})
+
+    def post_message(self, user_id, code, msg, time=None):
+        return record(self.state, {'kind': 'message', 'user': user_id, 'code': code, 'msg': msg, 'time': self._now("%H:%M", time)})
+
+    def register(self, user_id, pw, name):
+        return record(self.state, {'kind': 'register', 'user': user_id, 'pw': pw, 'name': name})
+
+    def update_profile(self, user_id, **fields):
+        return record(self.state, {'kind': 'profile', 'user': user_id, **fields})
+
+    # --- 조회 ---
+    # 조회는 계정을 만들지 않습니다 (없는 유저면 None). 계정은 가입/주문 같은 이벤트를 처리할 때 만들어집니다.
+    def account(self, user_id):
+        data = self.state.user_states.get(user_id)
+        if data is None:
+            return None
+        return Account(user_id, self.state.user_names.get(user_id, user_id), data)
+
+    def market(self, code):
+        data = self.state.market_data.get(code)
+        if data is None:
+            return None
+        return Market(code, data, self.state.history(code))
+
+    def search(self, query, k=10):
+        return self.state.search_markets(query, k)
+
+    def quote(self, code, levels=5):
+        with self.state.lock:
+            market = self.state.market_data[code]
+            depth = self.state.depth(code, levels)
+            return Quote(code, market['name'], market['price'], market['change'], depth['bids'], depth['asks'], depth['version'])
+
+    def open_orders(self, user_id):
+        return self.state.orders_of(user_id)
+
+    def valuation(self, user_id):
+        return self.state.valuation(user_id)
+
+    def holders(self, code):
+        return self.state.holders(code)
+
+    def leaderboard(self, k=20):
+        return self.state.leaderboard(k)
+
+    def movers(self, k=5):
+        return self.state.market_movers(k)
+
+    def portfolio(self, user_id):
+        with self.state.lock:
+            acct = self.state.user_states.get(user_id)
+            if acct is None:
+                return None
+            holdings = []
+            for code, pos in acct['portfolio'].items():
+                market = self.state.market_data.get(code)
+                price = market['price'] if market else pos['avg_price']
+                holdings.append(Holding(code, market['name'] if market else code, pos['qty'], pos['avg_price'],
+                                        price, price * pos['qty'], (price - pos['avg_price']) * pos['qty']))
+            return holdings
@@ -0,0 +1,126 @@
+import contextlib
+import os
+import threading
+import time
+
+# --- [운영 지표: 구간 시간 / 카운터] ---
+# ELPIS_METRICS=1 일 때만 잽니다. 꺼져 있으면 span()은 미리 만들어 둔 빈 컨텍스트를, count()는 바로 돌아가므로
+# 핫 패스(주문 체결, 가격 갱신)에 넣어 둬도 함수 호출 한 번 정도만 듭니다.
+#   with span('order.match'): ...            -> 횟수 / 합계 / 최댓값
+#   count('fills'), count('sheets_api_calls', method='values_get')
+#   gauge('resting_orders', lambda: ...)     -> 값은 내보낼 때 읽습니다
+# 내보내기는 Prometheus 텍스트 형식 (prometheus_text / write_prometheus)입니다.
+ENABLED = os.environ.get("ELPIS_METRICS", "0") == "1"
+PROM_PATH = os.environ.get("ELPIS_METRICS_PATH", "elpis_metrics.prom")
+PREFIX = 'elpis_'
+
+_lock = threading.Lock()
+_spans = {}         # (이름, 라벨) -> [횟수, 합계(초), 최댓값(초)]
+_counters = {}      # (이름, 라벨) -> 값
+_gauges = {}        # 이름 -> 값을 돌려주는 함수
+_NOOP = contextlib.nullcontext()
+
+def _key(name, labels):
+    return name, tuple(sorted(labels.items()))
+
+class _Span:
+    __slots__ = ('key', 'started')
+
+    def __init__(self, key):
+        self.key = key
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.perf_counter() - self.started
+        with _lock:
+            stat = _spans.get(self.key)
+            if stat is None:
+                _spans[self.key] = [1, elapsed, elapsed]
+            else:
+                stat[0] += 1
+                stat[1] += elapsed
+                if elapsed > stat[2]:
+                    stat[2] = elapsed
+        return False
+
+def span(name, **labels):
+    if not ENABLED:
+        return _NOOP
+    return _Span(_key(name, labels))
+
+def count(name, n=1, **labels):
+    if not ENABLED:
+        return
+    key = _key(name, labels)
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + n
+
+def gauge(name, read):
+    _gauges[name] = read
+
+def reset():
+    with _lock:
+        _spans.clear()
+        _counters.clear()
+
+# 화면용: ([(이름, 라벨, 횟수, 합계, 최댓값)], [(이름, 라벨, 값)], [(이름, 값)])
+def snapshot():
+    with _lock:
+        spans = [(name, dict(labels), *stat) for (name, labels), stat in sorted(_spans.items())]
+        counters = [(name, dict(labels), value) for (name, labels), value in sorted(_counters.items())]
+    gauges = []
+    for name, read in sorted(_gauges.items()):
+        try:
+            gauges.append((name, read()))
+        except Exception:
+            continue
+    return spans, counters, gauges
+
+# --- [Prometheus 텍스트 형식] ---
+def _metric_name(name):
+    return PREFIX + ''.join(ch if ch.isalnum() else '_' for ch in name)
+
+def _labels(labels):
+    if not labels:
+        return ''
+    parts = []
+    for k, v in sorted(labels.items()):
+        v = str(v).replace('\\', '\\\\').replace('"', '\\"')
+        parts.append(f'{k}="{v}"')
+    return '{' + ','.join(parts) + '}'
+
+def prometheus_text():
+    spans, counters, gauges = snapshot()
+    lines = []
+    if spans:
+        lines.append(f"# TYPE {PREFIX}span_seconds summary")
+        for name, labels, n, total, _ in spans:
+            lbl = _labels({'span': name, **labels})
+            lines.append(f"{PREFIX}span_seconds_count{lbl} {n}")
+            lines.append(f"{PREFIX}span_seconds_sum{lbl} {total:.6f}")
+        lines.append(f"# TYPE {PREFIX}span_seconds_max gauge")
+        for name, labels, _, _, longest in spans:
+            lines.append(f"{PREFIX}span_seconds_max{_labels({'span': name, **labels})} {longest:.6f}")
+    seen = set()
+    for name, labels, value in counters:
+        metric = _metric_name(name) + '_total'
+        if metric not in seen:
+            lines.append(f"# TYPE {metric} counter")
+            seen.add(metric)
+        lines.append(f"{metric}{_labels(labels)} {value}")
+    for name, value in gauges:
+        lines.append(f"# TYPE {_metric_name(name)} gauge")
+        lines.append(f"{_metric_name(name)} {value}")
+    return "\n".join(lines) + "\n"
+
+# 임시 파일에 쓴 뒤 바꿔 끼워서, 읽는 쪽(node_exporter textfile 등)이 반쯤 쓴 파일을 보지 않게 합니다.
+def write_prometheus(path=None):
+    path = path or PROM_PATH
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w') as f:
+        f.write(prometheus_text())
+    os.replace(tmp, path)
+    return path
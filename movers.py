@@ -0,0 +1,57 @@
+import bisect
+import heapq
+
+# --- [시장 동향 순위 (상승/하락/거래량)] ---
+# 종목마다 최근 24시간 통계(PriceHistory.window_stats)를 들고, 등락률/거래량 순으로 정렬된 (값, 종목) 목록을
+# 체결 때마다 그 종목 한 줄만 빼고 다시 끼웁니다. 화면은 목록 양 끝에서 k개만 읽으므로 종목 수와 상관없습니다.
+# 24시간 동안 체결이 없는 종목은 순위에서 빠집니다. 체결이 끊긴 종목도 오래된 구간이 빠지는 시각(expires)을
+# 힙에 넣어 두고, 시계(지금까지 본 가장 늦은 체결 시각)가 그 시각을 넘으면 다시 계산합니다.
+# 시계를 이벤트 시각으로 움직이므로 replay해도 같은 순위가 됩니다.
+class Movers:
+    def __init__(self):
+        self.stats = {}
+        self.by_change = []     # (24시간 등락률, 종목) 오름차순
+        self.by_volume = []     # (24시간 거래량, 종목) 오름차순
+        self.expiry = []        # (통계가 바뀌는 시각, 종목) 힙
+        self.clock = 0
+        self.version = 0
+
+    def _drop(self, code):
+        old = self.stats.pop(code, None)
+        if old is None or not old['count']:
+            return
+        for entries, entry in ((self.by_change, (old['change'], code)), (self.by_volume, (old['volume'], code))):
+            i = bisect.bisect_left(entries, entry)
+            if i < len(entries) and entries[i] == entry:
+                del entries[i]
+
+    def update(self, code, stats):
+        old = self.stats.get(code)
+        self._drop(code)
+        self.stats[code] = stats
+        if stats['count']:
+            bisect.insort(self.by_change, (stats['change'], code))
+            bisect.insort(self.by_volume, (stats['volume'], code))
+        # 가장 오래된 구간이 그대로면 이미 힙에 있습니다 (체결마다 쌓이지 않게)
+        if stats['expires'] is not None and (old is None or old['expires'] != stats['expires']):
+            heapq.heappush(self.expiry, (stats['expires'], code))
+        self.version += 1
+
+    # 시계를 ts까지 당기고, 그 사이 통계가 바뀌어야 하는 종목 코드를 돌려줍니다
+    def advance(self, ts):
+        if ts > self.clock:
+            self.clock = ts
+        due = set()
+        while self.expiry and self.expiry[0][0] <= self.clock:
+            due.add(heapq.heappop(self.expiry)[1])
+        return due
+
+    # [(종목, 통계)]
+    def gainers(self, k=5):
+        return [(code, self.stats[code]) for change, code in reversed(self.by_change[-k:]) if change > 0]
+
+    def losers(self, k=5):
+        return [(code, self.stats[code]) for change, code in self.by_change[:k] if change < 0]
+
+    def volume_leaders(self, k=5):
+        return [(code, self.stats[code]) for _, code in reversed(self.by_volume[-k:])]
@@ -0,0 +1,176 @@
+import heapq
+from collections import deque
+from itertools import islice
+
+# --- [종목별 호가창 (가격-시간 우선순위)] ---
+# 가격 레벨은 힙으로(매수는 가격에 -를 붙여 최고가가 위로), 같은 가격의 주문은 들어온 순서(FIFO)대로 deque에 보관합니다.
+# 주문 자체는 기존과 같은 dict({'code', 'type', 'price', 'qty', 'user'})라서 JSON 저장 형식이 그대로 유지됩니다.
+# 가격 레벨별 잔량 합계/주문 수(totals)는 주문이 들어오고, 체결되고, 취소될 때마다 그 자리에서 고칩니다.
+# 취소는 주문 번호 -> 주문(live)에서만 빼고 deque에는 남겨 두었다가, 체결하다 만나거나 레벨이 비면 버립니다.
+# 빈 레벨의 가격도 힙에서 바로 빼지 않고, 최우선 자리에 오거나 힙의 절반 넘게 쌓이면 정리합니다.
+# version은 호가창이 바뀔 때마다 올라가서, 바뀌지 않은 호가창은 depth()가 만들어 둔 결과를 그대로 돌려줍니다.
+class OrderBook:
+    def __init__(self, code):
+        self.code = code
+        self.levels = {'BUY': {}, 'SELL': {}}   # 가격 -> deque[주문]
+        self.heaps = {'BUY': [], 'SELL': []}    # 정렬 키(매수 -가격, 매도 가격) 힙 (빈 레벨이 남아 있을 수 있음)
+        self.heaped = {'BUY': set(), 'SELL': set()}     # 힙에 들어 있는 가격
+        self.totals = {'BUY': {}, 'SELL': {}}   # 가격 -> [잔량 합계, 주문 수]
+        self.live = {}                          # 주문 번호 -> 호가창에 걸려 있는 주문
+        self.version = 0
+        self.depth_cache = {}                   # 레벨 수 -> 마지막으로 만든 depth 스냅샷
+
+    def add(self, order):
+        side = order['type']
+        price = order['price']
+        level = self.levels[side].get(price)
+        if level is None:
+            level = self.levels[side][price] = deque()
+            self.totals[side][price] = [0, 0]
+            if price not in self.heaped[side]:
+                heapq.heappush(self.heaps[side], -price if side == 'BUY' else price)
+                self.heaped[side].add(price)
+        level.append(order)
+        self.live[order['id']] = order
+        total = self.totals[side][price]
+        total[0] += order['qty']
+        total[1] += 1
+        self.version += 1
+
+    def best_bid(self):
+        heap = self.heaps['BUY']
+        return -heap[0] if heap else None
+
+    def best_ask(self):
+        heap = self.heaps['SELL']
+        return heap[0] if heap else None
+
+    # 최우선 가격부터 차례로 (힙을 트리로 따라 내려가므로 k번째까지 O(k log k)). 걷는 동안 힙을 바꾸면 안 됩니다.
+    def _walk(self, side):
+        heap = self.heaps[side]
+        levels = self.levels[side]
+        frontier = [(heap[0], 0)] if heap else []
+        while frontier:
+            key, i = heapq.heappop(frontier)
+            for child in (2 * i + 1, 2 * i + 2):
+                if child < len(heap):
+                    heapq.heappush(frontier, (heap[child], child))
+            price = -key if side == 'BUY' else key
+            if price in levels:
+                yield price
+
+    def _drop_level(self, side, price):
+        del self.levels[side][price]
+        del self.totals[side][price]
+
+    # 최우선 자리의 빈 레벨을 빼고, 빈 레벨이 절반을 넘으면 힙을 다시 만듭니다
+    def _prune(self, side):
+        heap = self.heaps[side]
+        levels = self.levels[side]
+        heaped = self.heaped[side]
+        if len(heap) > 2 * len(levels) + 16:
+            heap[:] = [-p if side == 'BUY' else p for p in levels]
+            heapq.heapify(heap)
+            heaped.clear()
+            heaped.update(levels)
+        while heap:
+            price = -heap[0] if side == 'BUY' else heap[0]
+            if price in levels:
+                break
+            heapq.heappop(heap)
+            heaped.discard(price)
+
+    def remove(self, order):
+        if self.live.get(order['id']) is not order:
+            return False
+        del self.live[order['id']]
+        side = order['type']
+        price = order['price']
+        total = self.totals[side][price]
+        total[0] -= order['qty']
+        total[1] -= 1
+        if not total[1]:
+            self._drop_level(side, price)
+            self._prune(side)
+        self.version += 1
+        return True
+
+    # 들어온 주문(side, price)과 교차하는 반대편 호가를 우선순위대로 체결하고 [(상대 주문, 체결 수량)]을 돌려줍니다.
+    # 최우선 레벨부터 걷다가 수량을 다 채우면 멈춥니다. 본인 주문은 건너뛰되 대기열 순서는 그대로 유지합니다.
+    def match(self, side, price, qty, user_id):
+        opp = 'SELL' if side == 'BUY' else 'BUY'
+        levels = self.levels[opp]
+        live = self.live
+        fills = []
+        remaining_qty = qty
+        for level_price in self._walk(opp):
+            if (level_price > price) if side == 'BUY' else (level_price < price):
+                break
+            level = levels[level_price]
+            total = self.totals[opp][level_price]
+            kept = deque()
+            while level and remaining_qty > 0:
+                order = level.popleft()
+                if order['user'] == user_id:
+                    kept.append(order)      # 취소된 본인 주문도 그대로 두었다가 나중에 버립니다
+                    continue
+                if live.get(order['id']) is not order:
+                    continue
+                match_qty = min(remaining_qty, order['qty'])
+                order['qty'] -= match_qty
+                remaining_qty -= match_qty
+                total[0] -= match_qty
+                fills.append((order, match_qty))
+                if order['qty'] > 0:
+                    level.appendleft(order)
+                    break
+                del live[order['id']]
+                total[1] -= 1
+            if kept:
+                kept.extend(level)
+                levels[level_price] = kept
+            if not total[1]:
+                self._drop_level(opp, level_price)
+            if remaining_qty <= 0:
+                break
+        if fills:
+            self._prune(opp)
+            self.version += 1
+        return fills
+
+    # 호가창 표시용: 최우선 호가부터 n개 레벨의 (가격, 잔량 합계, 주문 수)
+    def top_levels(self, side, n):
+        totals = self.totals[side]
+        return [(p, totals[p][0], totals[p][1]) for p in islice(self._walk(side), n)]
+
+    # {'version', 'bids', 'asks'} 스냅샷. 같은 version이면 새로 만들지 않고 캐시를 돌려주므로 읽기 전용으로 다룹니다.
+    def depth(self, levels=5):
+        cached = self.depth_cache.get(levels)
+        if cached is None or cached['version'] != self.version:
+            cached = self.depth_cache[levels] = {'version': self.version,
+                                                 'bids': tuple(self.top_levels('BUY', levels)),
+                                                 'asks': tuple(self.top_levels('SELL', levels))}
+        return cached
+
+    def orders(self):
+        for side in ('BUY', 'SELL'):
+            for price in sorted(self.levels[side]):
+                yield from (order for order in self.levels[side][price] if self.live.get(order['id']) is order)
+
+
+# --- [호가창 헬퍼] ---
+def get_book(books, code):
+    book = books.get(code)
+    if book is None:
+        book = books[code] = OrderBook(code)
+    return book
+
+def build_books(pending_orders):
+    books = {}
+    for order in pending_orders:
+        if order['qty'] > 0:
+            get_book(books, order['code']).add(order)
+    return books
+
+def dump_orders(books):
+    return [order for book in books.values() for order in book.orders()]
@@ -0,0 +1,139 @@
+from collections import namedtuple
+import numpy as np
+
+GROW = 1024     # 유저별 배열을 처음 잡는 크기 (모자라면 두 배씩 늘립니다)
+
+# stock: 보유 주식 평가액, cost: 매입 원가(수량 x 평단), total: 잔고 + 평가액 (내 엘피스 잠금분은 빼고)
+Valuation = namedtuple('Valuation', 'balance locked stock cost total profit')
+
+def _fit(array, size):
+    if size <= len(array):
+        return array
+    grown = np.zeros(max(size, len(array) * 2), dtype=array.dtype)
+    grown[:len(array)] = array
+    return grown
+
+# --- [보유자 인덱스 / 평가액 캐시] ---
+# 종목 코드 -> {유저: 수량} 역인덱스와, 유저별 잔고/평가액/매입 원가를 들고 있습니다.
+# 유저에게 번호(행)를 매겨 잔고/평가액/원가는 NumPy 배열에 두므로, 거래소 전체 순위/합계는 배열 연산 한 번입니다.
+# 유저마다 마지막으로 본 보유분과 종목마다 마지막으로 반영한 가격을 기억해 두고, 바뀐 만큼만 더하고 뺍니다.
+#   sync(user, acct, code)  계정이 바뀔 때 (state.touch('users')) -> code가 있으면 그 종목 하나, 없으면 보유 종목 전체
+#   reprice(code)           가격이 바뀔 때 (state.touch('markets')) -> 그 종목 보유자 수만큼
+#   leaderboard(k) / rank(user) / supply()   총 자산(잔고 + 평가액) 기준
+class Valuations:
+    def __init__(self, market_data):
+        self.market_data = market_data
+        self.holders = {}
+        self.positions = {}     # 유저 -> {종목: (수량, 평단)}
+        self.prices = {}        # 종목 -> 평가액에 반영된 가격
+        self.users = []
+        self.rows = {}          # 유저 -> 배열의 행 번호
+        self.balance = np.zeros(GROW)
+        self.stock = np.zeros(GROW)
+        self.cost = np.zeros(GROW)
+
+    def _price(self, code):
+        price = self.prices.get(code)
+        if price is None:
+            price = self.prices[code] = self.market_data.get(code, {}).get('price', 0)
+        return price
+
+    def _row(self, user_id):
+        row = self.rows.get(user_id)
+        if row is None:
+            row = self.rows[user_id] = len(self.users)
+            self.users.append(user_id)
+            self.balance = _fit(self.balance, row + 1)
+            self.stock = _fit(self.stock, row + 1)
+            self.cost = _fit(self.cost, row + 1)
+            self.positions[user_id] = {}
+        return row
+
+    # 한 종목의 보유분을 바꾸고 (평가액 변화, 원가 변화)를 돌려줍니다
+    def _apply(self, user_id, code, new):
+        positions = self.positions[user_id]
+        old_qty, old_avg = positions.get(code, (0, 0))
+        new_qty, new_avg = new
+        if (old_qty, old_avg) == (new_qty, new_avg):
+            return 0, 0
+        holders = self.holders.setdefault(code, {})
+        if new_qty > 0:
+            holders[user_id] = new_qty
+            positions[code] = new
+        else:
+            holders.pop(user_id, None)
+            positions.pop(code, None)
+        return (new_qty - old_qty) * self._price(code), new_qty * new_avg - old_qty * old_avg
+
+    def sync(self, user_id, acct, code=None):
+        row = self._row(user_id)
+        acct = acct or {}
+        portfolio = acct.get('portfolio', {})
+        self.balance[row] = acct.get('balance_id', 0)
+        if code is not None:
+            pos = portfolio.get(code)
+            stock, cost = self._apply(user_id, code, (pos['qty'], pos['avg_price']) if pos else (0, 0))
+        else:
+            stock = cost = 0
+            changes = [(code, (0, 0)) for code in self.positions[user_id].keys() - portfolio.keys()]
+            changes += [(code, (pos['qty'], pos['avg_price'])) for code, pos in portfolio.items()]
+            for code, new in changes:
+                d_stock, d_cost = self._apply(user_id, code, new)
+                stock += d_stock
+                cost += d_cost
+        if stock:
+            self.stock[row] += stock
+        if cost:
+            self.cost[row] += cost
+
+    def reprice(self, code):
+        old = self.prices.get(code)
+        new = self.market_data[code]['price']
+        self.prices[code] = new
+        if old is None or old == new:
+            return
+        rows = self.rows
+        for user_id, qty in self.holders.get(code, {}).items():
+            self.stock[rows[user_id]] += qty * (new - old)
+
+    def valuation(self, user_id, acct):
+        if user_id not in self.rows:
+            self.sync(user_id, acct)
+        row = self.rows[user_id]
+        stock = float(self.stock[row])
+        cost = float(self.cost[row])
+        return Valuation(acct['balance_id'], acct['my_elpis_locked'], stock, cost, acct['balance_id'] + stock, stock - cost)
+
+    # 종목 보유자 (수량 많은 순)
+    def holders_of(self, code):
+        return sorted(self.holders.get(code, {}).items(), key=lambda h: -h[1])
+
+    # --- 거래소 전체 (배열 연산) ---
+    def totals(self):
+        n = len(self.users)
+        return self.balance[:n] + self.stock[:n]
+
+    # [(유저, 잔고, 평가액, 총 자산)] 총 자산 많은 순
+    def leaderboard(self, k=20):
+        total = self.totals()
+        if not len(total):
+            return []
+        top = np.argpartition(-total, k - 1)[:k] if len(total) > k else np.arange(len(total))
+        top = top[np.lexsort((top, -total[top]))]
+        return [(self.users[i], float(self.balance[i]), float(self.stock[i]), float(total[i])) for i in top]
+
+    # 총 자산 순위 (1부터, 같은 금액이면 같은 순위)
+    def rank(self, user_id):
+        row = self.rows.get(user_id)
+        if row is None:
+            return None
+        total = self.totals()
+        return int(np.count_nonzero(total > total[row])) + 1
+
+    # 유통 중인 ID (잔고 합계)와 보유 주식 평가액 합계
+    def supply(self):
+        n = len(self.users)
+        return float(self.balance[:n].sum()), float(self.stock[:n].sum())
+
+    def __len__(self):
+        return len(self.users)
@@ -0,0 +1,189 @@
+import calendar
+import datetime
+from array import array
+from collections import deque
+
+TICK_CAPACITY = 240     # 종목마다 보관할 최근 체결가 수
+# 해상도 -> (캔들 길이(초), 보관할 캔들 수). 종목 한 줄이 시트 셀 한도(5만 자) 안에 들어가도록 잡은 값입니다.
+CANDLE_SPECS = {'1m': (60, 240), '1h': (3600, 168), '1d': (86400, 365)}
+DAY = 86400
+# 시장 통계(최근 24시간 거래량/거래대금/고저/등락/건수)는 한 시간 단위 구간으로 모읍니다.
+WINDOW_BUCKET = 3600
+WINDOW_BUCKETS = DAY // WINDOW_BUCKET
+
+# 이벤트 시각 문자열 -> 초 단위 타임스탬프 (시각 문자열이 현지 시각이므로 날짜 경계도 현지 자정이 됩니다)
+def to_ts(time_str):
+    return calendar.timegm(datetime.datetime.strptime(time_str[:19], "%Y-%m-%d %H:%M:%S").timetuple())
+
+# --- [최근 체결가 링 버퍼] ---
+# 고정 크기 array('q')에 덮어쓰기만 하므로 체결이 아무리 많아도 메모리가 늘지 않습니다.
+class TickRing:
+    def __init__(self, capacity, ticks=()):
+        self.buf = array('q', bytes(8 * capacity))
+        self.capacity = capacity
+        self.start = 0
+        self.size = 0
+        for price in list(ticks)[-capacity:]:
+            self.append(price)
+
+    def append(self, price):
+        end = (self.start + self.size) % self.capacity
+        self.buf[end] = int(price)
+        if self.size < self.capacity:
+            self.size += 1
+        else:
+            self.start = (self.start + 1) % self.capacity
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        for i in range(self.size):
+            yield self.buf[(self.start + i) % self.capacity]
+
+    def tolist(self):
+        return list(self)
+
+# --- [차트용 다운샘플링 (LTTB: Largest-Triangle-Three-Buckets)] ---
+# 처음과 끝 점은 남기고, 나머지를 budget-2개 구간으로 나눠 구간마다 '앞에서 고른 점 - 이 점 - 다음 구간 평균'이
+# 만드는 삼각형이 가장 큰 점 하나를 고릅니다. 점 수가 줄어도 급등/급락 같은 모양이 남습니다.
+def lttb(xs, ys, budget):
+    n = len(ys)
+    if budget >= n or budget < 3:
+        return list(xs), list(ys)
+    every = (n - 2) / (budget - 2)
+    picked = [0]
+    a = 0
+    for i in range(budget - 2):
+        start = int(i * every) + 1
+        end = min(int((i + 1) * every) + 1, n - 1)
+        next_end = min(int((i + 2) * every) + 1, n)
+        if i == budget - 3:
+            end, next_end = n - 1, n
+        size = max(next_end - end, 1)
+        avg_x = sum(xs[end:end + size]) / size
+        avg_y = sum(ys[end:end + size]) / size
+        best, best_area = start, -1.0
+        for j in range(start, max(end, start + 1)):
+            area = abs((xs[a] - avg_x) * (ys[j] - ys[a]) - (xs[a] - xs[j]) * (avg_y - ys[a]))
+            if area > best_area:
+                best, best_area = j, area
+        picked.append(best)
+        a = best
+    picked.append(n - 1)
+    return [xs[i] for i in picked], [ys[i] for i in picked]
+
+# --- [종목별 가격 기록: 최근 체결가 + OHLCV 캔들] ---
+# 캔들은 [시작 시각, 시가, 고가, 저가, 종가, 거래량] 리스트이고, 해상도마다 정해진 개수만 남깁니다.
+# base는 전일 캔들이 없을 때 등락률 기준으로 쓰는 가격(상장가 또는 예전 history의 첫 값)입니다.
+# window는 최근 24시간 통계용 한 시간 구간 [시작 시각, 시가, 고가, 저가, 종가, 거래량, 거래대금, 체결 건수]입니다.
+# (예전 저장분에는 window가 없어서 그 다음 체결부터 모입니다)
+class PriceHistory:
+    def __init__(self, ticks=(), candles=None, base=None, window=None):
+        ticks = list(ticks)
+        self.ticks = TickRing(TICK_CAPACITY, ticks)
+        self.base = base if base is not None else (ticks[0] if ticks else None)
+        candles = candles or {}
+        self.candles = {res: deque((list(c) for c in candles.get(res, [])), maxlen=keep)
+                        for res, (_, keep) in CANDLE_SPECS.items()}
+        self.window = deque((list(b) for b in window or ()), maxlen=WINDOW_BUCKETS)
+        self.stats = None           # 마지막으로 계산한 24시간 통계와 그 구간 시작 (같은 구간 안의 체결은 더하기만)
+        self.stats_start = None
+
+    @classmethod
+    def from_market(cls, market):
+        return cls(market.pop('history', ()), market.pop('candles', None), market.pop('base', None), market.pop('window', None))
+
+    def record(self, price, qty, ts):
+        self.ticks.append(price)
+        if self.base is None:
+            self.base = price
+        for res, (span, _) in CANDLE_SPECS.items():
+            bucket = ts - ts % span
+            series = self.candles[res]
+            if series and series[-1][0] >= bucket:   # 같은 캔들 (시계가 조금 뒤로 가도 마지막 캔들에 합칩니다)
+                candle = series[-1]
+                candle[2] = max(candle[2], price)
+                candle[3] = min(candle[3], price)
+                candle[4] = price
+                candle[5] += qty
+            else:
+                series.append([bucket, price, price, price, price, qty])
+        bucket = ts - ts % WINDOW_BUCKET
+        if self.window and self.window[-1][0] >= bucket:
+            b = self.window[-1]
+            b[2] = max(b[2], price)
+            b[3] = min(b[3], price)
+            b[4] = price
+            b[5] += qty
+            b[6] += price * qty
+            b[7] += 1
+        else:
+            self.window.append([bucket, price, price, price, price, qty, price * qty, 1])
+        stats = self.stats
+        if stats is not None and self.window[-1][0] >= self.stats_start:
+            if not stats['count']:
+                stats.update(high=price, low=price, open=price, expires=self.window[-1][0] + DAY)
+            stats['high'] = max(stats['high'], price)
+            stats['low'] = min(stats['low'], price)
+            stats['volume'] += qty
+            stats['turnover'] += price * qty
+            stats['count'] += 1
+            stats['change'] = round((price - stats['open']) / stats['open'] * 100, 2) if stats['open'] else 0.0
+
+    # now가 속한 구간과 그 앞 23개 구간의 합계. expires는 가장 오래된 구간이 빠지는 시각 (구간이 없으면 None)
+    # 구간 시작이 지난번과 같으면 record()가 더해 둔 값을 그대로 씁니다 (한 시간에 한 번만 다시 셉니다).
+    def window_stats(self, now):
+        start = now - now % WINDOW_BUCKET - DAY + WINDOW_BUCKET
+        if self.stats is not None and start == self.stats_start:
+            return dict(self.stats)
+        volume = turnover = count = 0
+        high = low = first = last = expires = None
+        for b in self.window:
+            if b[0] < start:
+                continue
+            if first is None:
+                first, high, low, expires = b[1], b[2], b[3], b[0] + DAY
+            elif b[2] > high:
+                high = b[2]
+            if b[3] < low:
+                low = b[3]
+            last = b[4]
+            volume += b[5]
+            turnover += b[6]
+            count += b[7]
+        change = round((last - first) / first * 100, 2) if first else 0.0
+        self.stats = {'volume': volume, 'turnover': turnover, 'count': count, 'high': high, 'low': low, 'open': first,
+                      'change': change, 'expires': expires}
+        self.stats_start = start
+        return dict(self.stats)
+
+    # 등락률 기준가: ts가 속한 날의 직전 일봉 종가, 없으면 base
+    def reference_price(self, ts):
+        day = ts - ts % DAY
+        for candle in reversed(self.candles['1d']):
+            if candle[0] < day:
+                return candle[4]
+        return self.base
+
+    def change_pct(self, price, ts):
+        ref = self.reference_price(ts)
+        if not ref:
+            return 0.0
+        return round(((price - ref) / ref) * 100, 2)
+
+    # 차트 데이터 (x, 종가). res가 None이면 최근 체결가 (x는 순번), 아니면 그 해상도 캔들 (x는 시작 시각)
+    def series(self, res=None):
+        if res is None:
+            ticks = self.ticks.tolist()
+            return list(range(len(ticks))), ticks
+        candles = self.candles[res]
+        return [c[0] for c in candles], [c[4] for c in candles]
+
+    def to_dict(self):
+        return {
+            'history': self.ticks.tolist(),
+            'candles': {res: [list(c) for c in series] for res, series in self.candles.items()},
+            'base': self.base,
+            'window': [list(b) for b in self.window]
+        }
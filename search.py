@@ -0,0 +1,120 @@
+import bisect
+import heapq
+
+CHOSEONG = 'ㄱㄲㄴㄷㄸㄹㅁㅂㅃㅅㅆㅇㅈㅉㅊㅋㅌㅍㅎ'
+JAMO = set(CHOSEONG)
+
+# 한글 음절은 초성 자모로, 나머지 글자는 그대로 둡니다. ("아이유" -> "ㅇㅇㅇ", "Bot_1" -> "bot_1")
+def choseong(text):
+    out = []
+    for ch in text.lower():
+        code = ord(ch) - 0xAC00
+        out.append(CHOSEONG[code // 588] if 0 <= code < 11172 else ch)
+    return ''.join(out)
+
+def normalize(text):
+    return ''.join(text.lower().split())
+
+def grams(text):
+    return {text[i:i + 2] for i in range(len(text) - 1)} | set(text)
+
+# --- [종목 검색 인덱스] ---
+# 종목마다 검색 키 세 개(코드, 이름, 이름의 초성)를 만듭니다.
+#   - 키마다 정렬된 (키, 코드) 목록: 앞부분 일치는 이분 탐색으로 찾은 자리부터 k개만 읽습니다.
+#   - 글자/두 글자 조각 -> 종목 코드 목록: 앞부분 일치가 k개가 안 될 때만, 조각 목록의 교집합으로 후보를 줄여
+#     중간 일치를 채웁니다.
+# 질의에 초성 자모(ㄱ~ㅎ)가 있으면 질의도 초성으로 바꿔 초성 키에서, 없으면 코드/이름에서 찾습니다.
+class SymbolIndex:
+    def __init__(self, markets=()):
+        self.keys = {}      # 종목 코드 -> (코드, 이름, 초성)
+        self.names = {}
+        self.postings = {}
+        self.sorted = ([], [], [])
+        for code, name in markets:
+            self._index(code, name)
+        for entries in self.sorted:
+            entries.sort()
+
+    def _index(self, code, name):
+        keys = (normalize(code), normalize(name), choseong(normalize(name)))
+        self.keys[code] = keys
+        self.names[code] = name
+        for gram in set().union(*(grams(key) for key in keys)):
+            self.postings.setdefault(gram, set()).add(code)
+        for entries, key in zip(self.sorted, keys):
+            entries.append((key, code))
+        return keys
+
+    # 새 종목 상장, 또는 이름이 바뀐 종목 다시 넣기
+    def add(self, code, name):
+        if code in self.keys:
+            if self.names[code] == name:
+                return
+            self.remove(code)
+        keys = self._index(code, name)
+        for entries, key in zip(self.sorted, keys):
+            entries.pop()
+            bisect.insort(entries, (key, code))
+
+    def remove(self, code):
+        keys = self.keys.pop(code, None)
+        self.names.pop(code, None)
+        if keys is None:
+            return
+        for gram in set().union(*(grams(key) for key in keys)):
+            codes = self.postings.get(gram)
+            if codes is not None:
+                codes.discard(code)
+                if not codes:
+                    del self.postings[gram]
+        for entries, key in zip(self.sorted, keys):
+            i = bisect.bisect_left(entries, (key, code))
+            if i < len(entries) and entries[i] == (key, code):
+                del entries[i]
+
+    def __len__(self):
+        return len(self.keys)
+
+    # 앞부분 일치: 키 순서대로 k개까지 (키와 똑같으면 맨 앞)
+    def _prefix(self, fields, query, k):
+        hits = []
+        for field in fields:
+            entries = self.sorted[field]
+            i = bisect.bisect_left(entries, (query,))
+            for key, code in entries[i:i + k]:
+                if not key.startswith(query):
+                    break
+                hits.append((0 if key == query else 1, key, code))
+        best = {}
+        for rank in sorted(hits):
+            best.setdefault(rank[2], rank)
+        return list(best)[:k]
+
+    # 중간 일치: 더 앞에서 맞은 것, 이름이 짧은 것, 코드 순
+    def _substring(self, fields, query, k, found):
+        lists = sorted((self.postings.get(gram, ()) for gram in grams(query)), key=len)
+        if not lists or not lists[0]:
+            return []
+        ranked = []
+        for code in set(lists[0]).intersection(*lists[1:]):
+            if code in found:
+                continue
+            keys = self.keys[code]
+            positions = [p for p in (keys[field].find(query) for field in fields) if p > 0]
+            if positions:
+                ranked.append((min(positions), len(keys[1]), code))
+        return [code for _, _, code in heapq.nsmallest(k, ranked)]
+
+    # 상위 k개 종목 코드 (순위: 코드/이름 일치 < 앞부분 일치 < 중간 일치)
+    def search(self, query, k=10):
+        query = normalize(query)
+        if not query:
+            return []
+        fields = (0, 1)
+        if any(ch in JAMO for ch in query):
+            query = choseong(query)     # "아ㅇㅇ"처럼 섞어 쓴 질의도 초성으로 맞춥니다
+            fields = (2,)
+        codes = self._prefix(fields, query, k)
+        if len(codes) < k:
+            codes += self._substring(fields, query, k - len(codes), set(codes))
+        return codes
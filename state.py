@@ -0,0 +1,418 @@
+import threading
+import time
+from orderbook import build_books, dump_orders, get_book
+from pricehistory import PriceHistory
+from trades import TradeStore
+from board import BoardStore
+from portfolio import Valuations
+from movers import Movers
+from search import SymbolIndex
+import metrics
+
+DEFAULT_INTERESTED = ['IU', 'G_DRAGON', 'ELON', 'DEV_MASTER']
+SNAPSHOT_EVERY = 500        # 이벤트가 이만큼 쌓이면 스냅샷
+SNAPSHOT_INTERVAL = 300     # 또는 마지막 스냅샷 후 이 시간(초)이 지나면 스냅샷
+
+# --- [신규 계정 기본값] ---
+def new_account_state(vision=''):
+    return {
+        'balance_id': 10000000.0,
+        'my_elpis_locked': 1000000,
+        'portfolio': {},
+        'my_profile': {'vision': vision, 'sns': '', 'photo': None},
+        'last_mining_time': None
+    }
+
+# --- [초기 데이터 (DB가 비어 있을 때)] ---
+def default_data():
+    data = {
+        'user_db': {'test': '1234'},
+        'user_names': {'test': '테스터'},
+        'user_states': {'test': new_account_state()},
+        'market_data': {
+            'IU': {'name': '아이유', 'price': 50000, 'change': 2.5, 'desc': '국내 원탑 솔로 가수', 'history': [48000, 49000, 50000]},
+            'G_DRAGON': {'name': '지드래곤', 'price': 45000, 'change': -1.2, 'desc': 'K-POP의 아이콘', 'history': [46000, 45500, 45000]},
+            'ELON': {'name': '일론 머스크', 'price': 120000, 'change': 5.8, 'desc': '화성으로 가는 남자', 'history': [110000, 115000, 120000]},
+            'DEV_MASTER': {'name': '50년코딩장인', 'price': 10000, 'change': 0.0, 'desc': '이 앱을 만든 개발자', 'history': [10000]}
+        },
+        'trade_history': [],
+        'board_messages': [
+            {'code': 'IU', 'user': 'Fan_001', 'msg': '아이유 10만 전자 가즈아!!', 'time': '12:00'},
+            {'code': 'ELON', 'user': 'Mars_Lover', 'msg': '화성 갈끄니까~', 'time': '12:05'}
+        ],
+        'pending_orders': [],
+        'interested_codes': list(DEFAULT_INTERESTED)
+    }
+    for i in range(5):
+        bot_id = f"pppp{i+1}"
+        name = f"Bot_{i+1}"
+        data['user_db'][bot_id] = '1234'
+        data['user_names'][bot_id] = name
+        data['user_states'][bot_id] = new_account_state('AI Trader')
+        data['market_data'][bot_id] = {'name': name, 'price': 10000, 'change': 0.0, 'desc': 'AI Bot', 'history': [10000]}
+    return data
+
+# --- [샤드 저장 형식 -> 상태 데이터] ---
+# 저장소는 엔티티(users/markets/orders/trades/board/meta)별로 '키 -> JSON 한 줄'만 알고,
+# 그 줄을 거래소 상태로 조립하는 일은 여기서 합니다.
+# 체결/메시지 줄은 스냅샷보다 먼저 올라갈 수 있는데, 스냅샷 이후 것은 저널 replay가 다시 만들므로 버립니다.
+def _rows_upto(rows, entity, limit):
+    items = sorted((int(k), v) for k, v in rows.get(entity, {}).items())
+    return [(k, v) for k, v in items if limit is None or k < limit]
+
+# 체결/토론방 기록만: (시간순 체결 목록, [(순번, 메시지)])
+def history_from_rows(rows, next_trade_seq, next_msg_seq):
+    return [v for _, v in _rows_upto(rows, 'trades', next_trade_seq)], _rows_upto(rows, 'board', next_msg_seq)
+
+# 체결/토론방 줄이 rows에 없으면(뒤늦게 읽는 경우) 빈 기록으로 시작하고 history_pending을 켭니다.
+def data_from_rows(rows):
+    users = rows.get('users', {})
+    meta = rows.get('meta', {})
+    counters = meta.get('counters', {})
+    trades, board_rows = history_from_rows(rows, counters.get('next_trade_seq'), counters.get('next_msg_seq'))
+    trades.reverse()    # 예전 형식과 같은 최신순
+    data = {
+        'user_db': {uid: u['pw'] for uid, u in users.items() if u.get('pw') is not None},
+        'user_names': {uid: u['name'] for uid, u in users.items() if u.get('name') is not None},
+        'user_states': {uid: u['state'] for uid, u in users.items() if u.get('state') is not None},
+        'market_data': dict(rows.get('markets', {})),
+        'trade_history': trades,
+        'board_rows': board_rows,   # 보관 한도로 지운 줄이 있어 순번을 함께 넘깁니다
+        'pending_orders': sorted(rows.get('orders', {}).values(), key=lambda o: o['id']),
+        'interested_codes': meta.get('interested_codes', DEFAULT_INTERESTED),
+        'history_pending': 'trades' not in rows,
+        'sharded': True
+    }
+    data.update(counters)
+    return data
+
+# --- [프로세스 공유 거래소 상태] ---
+# 모든 브라우저 세션이 이 객체 하나를 함께 읽고 씁니다. (세션에는 로그인한 유저 ID만 남습니다)
+# 여러 값을 함께 바꾸는 작업(주문, 상장, 가입 등)은 반드시 lock 안에서 처리합니다.
+class ExchangeState:
+    def __init__(self, data):
+        self.lock = threading.RLock()
+        self.market_versions = {}   # 종목 코드 -> 시세(가격/등락률/체결가 기록)가 바뀐 횟수
+        self.results = {}           # 저장 전 우리 이벤트 순번 -> 적용 결과
+        self.inflight = {}          # 그중 지금 올리는 중인 것 (실패하면 requeue()가 results로 되돌립니다)
+        self.revisions = {}         # 유저 -> 충돌 후 다시 적용해서 결과가 바뀐 이벤트 목록 (화면이 꺼내 갑니다)
+        self.reset(data)
+
+    # 저장소에서 다시 읽은 데이터로 통째로 갈아 끼웁니다 (다른 서버와 저장이 충돌했을 때).
+    # 세션들이 같은 객체를 들고 있으므로 새 객체를 만들지 않고, 시세 버전은 이어서 올려 화면 캐시가 섞이지 않게 합니다.
+    def reset(self, data):
+        with self.lock:
+            self.user_db = data['user_db']
+            self.user_names = data['user_names']
+            self.market_data = data['market_data']
+            # 체결가 기록은 종목 dict 밖에 따로 두고, 저장할 때만 종목 줄에 합칩니다.
+            self.price_history = {code: PriceHistory.from_market(market) for code, market in self.market_data.items()}
+            # 체결 내역은 저장 형식(최신순)과 달리 시간순으로 추가만 하는 저장소에 담습니다.
+            self.trades = TradeStore(reversed(data['trade_history']))
+            self.symbols = SymbolIndex((code, market['name']) for code, market in self.market_data.items())
+            self.user_states = data['user_states']
+            self.interested_codes = set(data.get('interested_codes', DEFAULT_INTERESTED))
+            self.next_order_id = data.get('next_order_id', 1)
+            self.next_trade_seq = data.get('next_trade_seq', len(self.trades) + 1)
+            self.next_msg_seq = data.get('next_msg_seq', len(data.get('board_messages', ())) + 1)
+            self.next_event_seq = data.get('next_event_seq', 1)
+            self.replaying = False
+            for code in self.market_versions:
+                self.market_versions[code] += 1
+            # 종목별 보유자와 계정별 평가액. 계정/가격이 바뀔 때 touch()에서 바뀐 만큼만 갱신합니다.
+            self.valuations = Valuations(self.market_data)
+            for user_id, acct in self.user_states.items():
+                self.valuations.sync(user_id, acct)
+            # 최근 24시간 시장 통계와 상승/하락/거래량 순위. 시계는 저장된 구간 중 가장 늦은 것에서 시작합니다.
+            self.movers = Movers()
+            self.movers.advance(max((h.window[-1][0] for h in self.price_history.values() if h.window), default=0))
+            for code in self.market_data:
+                self.movers.update(code, self.history(code).window_stats(self.movers.clock))
+
+            pending_orders = data.get('pending_orders', [])
+            for order in pending_orders:
+                if 'id' not in order:   # 예전 형식 주문에는 ID가 없습니다
+                    order['id'] = self.next_order_id
+                    self.next_order_id += 1
+            self.order_books = build_books(pending_orders)
+            self.open_orders = {o['id']: o for o in dump_orders(self.order_books)}
+            self.user_orders = {}       # 유저 -> {주문 번호: 대기 주문}
+            for order_id in sorted(self.open_orders):
+                order = self.open_orders[order_id]
+                self.user_orders.setdefault(order['user'], {})[order_id] = order
+
+            # 마지막 스냅샷 이후 바뀐 키 (엔티티별). trades/board/journal은 추가만 되므로 새 줄을 그대로 모읍니다.
+            self.dirty = {'users': set(), 'markets': set(), 'orders': set(), 'meta': set()}
+            self.appended = {'trades': {}, 'board': {}, 'journal': {}}
+
+            # 토론방은 종목별로 나눠 담습니다. 예전 형식(최신순 리스트)에는 순번이 없어 카운터에서 거꾸로 매깁니다.
+            board_rows = data.get('board_rows')
+            if board_rows is None:
+                messages = data.get('board_messages', [])
+                first_msg = self.next_msg_seq - len(messages)
+                board_rows = [(first_msg + i, m) for i, m in enumerate(reversed(messages))]
+            self.board = BoardStore()
+            for seq, message in board_rows:
+                self._add_board_row(seq, message)
+            self.snapshot_seq = self.next_event_seq
+            self.snapshot_time = time.monotonic()
+            self.snapshot_requested = False
+            # 체결/토론방 기록을 뒤늦게 읽는 중이면, 그 기록이 끝나는 순번(스냅샷 카운터)을 기억해 둡니다.
+            self.history_loaded = not data.get('history_pending')
+            self.history_error = None
+            self.history_limits = (self.next_trade_seq, self.next_msg_seq)
+            # 저장소 저널에 이미 올라간 이벤트의 다음 순번. 저장할 때 저장소 저널이 여기서 끝나 있어야 합니다.
+            self.persisted_seq = self.next_event_seq
+
+    # 뒤늦게 읽은 예전 체결/메시지를, 그 사이 replay나 새 주문으로 쌓인 기록 앞에 붙입니다.
+    def attach_history(self, rows):
+        older_trades, older_board = history_from_rows(rows, *self.history_limits)
+        with self.lock:
+            if self.history_loaded:
+                return
+            self.trades = TradeStore(older_trades + self.trades.trades)
+            current_board = list(self.board.rows())
+            self.board = BoardStore(self.board.retention)
+            for seq, message in older_board + current_board:
+                self._add_board_row(seq, message)
+            self.history_loaded = True
+
+    def history(self, code):
+        history = self.price_history.get(code)
+        if history is None:
+            history = self.price_history[code] = PriceHistory([self.market_data[code]['price']])
+        return history
+
+    # 호가창 요약 (종목별로 미리 집계해 둔 잔량에서 최우선 levels개만 꺼냅니다)
+    def depth(self, code, levels=5):
+        with self.lock:
+            return get_book(self.order_books, code).depth(levels)
+
+    # 현재가 화면용 시세 스냅샷. version은 (시세 버전, 호가창 버전)이라 둘 중 하나만 바뀌어도 달라집니다.
+    def market_snapshot(self, code, levels=5):
+        with self.lock:
+            market = self.market_data[code]
+            depth = get_book(self.order_books, code).depth(levels)
+            return {'code': code, 'name': market['name'], 'price': market['price'], 'change': market['change'],
+                    'bids': depth['bids'], 'asks': depth['asks'],
+                    'version': (self.market_versions.get(code, 0), depth['version'])}
+
+    # 유저의 대기 주문 (복사본, 주문 번호순)
+    def orders_of(self, user_id):
+        with self.lock:
+            return [dict(o) for o in self.user_orders.get(user_id, {}).values()]
+
+    # 계정 평가 요약 (잔고/평가액/매입 원가/손익은 캐시에서 바로 꺼냅니다)
+    # 없는 유저면 None (조회만으로 계정을 만들지 않습니다)
+    def valuation(self, user_id):
+        with self.lock:
+            acct = self.user_states.get(user_id)
+            return None if acct is None else self.valuations.valuation(user_id, acct)
+
+    # 종목 보유자 [(유저, 수량)] (수량 많은 순)
+    def holders(self, code):
+        with self.lock:
+            return self.valuations.holders_of(code)
+
+    # 총 자산 순위표 [(유저, 잔고, 평가액, 총 자산)]와 전체 요약
+    def leaderboard(self, k=20):
+        with self.lock:
+            return self.valuations.leaderboard(k)
+
+    def asset_rank(self, user_id):
+        with self.lock:
+            return self.valuations.rank(user_id)
+
+    def asset_summary(self):
+        with self.lock:
+            supply, stock = self.valuations.supply()
+            return {'users': len(self.valuations), 'supply': supply, 'stock': stock}
+
+    # 체결 시각 ts에 code가 체결된 뒤: 그 종목과, 시계가 넘어가며 오래된 구간이 빠진 종목의 통계를 다시 냅니다
+    def refresh_stats(self, code, ts):
+        with self.lock:
+            due = self.movers.advance(ts)
+            due.add(code)
+            for due_code in due:
+                if due_code in self.market_data:
+                    self.movers.update(due_code, self.history(due_code).window_stats(self.movers.clock))
+
+    # 시장 동향 {'gainers'/'losers'/'volume': [(종목, 이름, 현재가, 24시간 통계)]}
+    def market_movers(self, k=5):
+        with self.lock:
+            movers = self.movers
+            ranked = {'gainers': movers.gainers(k), 'losers': movers.losers(k), 'volume': movers.volume_leaders(k)}
+            return {kind: [(code, self.market_data[code]['name'], self.market_data[code]['price'], stats) for code, stats in items]
+                    for kind, items in ranked.items()}
+
+    # 종목 검색 (코드/이름/초성, 상위 k개 코드)
+    def search_markets(self, query, k=10):
+        with self.lock:
+            return self.symbols.search(query, k)
+
+    def list_market(self, code, market):
+        with self.lock:
+            self.market_data[code] = market
+            self.symbols.add(code, market['name'])
+            self.price_history[code] = PriceHistory([market['price']])
+            self.movers.update(code, self.price_history[code].window_stats(self.movers.clock))
+            self.touch('markets', code)
+
+    def account(self, user_id):
+        acct = self.user_states.get(user_id)
+        if acct is None:
+            with self.lock:
+                acct = self.user_states.setdefault(user_id, new_account_state())
+        return acct
+
+    # --- [변경 기록] ---
+    # replay 중에는 이미 저널에 있는 이벤트를 다시 적용하는 것이므로 새로 추가하지 않습니다.
+    def journal(self, event):
+        if self.replaying:
+            return
+        with self.lock:
+            self.appended['journal'][self.next_event_seq] = event
+            self.next_event_seq += 1
+
+    # 처리하다 실패한 이벤트가 seq번부터 남긴 저널 줄(이벤트와 그 체결 기록)을 되돌립니다
+    def drop_journal(self, seq):
+        if self.replaying:
+            return
+        with self.lock:
+            for key in [key for key in self.appended['journal'] if key >= seq]:
+                del self.appended['journal'][key]
+            self.next_event_seq = seq
+
+    # 계정을 바꾼 쪽이 바뀐 종목(code)을 알려 주면 평가액 캐시는 그 종목 하나만 다시 봅니다 (없으면 보유 종목 전체).
+    def touch(self, entity, key, code=None):
+        with self.lock:
+            self.dirty[entity].add(key)
+            if entity == 'users':
+                self.valuations.sync(key, self.user_states.get(key), code)
+            elif entity == 'markets':
+                self.market_versions[key] = self.market_versions.get(key, 0) + 1
+                if key in self.market_data:
+                    self.valuations.reprice(key)
+
+    def add_order(self, order):
+        with self.lock:
+            order['id'] = self.next_order_id
+            self.next_order_id += 1
+            get_book(self.order_books, order['code']).add(order)
+            self.open_orders[order['id']] = order
+            self.user_orders.setdefault(order['user'], {})[order['id']] = order
+            self.dirty['orders'].add(order['id'])
+            self.dirty['meta'].add('counters')
+
+    # 체결로 수량이 바뀐 대기 주문 (전량 체결되면 저장소에서도 지워집니다)
+    def touch_order(self, order):
+        with self.lock:
+            if order['qty'] <= 0:
+                self.open_orders.pop(order['id'], None)
+                self.user_orders.get(order['user'], {}).pop(order['id'], None)
+            self.dirty['orders'].add(order['id'])
+
+    # replay 중에 다시 만들어지는 체결/메시지 줄은 그 이벤트를 올린 서버가 이미 저장했으므로 다시 보내지 않습니다.
+    def add_trade(self, record):
+        with self.lock:
+            self.trades.append(record)
+            if not self.replaying:
+                self.appended['trades'][self.next_trade_seq] = record
+                metrics.count('fills')
+            self.next_trade_seq += 1
+            self.dirty['meta'].add('counters')
+
+    def add_message(self, message):
+        with self.lock:
+            self._add_board_row(self.next_msg_seq, message)
+            if not self.replaying:
+                self.appended['board'][self.next_msg_seq] = message
+            self.next_msg_seq += 1
+            self.dirty['meta'].add('counters')
+
+    # 예전 통짜 JSON에서 옮겨 오거나 새로 만든 DB는 전체를 한 번 써야 합니다.
+    def mark_all_dirty(self):
+        with self.lock:
+            self.dirty['users'].update(self.user_db, self.user_names, self.user_states)
+            self.dirty['markets'].update(self.market_data)
+            self.dirty['orders'].update(self.open_orders)
+            self.dirty['meta'].update(('counters', 'interested_codes'))
+            first_trade = self.next_trade_seq - len(self.trades)
+            self.appended['trades'] = {first_trade + i: t for i, t in enumerate(self.trades.trades)}
+            self.appended['board'] = dict(self.board.rows())
+
+    # 보관 한도로 밀려난 메시지는 저장소에서도 지웁니다 (None = 삭제)
+    def _add_board_row(self, seq, message):
+        evicted = self.board.add(seq, message)
+        if evicted is not None and not self.replaying:
+            self.appended['board'][evicted] = None
+
+    def snapshot_due(self):
+        events = self.next_event_seq - self.snapshot_seq
+        return self.snapshot_requested or events >= SNAPSHOT_EVERY or (events > 0 and time.monotonic() - self.snapshot_time >= SNAPSHOT_INTERVAL)
+
+    # --- [저장할 변경분 꺼내기] ---
+    # {엔티티: {키: 값 또는 None(삭제)}}. lock을 잡은 채 호출하고, 저장이 실패하면 requeue()로 되돌립니다.
+    # 평소에는 저널/체결/메시지 추가분만 보내고, 스냅샷 때만 바뀐 계정/종목/주문 줄과 카운터를 함께 보냅니다.
+    # 스냅샷의 카운터(next_event_seq)가 '이 줄들이 반영한 마지막 이벤트 다음 순번'이 됩니다.
+    def take_changes(self, snapshot=False):
+        changes = {}
+        if snapshot:
+            self.dirty['meta'].add('counters')
+            for entity, keys in self.dirty.items():
+                if keys:
+                    changes[entity] = {key: self._row(entity, key) for key in keys}
+                    keys.clear()
+            self.snapshot_seq = self.next_event_seq
+            self.snapshot_time = time.monotonic()
+            self.snapshot_requested = False
+        for entity, rows in self.appended.items():
+            if rows:
+                changes[entity] = rows
+                self.appended[entity] = {}
+        self.inflight = {seq: self.results.pop(seq) for seq in changes.get('journal', ()) if seq in self.results}
+        return changes
+
+    # 저장소 저널이 next_seq 앞까지 올라갔을 때
+    def mark_persisted(self, next_seq):
+        with self.lock:
+            self.persisted_seq = max(self.persisted_seq, next_seq)
+            self.inflight = {}
+
+    def add_revisions(self, revised):
+        with self.lock:
+            for revision in revised:
+                self.revisions.setdefault(revision['user'], []).append(revision)
+
+    def take_revisions(self, user_id):
+        with self.lock:
+            return self.revisions.pop(user_id, [])
+
+    def requeue(self, changes):
+        with self.lock:
+            self.results.update(self.inflight)
+            self.inflight = {}
+            for entity, rows in changes.items():
+                if entity in self.appended:
+                    self.appended[entity] = {**rows, **self.appended[entity]}
+                else:
+                    self.dirty[entity].update(rows)
+            if 'counters' in changes.get('meta', {}):
+                self.snapshot_requested = True
+
+    def _row(self, entity, key):
+        if entity == 'users':
+            if key not in self.user_db and key not in self.user_states:
+                return None
+            return {'pw': self.user_db.get(key), 'name': self.user_names.get(key), 'state': self.user_states.get(key)}
+        if entity == 'markets':
+            market = self.market_data.get(key)
+            if market is None:
+                return None
+            return {**market, **self.history(key).to_dict()}
+        if entity == 'orders':
+            return self.open_orders.get(key)
+        if key == 'counters':
+            return {'next_order_id': self.next_order_id, 'next_trade_seq': self.next_trade_seq,
+                    'next_msg_seq': self.next_msg_seq, 'next_event_seq': self.next_event_seq}
+        return sorted(self.interested_codes)
@@ -0,0 +1,407 @@
+import abc
+import base64
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import zlib
+import gspread
+import metrics
+
+# --- [저장소 공통 규약] ---
+# 거래소 상태는 엔티티(users/markets/orders/trades/board/meta)별 '키 -> JSON 값' 줄로 저장됩니다.
+# 여기에 더해 모든 변경 이벤트가 순번(seq) 순서대로 journal에 추가만 됩니다.
+#   load(entities)      -> journal을 뺀 {엔티티: {키: 값}} (entities만), 저장소가 비어 있으면 None
+#   load_journal(after) -> 순번이 after 이상인 [(순번, 이벤트)] (순번 오름차순)
+#   load_legacy()       -> 예전 통짜 JSON dict (옮겨 올 데이터가 없으면 None)
+#   write(changes, base_seq)
+#                       -> {엔티티: {키: 값 또는 None(삭제)}}를 한 번에 반영. base_seq를 주면 저장소 저널이
+#                          정확히 그 순번 앞에서 끝나 있을 때만 쓰고, 아니면(다른 서버가 먼저 썼으면) WriteConflict
+#   reset()             -> 저장소 쪽 캐시(행 위치 등)를 버립니다 (충돌 후 다시 읽기 전에)
+#   exclusive()         -> 이 블록 안의 읽기/쓰기 동안 다른 서버의 쓰기를 막습니다 (지원하는 저장소만, 충돌 후 재시도용)
+# load/load_journal/write는 추상 메서드라서, 하나라도 빠진 저장소는 만들 때 TypeError가 납니다. 나머지는 기본 동작이 있습니다.
+# write_interval은 쓰기 지연 저장기가 지킬 최소 쓰기 간격(초)입니다.
+ENTITIES = ('users', 'markets', 'orders', 'trades', 'board', 'meta')
+CORE_ENTITIES = ('users', 'markets', 'orders', 'meta')     # 매칭/로그인에 바로 필요한 것
+HISTORY_ENTITIES = ('trades', 'board')                     # 계속 늘어나는 기록 (뒤늦게 읽어도 되는 것)
+JOURNAL = 'journal'
+
+class WriteConflict(Exception):
+    pass
+
+
+class StorageBackend(abc.ABC):
+    write_interval = 0.0
+
+    @abc.abstractmethod
+    def load(self, entities=ENTITIES):
+        ...
+
+    @abc.abstractmethod
+    def load_journal(self, after):
+        ...
+
+    def load_legacy(self):
+        return None
+
+    @abc.abstractmethod
+    def write(self, changes, base_seq=None):
+        ...
+
+    def reset(self):
+        pass
+
+    def exclusive(self):
+        return contextlib.nullcontext()
+
+
+# --- [시트 셀 인코딩] ---
+# 값은 보통 JSON 문자열 한 칸에 그대로 들어갑니다. 길거나(COMPRESS_MIN 이상) 한 칸 한도를 넘는 값은
+# zlib으로 압축해 base64로 바꾼 뒤 CHUNK_SIZE씩 잘라 옆 칸들에 나눠 담고, 첫 칸에 머리말을 둡니다.
+#   머리말: '#ELPIS|버전|코덱|원문 바이트 수|CRC32|조각 수'  (JSON은 '#'로 시작하지 않으므로 구분됩니다)
+# 읽을 때는 두 형식을 모두 알아보므로, 압축을 켜고 끄는 사이에도 기존 줄을 그대로 읽습니다.
+CELL_HEADER = '#ELPIS'
+CELL_VERSION = 1
+CHUNK_SIZE = 45000      # 시트 한 칸 한도(50,000자)보다 조금 작게
+COMPRESS_MIN = 1024     # 이보다 짧은 JSON은 압축해도 base64 때문에 별로 줄지 않습니다
+
+def encode_cell(value, compress=True):
+    text = json.dumps(value, ensure_ascii=False)
+    if len(text) <= CHUNK_SIZE and (not compress or len(text) < COMPRESS_MIN):
+        return [text]
+    raw = text.encode('utf-8')
+    if compress:
+        codec, body = 'zlib', base64.b64encode(zlib.compress(raw, 6)).decode('ascii')
+    else:
+        codec, body = 'json', text
+    chunks = [body[i:i + CHUNK_SIZE] for i in range(0, len(body), CHUNK_SIZE)]
+    return ['|'.join((CELL_HEADER, str(CELL_VERSION), codec, str(len(raw)), str(zlib.crc32(raw)), str(len(chunks))))] + chunks
+
+def decode_cell(cells):
+    if not cells[0].startswith(CELL_HEADER + '|'):
+        return json.loads(cells[0])
+    _, version, codec, length, checksum, count = cells[0].split('|')
+    if int(version) > CELL_VERSION:
+        raise ValueError(f"알 수 없는 셀 형식 버전: {version}")
+    if len(cells) < 1 + int(count):
+        raise ValueError("셀 조각이 모자랍니다")
+    body = ''.join(cells[1:1 + int(count)])
+    raw = zlib.decompress(base64.b64decode(body)) if codec == 'zlib' else body.encode('utf-8')
+    if len(raw) != int(length) or zlib.crc32(raw) != int(checksum):
+        raise ValueError("셀 내용 검증 실패 (길이/체크섬 불일치)")
+    return json.loads(raw.decode('utf-8'))
+
+# 1 -> A, 27 -> AA
+def column_letter(n):
+    letters = ''
+    while n > 0:
+        n, rem = divmod(n - 1, 26)
+        letters = chr(ord('A') + rem) + letters
+    return letters
+
+
+# --- [구글 시트: 엔티티별 워크시트, 한 줄에 하나씩] ---
+# A열 = 키(유저 ID, 종목 코드, 주문 ID, 순번), B열부터 = 값 (위 셀 인코딩). 바뀐 줄만 values_batch_update 한 번으로 보냅니다.
+# 줄이 짧아지면 전에 쓰던 칸까지 빈 값으로 덮어서 남은 조각이 없게 합니다.
+# JOURNAL 시트는 지워지는 줄이 없으므로 이벤트 순번이 곧 행 번호입니다.
+SHEET_NAMES = {'users': 'USERS', 'markets': 'MARKETS', 'orders': 'ORDERS', 'trades': 'TRADES', 'board': 'BOARD', 'meta': 'META', JOURNAL: 'JOURNAL'}
+GROW_ROWS = 1000
+
+def _api(method):
+    metrics.count('sheets_api_calls', method=method)
+
+class SheetsBackend(StorageBackend):
+    write_interval = 1.1    # 시트 쓰기 한도(분당 60회) 준수
+
+    def __init__(self, open_spreadsheet, compress=True, check_journal=False):
+        self.open_spreadsheet = open_spreadsheet
+        self.compress = compress
+        self.check_journal = check_journal   # 여러 서버가 같은 시트에 쓸 때만 (쓰기마다 읽기 한 번이 더 듭니다)
+        self.sh = None
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.worksheets = {}
+            self.row_of = {entity: {} for entity in SHEET_NAMES}     # 키 -> 행 번호
+            self.free_rows = {entity: [] for entity in SHEET_NAMES}  # 삭제되어 다시 쓸 수 있는 행
+            self.next_row = {entity: 1 for entity in SHEET_NAMES}
+            self.row_width = {entity: {} for entity in SHEET_NAMES}  # 행 번호 -> 마지막으로 쓴 칸 수
+            self.row_count = {}
+            self.col_count = {}
+            self.loaded = set()     # 행 위치를 알고 있는 엔티티
+
+    def _spreadsheet(self):
+        if self.sh is None:
+            _api('open')
+            self.sh = self.open_spreadsheet()
+        return self.sh
+
+    # 워크시트 목록은 처음 한 번만 엽니다. 행 위치(row_of 등)는 lock 안에서만 고칩니다.
+    def _open_worksheets(self):
+        with self.lock:
+            if self.worksheets:
+                return
+            sh = self._spreadsheet()
+            _api('worksheets')
+            existing = {ws.title: ws for ws in sh.worksheets()}
+            for entity, title in SHEET_NAMES.items():
+                ws = existing.get(title)
+                if ws is None:
+                    _api('add_worksheet')
+                    ws = sh.add_worksheet(title=title, rows=GROW_ROWS, cols=2)
+                self.row_count[entity] = ws.row_count
+                self.col_count[entity] = ws.col_count
+                self.worksheets[entity] = ws
+
+    # 엔티티를 나눠서(동시에) 읽을 수 있습니다. 행 위치는 엔티티마다 처음 읽을 때 한 번만 기록합니다.
+    def load(self, entities=ENTITIES):
+        self._open_worksheets()
+        ranges = [f"{SHEET_NAMES[entity]}!A:{column_letter(self.col_count[entity])}" for entity in entities]
+        _api('values_batch_get')
+        value_ranges = self._spreadsheet().values_batch_get(ranges).get('valueRanges', [])
+        rows = {}
+        with self.lock:
+            for entity, value_range in zip(entities, value_ranges):
+                values = value_range.get('values', [])
+                track = entity not in self.loaded
+                self.loaded.add(entity)
+                rows[entity] = {}
+                for row_no, row in enumerate(values, start=1):
+                    if len(row) >= 2 and row[0] and row[1]:
+                        rows[entity][row[0]] = decode_cell(row[1:])
+                        if track:
+                            self.row_of[entity][row[0]] = row_no
+                            self.row_width[entity][row_no] = len(row)
+                    elif track:
+                        self.free_rows[entity].append(row_no)
+                        if row:
+                            self.row_width[entity][row_no] = len(row)
+                if track:
+                    self.next_row[entity] = len(values) + 1
+        if not any(rows.values()):
+            return None
+        return rows
+
+    def load_journal(self, after):
+        sh = self._spreadsheet()
+        width = self.col_count.get(JOURNAL)
+        if not width:
+            _api('worksheet')
+            width = sh.worksheet(SHEET_NAMES[JOURNAL]).col_count
+        _api('values_get')
+        values = sh.values_get(f"{SHEET_NAMES[JOURNAL]}!A{after}:{column_letter(width)}").get('values', [])
+        return [(int(row[0]), decode_cell(row[1:])) for row in values if len(row) >= 2 and row[0]]
+
+    # 예전 형식 (JSON_DATA!A1 한 칸에 통짜 JSON)
+    def load_legacy(self):
+        try:
+            _api('worksheet')
+            worksheet = self._spreadsheet().worksheet("JSON_DATA")
+        except gspread.WorksheetNotFound:
+            return None
+        _api('acell')
+        raw_data = worksheet.acell('A1').value
+        if raw_data:
+            return json.loads(raw_data)
+        return None
+
+    def _alloc_row(self, entity):
+        if self.free_rows[entity]:
+            return self.free_rows[entity].pop()
+        row_no = self.next_row[entity]
+        self.next_row[entity] += 1
+        self._ensure_rows(entity, row_no)
+        return row_no
+
+    def _ensure_rows(self, entity, row_no):
+        if row_no > self.row_count[entity]:
+            grow = max(GROW_ROWS, row_no - self.row_count[entity])
+            _api('add_rows')
+            self.worksheets[entity].add_rows(grow)
+            self.row_count[entity] += grow
+
+    def _ensure_cols(self, entity, width):
+        if width > self.col_count[entity]:
+            _api('add_cols')
+            self.worksheets[entity].add_cols(width - self.col_count[entity])
+            self.col_count[entity] = width
+
+    # 한 행에 쓸 범위와 칸들 (전보다 짧으면 남은 칸을 빈 값으로 채웁니다)
+    def _row_update(self, entity, row_no, cells):
+        width = max(len(cells), self.row_width[entity].get(row_no, 0), 2)
+        self._ensure_cols(entity, width)
+        cells = cells + [''] * (width - len(cells))
+        return {'range': f"{SHEET_NAMES[entity]}!A{row_no}:{column_letter(width)}{row_no}", 'values': [cells]}
+
+    # 시트에는 조건부 쓰기가 없어서, 쓰기 직전에 저널의 base_seq 행이 비어 있는지 읽어 보고 씁니다.
+    # (읽기와 쓰기 사이의 짧은 틈은 막지 못합니다. 여러 서버를 돌리려면 SQLite 쪽이 안전합니다)
+    def write(self, changes, base_seq=None):
+        self._open_worksheets()
+        with self.lock:
+            if self.check_journal and base_seq is not None:
+                title = SHEET_NAMES[JOURNAL]
+                _api('values_get')
+                if self._spreadsheet().values_get(f"{title}!A{base_seq}:A{base_seq}").get('values'):
+                    raise WriteConflict(f"저널 {base_seq}번에 다른 서버의 이벤트가 있습니다")
+            # 아직 안 읽은 엔티티에 쓰려면 기존 행 위치부터 읽어 둡니다 (뒤늦게 읽는 기록이나, 로드에 실패한 채 시작한 경우)
+            missing = [entity for entity in changes if entity != JOURNAL and entity not in self.loaded]
+            if missing:
+                self.load(missing)
+            self._write(changes)
+
+    def _write(self, changes):
+        data = []
+        widths = []
+        deleted = []
+        with metrics.span('save.encode', backend='sheets'):
+            for entity, items in changes.items():
+                for key, value in items.items():
+                    if entity == JOURNAL:
+                        self._ensure_rows(entity, key)
+                        cells = [str(key)] + encode_cell(value, self.compress)
+                        data.append(self._row_update(entity, key, cells))
+                        widths.append((entity, key, len(cells)))
+                        continue
+                    key = str(key)
+                    row_no = self.row_of[entity].get(key)
+                    if value is None:
+                        if row_no is None:
+                            continue
+                        cells = []
+                        deleted.append((entity, key, row_no))
+                    else:
+                        if row_no is None:
+                            row_no = self.row_of[entity][key] = self._alloc_row(entity)
+                        cells = [key] + encode_cell(value, self.compress)
+                    data.append(self._row_update(entity, row_no, cells))
+                    widths.append((entity, row_no, len(cells)))
+        if data:
+            metrics.count('payload_bytes', sum(len(cell) for update in data for cell in update['values'][0]), backend='sheets')
+            _api('values_batch_update')
+            with metrics.span('save.send', backend='sheets'):
+                self._spreadsheet().values_batch_update({'valueInputOption': 'RAW', 'data': data})
+        # 칸 수와 지운 줄은 업로드가 성공한 뒤에만 반영합니다 (실패하면 다음 저장 때 같은 범위를 다시 씀)
+        for entity, row_no, width in widths:
+            self.row_width[entity][row_no] = width
+        for entity, key, row_no in deleted:
+            del self.row_of[entity][key]
+            self.free_rows[entity].append(row_no)
+
+
+# --- [SQLite (WAL): 한 대의 서버용 로컬 저장소] ---
+# 주문/체결/계정을 인덱스가 있는 테이블에 나눠 담고, write() 한 번(=주문 단위 변경분)을 트랜잭션 하나로 커밋합니다.
+# 구글 인증이 필요 없어서 테스트/벤치마크용 저장소로도 씁니다.
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS accounts (user_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS markets (code TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS orders (
+    id INTEGER PRIMARY KEY, code TEXT NOT NULL, side TEXT NOT NULL,
+    price INTEGER NOT NULL, user_id TEXT NOT NULL, data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_book ON orders (code, side, price, id);
+CREATE INDEX IF NOT EXISTS orders_user ON orders (user_id);
+CREATE TABLE IF NOT EXISTS trades (seq INTEGER PRIMARY KEY, code TEXT, buyer TEXT, seller TEXT, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS trades_code ON trades (code, seq);
+CREATE INDEX IF NOT EXISTS trades_buyer ON trades (buyer, seq);
+CREATE INDEX IF NOT EXISTS trades_seller ON trades (seller, seq);
+CREATE TABLE IF NOT EXISTS board (seq INTEGER PRIMARY KEY, code TEXT NOT NULL, data TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS board_code ON board (code, seq);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, data TEXT NOT NULL);
+CREATE TABLE IF NOT EXISTS journal (seq INTEGER PRIMARY KEY, kind TEXT NOT NULL, data TEXT NOT NULL);
+"""
+
+# 엔티티 -> (테이블, 키 컬럼, 값에서 뽑아 따로 저장할 인덱스 컬럼)
+SQLITE_TABLES = {
+    'users': ('accounts', 'user_id', ()),
+    'markets': ('markets', 'code', ()),
+    'orders': ('orders', 'id', ('code', 'type', 'price', 'user')),
+    'trades': ('trades', 'seq', ('code', 'buyer', 'seller')),
+    'board': ('board', 'seq', ('code',)),
+    'meta': ('meta', 'key', ()),
+    JOURNAL: ('journal', 'seq', ('kind',)),
+}
+SQLITE_COLUMNS = {'type': 'side', 'user': 'user_id'}
+
+class SqliteBackend(StorageBackend):
+    write_interval = 0.0
+
+    def __init__(self, path, legacy_path='elpis_db.json'):
+        self.path = path
+        self.legacy_path = legacy_path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=FULL")
+        self.conn.executescript(SQLITE_SCHEMA)
+
+    def load(self, entities=ENTITIES):
+        rows = {}
+        with self.lock:
+            for entity in entities:
+                table, key_col, _ = SQLITE_TABLES[entity]
+                cursor = self.conn.execute(f"SELECT {key_col}, data FROM {table} ORDER BY {key_col}")
+                rows[entity] = {key: json.loads(data) for key, data in cursor}
+        if not any(rows.values()):
+            return None
+        return rows
+
+    def load_journal(self, after):
+        with self.lock:
+            cursor = self.conn.execute("SELECT seq, data FROM journal WHERE seq >= ? ORDER BY seq", (after,))
+            return [(seq, json.loads(data)) for seq, data in cursor]
+
+    # README에 남아 있는 예전 로컬 파일 형식 (elpis_db.json)
+    def load_legacy(self):
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            with open(self.legacy_path, 'r') as f:
+                return json.load(f)
+        return None
+
+    # 쓰기 잠금을 먼저 잡은 채 다시 읽고 쓰므로, 충돌 뒤 재시도는 다른 프로세스에 다시 밀리지 않습니다.
+    # (write()가 커밋하면 잠금이 풀립니다)
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            finally:
+                if self.conn.in_transaction:
+                    self.conn.rollback()
+
+    # BEGIN IMMEDIATE로 쓰기 잠금을 먼저 잡고 저널 끝 순번을 확인하므로, 같은 파일을 쓰는 여러 프로세스 사이에서도
+    # 확인과 쓰기가 한 트랜잭션으로 묶입니다.
+    def write(self, changes, base_seq=None):
+        with metrics.span('save.encode', backend='sqlite'):
+            statements = []
+            payload = 0
+            for entity, items in changes.items():
+                table, key_col, fields = SQLITE_TABLES[entity]
+                columns = [key_col] + [SQLITE_COLUMNS.get(f, f) for f in fields] + ['data']
+                upsert = f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}) VALUES ({', '.join('?' * len(columns))})"
+                upserts = []
+                deletes = []
+                for key, value in items.items():
+                    if value is None:
+                        deletes.append((key,))
+                    else:
+                        data = json.dumps(value, ensure_ascii=False)
+                        payload += len(data)
+                        upserts.append((key, *(value.get(f) for f in fields), data))
+                if deletes:
+                    statements.append((f"DELETE FROM {table} WHERE {key_col} = ?", deletes))
+                if upserts:
+                    statements.append((upsert, upserts))
+        metrics.count('payload_bytes', payload, backend='sqlite')
+        with metrics.span('save.send', backend='sqlite'), self.lock, self.conn:
+            if not self.conn.in_transaction:
+                self.conn.execute("BEGIN IMMEDIATE")
+            if base_seq is not None:
+                head = self.conn.execute("SELECT COALESCE(MAX(seq), 0) + 1 FROM journal").fetchone()[0]
+                if head != base_seq:
+                    raise WriteConflict(f"저널이 {head - 1}번까지 있습니다 (이 서버는 {base_seq - 1}번까지 반영)")
+            for sql, rows in statements:
+                self.conn.executemany(sql, rows)
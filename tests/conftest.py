@@ -0,0 +1,50 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from events import replay
+from state import ExchangeState, data_from_rows, default_data
+from storage import SqliteBackend
+import database
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = SqliteBackend(str(tmp_path / 'elpis.sqlite'), legacy_path=None)
+    yield store
+    store.conn.close()
+
+
+# 기본 데이터 스냅샷 하나를 올려 둔 저장소
+@pytest.fixture
+def seeded(store):
+    state = ExchangeState(default_data())
+    state.mark_all_dirty()
+    database._upload(state, snapshot=True, store=store)
+    return store
+
+
+# load_db()처럼 스냅샷 줄 전부를 읽고 그 뒤 저널을 다시 적용합니다
+def cold_load(store):
+    data = data_from_rows(store.load())
+    state = ExchangeState(data)
+    replay(state, store.load_journal(data.get('next_event_seq', 1)))
+    return state
+
+
+# 저장소에 올라가는 형식으로 비교합니다 (튜플/리스트 차이는 JSON으로 맞춥니다)
+def dump(state):
+    with state.lock:
+        users = set(state.user_db) | set(state.user_states)
+        return json.loads(json.dumps({
+            'users': {key: state._row('users', key) for key in users},
+            'markets': {key: state._row('markets', key) for key in state.market_data},
+            'orders': {str(key): state._row('orders', key) for key in state.open_orders},
+            'trades': state.trades.trades,
+            'board': sorted(state.board.rows(), key=lambda e: e[0]),
+            'counters': state._row('meta', 'counters'),
+        }, sort_keys=True, default=list))
@@ -0,0 +1,63 @@
+import pytest
+
+from conftest import cold_load, dump
+from events import record
+from storage import WriteConflict
+import database
+
+T = "2026-01-05 10:00:00"
+
+
+# 서버 두 대(A, B)가 같은 SQLite 저장소를 씁니다. A가 먼저 매도 주문을 올리고, 그걸 모르는 B가 같은 가격에 매수합니다.
+def test_conflict_resync_reapplies_and_reports(seeded):
+    store = seeded
+    a = cold_load(store)
+    b = cold_load(store)
+
+    sell = record(a, {'kind': 'order', 'user': 'pppp2', 'side': 'SELL', 'code': 'pppp2', 'price': 10000, 'qty': 5, 'time': T})
+    database._upload(a, store=store)
+    assert sell[0]
+
+    # B가 보기에는 매도 호가가 없어서 그대로 걸립니다
+    buy = record(b, {'kind': 'order', 'user': 'pppp1', 'side': 'BUY', 'code': 'pppp2', 'price': 10000, 'qty': 3, 'time': T})
+    assert buy == (True, "0주 체결, 3주 대기 중")
+    assert not b.trades.trades
+
+    # 같은 순번에 쓰려고 하면 충돌로 막힙니다
+    changes = b.take_changes()
+    with pytest.raises(WriteConflict):
+        store.write(changes, b.persisted_seq)
+    b.requeue(changes)
+
+    # 저장기는 다시 읽어 A의 이벤트 뒤에 B의 주문을 다시 적용하고, 바뀐 결과를 알려 둡니다
+    database._upload(b, store=store)
+    assert b.persisted_seq == b.next_event_seq
+
+    assert b.account('pppp1')['portfolio']['pppp2']['qty'] == 3
+    [order] = b.open_orders.values()
+    assert (order['user'], order['qty']) == ('pppp2', 2)
+    assert len(b.trades.trades) == 1
+
+    [revision] = b.take_revisions('pppp1')
+    assert revision['event']['side'] == 'BUY'
+    assert revision['before'] == (True, "0주 체결, 3주 대기 중")
+    assert revision['after'] == (True, "전량 체결 완료!")
+    assert b.take_revisions('pppp1') == []
+
+    # 저장소에서 새로 읽어도 B와 같은 상태입니다
+    assert dump(cold_load(store)) == dump(b)
+
+
+def test_conflict_without_changed_outcome_has_no_revision(seeded):
+    store = seeded
+    a = cold_load(store)
+    b = cold_load(store)
+
+    record(a, {'kind': 'message', 'user': 'pppp1', 'code': 'IU', 'msg': 'A', 'time': '10:00'})
+    database._upload(a, store=store)
+    record(b, {'kind': 'message', 'user': 'pppp2', 'code': 'IU', 'msg': 'B', 'time': '10:01'})
+    database._upload(b, store=store)
+
+    assert b.take_revisions('pppp2') == []
+    assert [m['msg'] for _, m in sorted(b.board.rows(), key=lambda e: e[0])][-2:] == ['A', 'B']
+    assert dump(cold_load(store)) == dump(b)
@@ -0,0 +1,52 @@
+import pytest
+
+from conftest import cold_load
+from events import record
+from storage import ENTITIES, SqliteBackend
+import database
+
+
+# 처음 load 몇 번은 실패하는 저장소 (시트 일시 오류 흉내)
+class FlakyBackend(SqliteBackend):
+    def __init__(self, path, failures):
+        super().__init__(path, legacy_path=None)
+        self.failures = failures
+
+    def load(self, entities=ENTITIES):
+        if self.failures:
+            self.failures -= 1
+            raise ConnectionError("저장소 응답 없음")
+        return super().load(entities)
+
+
+@pytest.fixture
+def use_store(monkeypatch):
+    def use(store):
+        monkeypatch.setattr(database, 'get_store', lambda: store)
+        database.get_state.clear()
+    yield use
+    database.get_state.clear()
+
+
+def test_load_error_is_not_cached_or_overwritten(seeded, tmp_path, use_store):
+    state = cold_load(seeded)
+    record(state, {'kind': 'register', 'user': 'real', 'pw': 'pw', 'name': '진짜'})
+    database._upload(state, snapshot=True, store=seeded)
+    before = seeded.load()
+
+    flaky = FlakyBackend(str(tmp_path / 'elpis.sqlite'), failures=1)
+    use_store(flaky)
+    with pytest.raises(ConnectionError):
+        database.get_state()
+    assert seeded.load() == before
+
+    loaded = database.get_state()
+    assert 'real' in loaded.user_db
+    assert loaded.next_event_seq == state.next_event_seq
+
+
+def test_empty_store_is_seeded_with_defaults(store, use_store):
+    use_store(store)
+    state = database.get_state()
+    assert 'test' in state.user_db
+    assert store.load()['users'].keys() == state.user_states.keys()
@@ -0,0 +1,43 @@
+from exchange import Exchange
+
+
+def test_reads_do_not_create_accounts():
+    ex = Exchange()
+    assert ex.account('nobody') is None
+    assert ex.portfolio('nobody') is None
+    assert ex.valuation('nobody') is None
+    assert 'nobody' not in ex.state.user_states
+
+    ex.register('nobody', 'pw', '새 유저')
+    assert ex.account('nobody').balance == ex.valuation('nobody').total
+    assert ex.portfolio('nobody') == []
+
+
+def test_open_orders_follow_fills_and_cancels():
+    ex = Exchange()
+    t = "2026-01-05 10:00:00"
+    ex.submit('pppp1', 'SELL', 'pppp1', 100, 3, time=t)
+    ex.submit('pppp1', 'SELL', 'pppp1', 110, 2, time=t)
+    first, second = ex.open_orders('pppp1')
+    assert (first['price'], second['price']) == (100, 110)
+
+    ex.submit('pppp2', 'BUY', 'pppp1', 100, 1, time=t)
+    assert [o['qty'] for o in ex.open_orders('pppp1')] == [2, 2]
+    ex.cancel('pppp1', second['id'])
+    ex.submit('pppp3', 'BUY', 'pppp1', 100, 2, time=t)
+    assert ex.open_orders('pppp1') == []
+    assert ex.open_orders('pppp2') == []
+
+
+def test_single_orders_are_checked_like_batches():
+    ex = Exchange()
+    t = "2026-01-05 10:00:00"
+    balance = ex.account('test').balance
+    assert ex.submit('test', 'BUY', 'IU', 50000, -10, time=t) == (False, "가격과 수량은 0보다 커야 합니다.")
+    assert ex.submit('test', 'BUY', 'IU', 0, 1, time=t) == (False, "가격과 수량은 0보다 커야 합니다.")
+    assert ex.submit('test', 'HOLD', 'IU', 50000, 1, time=t) == (False, "잘못된 주문입니다.")
+    assert ex.submit('test', 'BUY', 'NOPE', 50000, 1, time=t) == (False, "잘못된 주문입니다.")
+    assert ex.submit_many('test', [{'type': 'SELL', 'code': 'IU', 'price': 50000, 'qty': -1}], time=t) == \
+        [(False, "가격과 수량은 0보다 커야 합니다.")]
+    assert ex.account('test').balance == balance
+    assert ex.open_orders('test') == []
@@ -0,0 +1,89 @@
+import random
+
+import pytest
+
+from orderbook import OrderBook
+
+
+# 비교용 단순 매처: 대기 주문을 리스트 하나에 들어온 순서대로 두고, 매번 가격-시간 순으로 정렬해서 체결합니다
+class NaiveBook:
+    def __init__(self):
+        self.orders = []
+
+    def match(self, side, price, qty, user_id):
+        if side == 'BUY':
+            crossing = sorted((o for o in self.orders if o['type'] == 'SELL' and o['price'] <= price), key=lambda o: o['price'])
+        else:
+            crossing = sorted((o for o in self.orders if o['type'] == 'BUY' and o['price'] >= price), key=lambda o: -o['price'])
+        fills = []
+        for order in crossing:
+            if qty <= 0:
+                break
+            if order['user'] == user_id:
+                continue
+            match_qty = min(qty, order['qty'])
+            order['qty'] -= match_qty
+            qty -= match_qty
+            fills.append((order['id'], match_qty))
+        self.orders = [o for o in self.orders if o['qty'] > 0]
+        return fills
+
+    def top_levels(self, side, n):
+        totals = {}
+        for order in self.orders:
+            if order['type'] == side:
+                total = totals.setdefault(order['price'], [0, 0])
+                total[0] += order['qty']
+                total[1] += 1
+        prices = sorted(totals, reverse=side == 'BUY')[:n]
+        return [(p, totals[p][0], totals[p][1]) for p in prices]
+
+
+def check_same(book, naive, levels=5):
+    bids, asks = naive.top_levels('BUY', levels), naive.top_levels('SELL', levels)
+    assert book.top_levels('BUY', levels) == bids
+    assert book.top_levels('SELL', levels) == asks
+    assert book.best_bid() == (bids[0][0] if bids else None)
+    assert book.best_ask() == (asks[0][0] if asks else None)
+
+
+# 주문/체결/취소/본인 주문 건너뛰기를 섞어서, 힙 걷기와 지연 삭제, 레벨별 잔량 합계가 단순 매처와 같은지 봅니다
+@pytest.mark.parametrize('seed', range(100))
+def test_matches_naive_price_time_book(seed):
+    rnd = random.Random(seed)
+    book, naive = OrderBook('X'), NaiveBook()
+    next_id = 1
+    for _ in range(400):
+        if naive.orders and rnd.random() < 0.25:
+            target = rnd.choice(naive.orders)
+            order = book.live[target['id']]
+            assert book.remove(order)
+            assert not book.remove(order)
+            naive.orders.remove(target)
+        else:
+            side = rnd.choice(('BUY', 'SELL'))
+            price = rnd.randint(95, 105) * 100
+            qty = rnd.randint(1, 20)
+            user = rnd.choice('uvw')
+            fills = book.match(side, price, qty, user)
+            assert [(o['id'], q) for o, q in fills] == naive.match(side, price, qty, user)
+            rest = qty - sum(q for _, q in fills)
+            if rest > 0:
+                order = {'id': next_id, 'code': 'X', 'type': side, 'price': price, 'qty': rest, 'user': user}
+                book.add(order)
+                naive.orders.append(dict(order))
+                next_id += 1
+        check_same(book, naive)
+    check_same(book, naive, levels=1000)
+    assert sorted(o['id'] for o in book.orders()) == sorted(o['id'] for o in naive.orders)
+
+
+def test_depth_snapshot_is_cached_until_the_book_changes():
+    book = OrderBook('X')
+    book.add({'id': 1, 'code': 'X', 'type': 'BUY', 'price': 100, 'qty': 5, 'user': 'u'})
+    first = book.depth()
+    assert book.depth() is first
+    assert first['bids'] == ((100, 5, 1),)
+    book.match('SELL', 100, 2, 'v')
+    assert book.depth()['bids'] == ((100, 3, 1),)
+    assert book.depth()['version'] != first['version']
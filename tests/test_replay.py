@@ -0,0 +1,131 @@
+import random
+
+import pytest
+
+from conftest import cold_load, dump
+from exchange import Exchange
+import database
+import events
+
+USERS = ['test', 'pppp1', 'pppp2', 'pppp3', 'pppp4', 'pppp5']
+
+
+# 시드를 고정한 임의 작업: 가입/상장/주문/묶음 주문/취소/채굴/토론방/프로필. 시각도 가상 시각을 씁니다.
+def workload(ex, seed, steps):
+    rng = random.Random(seed)
+    users = list(USERS)
+    for step in range(steps):
+        minute, second = divmod(step, 60)
+        t = f"2026-01-05 {10 + minute // 60:02d}:{minute % 60:02d}:{second:02d}"
+        user = rng.choice(users)
+        codes = list(ex.state.market_data)
+        roll = rng.random()
+        if roll < 0.02:
+            new = f"u{step}"
+            ex.register(new, 'pw', f"유저{step}")
+            users.append(new)
+        elif roll < 0.04:
+            ex.list_ipo(user, rng.choice([1000, 5000, 10000]), rng.randint(10, 1000))
+        elif roll < 0.55:
+            code = rng.choice(codes)
+            price = max(ex.state.market_data[code]['price'] * rng.choice([95, 98, 100, 102, 105]) // 100, 1)
+            ex.submit(user, rng.choice(['BUY', 'SELL']), code, price, rng.randint(1, 20), time=t)
+        elif roll < 0.65:
+            orders = [{'type': rng.choice(['BUY', 'SELL']), 'code': code, 'price': ex.state.market_data[code]['price'], 'qty': rng.randint(1, 5)}
+                      for code in rng.sample(codes, 2)]
+            ex.submit_many(user, orders, time=t)
+        elif roll < 0.8:
+            mine = [o['id'] for o in ex.open_orders(user)]
+            ex.cancel(user, rng.choice(mine) if mine and rng.random() < 0.8 else rng.randint(1, 10 ** 6))
+        elif roll < 0.9:
+            ex.mine(user, time=t + f".{step:06d}")
+        elif roll < 0.97:
+            ex.post_message(user, rng.choice(codes), f"메시지 {step}", time=t[11:16])
+        else:
+            ex.update_profile(user, vision=f"소개 {step}", likes=rng.sample(codes, 2))
+
+
+# 스냅샷을 마지막에 올려서 저널 꼬리가 없는 경우
+def test_cold_load_matches_after_snapshot(seeded):
+    store = seeded
+    ex = Exchange(cold_load(store))
+    workload(ex, seed=1, steps=400)
+    database._upload(ex.state, snapshot=True, store=store)
+
+    loaded = cold_load(store)
+    assert loaded.next_event_seq == ex.state.next_event_seq
+    assert not store.load_journal(loaded.next_event_seq)
+    assert dump(loaded) == dump(ex.state)
+
+
+# 스냅샷 뒤에 저널만 길게 쌓인 경우 (SNAPSHOT_EVERY를 넘겨도 스냅샷을 올리지 않습니다)
+@pytest.mark.parametrize('seed', [2, 3])
+def test_cold_load_matches_with_long_journal_tail(seeded, seed):
+    store = seeded
+    state = cold_load(store)
+    ex = Exchange(state)
+    workload(ex, seed=seed, steps=300)
+    database._upload(state, snapshot=True, store=store)
+    tail_start = state.next_event_seq
+
+    for chunk in range(8):
+        workload(ex, seed=seed * 100 + chunk, steps=100)
+        with state.lock:
+            changes = state.take_changes(False)
+            base_seq, next_seq = state.persisted_seq, state.next_event_seq
+        store.write(changes, base_seq)
+        state.mark_persisted(next_seq)
+
+    assert state.next_event_seq - tail_start > 800
+    loaded = cold_load(store)
+    assert loaded.next_event_seq == state.next_event_seq
+    assert dump(loaded) == dump(state)
+
+
+# 잘못된 이벤트는 저널에 남지 않아서, 저장 후 콜드 스타트가 멈추지 않습니다
+def test_invalid_events_are_not_journaled(seeded):
+    store = seeded
+    ex = Exchange(cold_load(store))
+    start = ex.state.next_event_seq
+    assert ex.submit('test', 'BUY', 'IU', 100, 1, time="어제") == (False, "잘못된 요청입니다.")
+    assert ex.submit_many('test', [{'type': 'BUY', 'code': 'IU', 'price': 100, 'qty': 1}], time=12) == [(False, "잘못된 주문입니다.")]
+    assert ex.mine('test', time="2026-01-05") == (False, 0)
+    assert ex.update_profile('test', likes=3) == (False, "잘못된 요청입니다.")
+    assert ex.list_ipo('test', 1000, -5) == (False, "잘못된 요청입니다.")
+    assert ex.state.next_event_seq == start
+    assert not ex.state.appended['journal']
+
+    # 상태에 따라 거절되는 주문은 저널에 남고, replay해도 똑같이 거절됩니다
+    ex.mine('test', time="2026-01-05 10:00:00.000000")
+    assert ex.submit('test', 'BUY', 'NOPE', 100, 1, time="2026-01-05 10:00:00") == (False, "잘못된 주문입니다.")
+    assert ex.submit('test', 'BUY', 'IU', 10 ** 9, 1, time="2026-01-05 10:00:00") == (False, "이드(잔고)가 부족합니다.")
+    database._upload(ex.state, store=store)
+    assert dump(cold_load(store)) == dump(ex.state)
+
+
+# 처리 중 예외가 나면 그 이벤트의 저널 줄을 되돌리고 예외를 그대로 올립니다
+def test_failed_event_is_dropped_from_journal(seeded, monkeypatch):
+    ex = Exchange(cold_load(seeded))
+    start = ex.state.next_event_seq
+
+    def broken(state, event):
+        state.journal({'kind': 'fill'})
+        raise RuntimeError("boom")
+
+    monkeypatch.setitem(events.HANDLERS, 'message', broken)
+    with pytest.raises(RuntimeError):
+        ex.post_message('test', 'IU', 'hi', time='10:00')
+    assert ex.state.next_event_seq == start
+    assert not ex.state.appended['journal']
+
+
+# 예전에 검사 없이 저장된 잘못된 이벤트는 replay에서 건너뜁니다
+def test_replay_skips_invalid_journal_rows(seeded):
+    store = seeded
+    state = cold_load(store)
+    seq = state.next_event_seq
+    store.write({'journal': {seq: {'kind': 'order', 'user': 'test', 'side': 'BUY', 'code': 'NOPE', 'price': 100, 'qty': 1,
+                                   'time': "2026-01-05 10:00:00"}}}, seq)
+    loaded = cold_load(store)
+    assert loaded.next_event_seq == seq + 1
+    assert dump(loaded)['users'] == dump(state)['users']
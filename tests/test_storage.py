@@ -0,0 +1,23 @@
+import pytest
+
+from storage import SqliteBackend, StorageBackend
+
+
+def test_backend_missing_a_method_fails_at_construction():
+    class NoWrite(StorageBackend):
+        def load(self, entities=None):
+            return None
+
+        def load_journal(self, after):
+            return []
+
+    with pytest.raises(TypeError):
+        NoWrite()
+
+
+def test_sqlite_backend_round_trip(store):
+    assert isinstance(store, SqliteBackend)
+    assert store.load() is None
+    store.write({'users': {'a': {'pw': '1'}}, 'journal': {1: {'kind': 'register', 'user': 'a'}}}, base_seq=1)
+    assert store.load()['users'] == {'a': {'pw': '1'}}
+    assert store.load_journal(1) == [(1, {'kind': 'register', 'user': 'a'})]
@@ -0,0 +1,41 @@
+# --- [체결 내역 저장소] ---
+# 체결은 시간순으로 뒤에 추가만 하고(O(1)), 유저별/종목별로 위치 목록을 따로 들고 있습니다.
+# 조회는 최신순으로 뒤에서부터 필요한 만큼만 꺼내므로, 전체 체결 수와 상관없이 한 페이지 분량만 봅니다.
+class TradeStore:
+    def __init__(self, trades=()):
+        self.trades = []
+        self.by_user = {}
+        self.by_code = {}
+        for trade in trades:
+            self.append(trade)
+
+    def append(self, trade):
+        pos = len(self.trades)
+        self.trades.append(trade)
+        for user_id in {trade.get('buyer'), trade.get('seller')}:
+            if user_id:
+                self.by_user.setdefault(user_id, []).append(pos)
+        if trade.get('code'):
+            self.by_code.setdefault(trade['code'], []).append(pos)
+
+    def __len__(self):
+        return len(self.trades)
+
+    # 최신순 이터레이터 (positions가 없으면 전체, 있으면 그 위치들만)
+    def latest(self, positions=None, offset=0, limit=None):
+        size = len(self.trades) if positions is None else len(positions)
+        stop = -1 if limit is None else max(size - 1 - offset - limit, -1)
+        for i in range(size - 1 - offset, stop, -1):
+            yield self.trades[i if positions is None else positions[i]]
+
+    def count_for_user(self, user_id):
+        return len(self.by_user.get(user_id, ()))
+
+    def for_user(self, user_id, offset=0, limit=None):
+        return list(self.latest(self.by_user.get(user_id, []), offset, limit))
+
+    def count_for_code(self, code):
+        return len(self.by_code.get(code, ()))
+
+    def for_code(self, code, offset=0, limit=None):
+        return list(self.latest(self.by_code.get(code, []), offset, limit))
@@ -1,13 +1,28 @@
 import streamlit as st
+from streamlit.errors import StreamlitAPIException
 import pandas as pd
 import datetime
 import plotly.graph_objects as go
-import time
 import random
 import base64
-
-from database import save_db
-from logic import place_order, mining, save_current_user_state
+import os
+
+from database import get_state, get_writer
+import metrics
+from logic import place_order, cancel_order, mining, list_ipo, post_message, update_profile, current_account
+from pricehistory import lttb
+
+TRADES_PER_PAGE = 20     # 체결 내역 한 페이지에 보여 줄 건수
+BOARD_PAGE_SIZE = 20     # 토론방 한 페이지에 보여 줄 메시지 수
+LIVE_REFRESH = 2         # 현재가 화면(가격/호가/차트) 자동 갱신 간격(초)
+SEARCH_SUGGESTIONS = 5   # 현재가 탭 검색창 아래에 보여 줄 추천 종목 수
+LEADERBOARD_SIZE = 20    # 거래소 탭 자산 순위표에 보여 줄 인원
+MOVERS_SIZE = 5          # 거래소 탭 시장 동향 순위마다 보여 줄 종목 수
+CHART_POINTS = 120       # 현재가 차트에 그릴 최대 점 수 (넘으면 LTTB로 줄입니다)
+# 차트 기간 -> 데이터 (None: 최근 체결가, 나머지: 그 해상도 캔들의 종가)
+CHART_RANGES = {"실시간": None, "4시간": '1m', "1주": '1h', "1년": '1d'}
+# 운영 탭을 볼 수 있는 아이디 (쉼표로 구분, 예: ELPIS_ADMINS=admin,ops)
+ADMINS = {name.strip() for name in os.environ.get("ELPIS_ADMINS", "").split(",") if name.strip()}
 
 # --- [황금 동전 이펙트 함수] ---
 def falling_coins():
@@ -36,7 +51,60 @@ def falling_coins():
     coin_html += '</div>'
     
     placeholder.markdown(coin_html, unsafe_allow_html=True)
-    time.sleep(0.1)
+
+# --- [결과 알림] ---
+# 주문/상장/등록 결과는 세션에 담아 두고, 다음 실행(페이지 전체든 조각이든)의 맨 앞에서 토스트로 띄웁니다.
+# 예전처럼 메시지를 보여 주려고 time.sleep()으로 서버 스레드를 붙잡아 둘 필요가 없습니다.
+def notify(msg, icon="✅"):
+    st.session_state.setdefault('notices', []).append((msg, icon))
+
+def show_notices():
+    for msg, icon in st.session_state.pop('notices', []):
+        st.toast(msg, icon=icon)
+
+# --- [저장 충돌로 다시 처리된 내 이벤트] ---
+# 다른 서버와 저장이 충돌하면 못 올린 이벤트를 최신 상태 위에 다시 적용하는데(database._resync), 그때 결과가
+# 처음 알려 준 것과 달라진 것을 '확인'을 누를 때까지 보여 줍니다.
+SIDE_NAMES = {'BUY': "매수", 'SELL': "매도"}
+
+def describe_event(event):
+    kind = event['kind']
+    if kind == 'order':
+        return f"{event['code']} {SIDE_NAMES.get(event['side'], event['side'])} {event['qty']:,}주 @ {event['price']:,}"
+    if kind == 'orders':
+        return f"묶음 주문 {len(event['orders'])}건"
+    if kind == 'cancel':
+        return f"주문 #{event['order_id']} 취소"
+    if kind == 'ipo':
+        return f"상장 {event['qty']:,}주 @ {event['price']:,}"
+    return kind
+
+def result_text(result):
+    if isinstance(result, list):
+        return " / ".join(result_text(r) for r in result)
+    if isinstance(result, tuple) and len(result) == 2:
+        ok, msg = result
+        return msg if isinstance(msg, str) and msg else ("성공" if ok else "실패")
+    return str(result)
+
+def show_revisions(state, user_id):
+    revisions = st.session_state.setdefault('revisions', [])
+    revisions += state.take_revisions(user_id)
+    if not revisions:
+        return
+    for revision in revisions:
+        st.warning(f"저장 충돌로 다시 처리된 {describe_event(revision['event'])}: "
+                   f"처음 '{result_text(revision['before'])}' → 지금 '{result_text(revision['after'])}'", icon="⚠️")
+    if st.button("확인", key="ack_revisions"):
+        st.session_state['revisions'] = []
+        st.rerun()
+
+# 조각 안의 버튼은 보통 그 조각만 다시 실행시키지만, 페이지 전체 실행 중이었다면(테스트 등) 전체를 다시 돌립니다.
+def rerun_fragment():
+    try:
+        st.rerun(scope="fragment")
+    except StreamlitAPIException:
+        st.rerun()
 
 # --- [팝업: 간편 매수] ---
 @st.dialog("⚡ 간편 매수 (Quick Buy)")
@@ -47,7 +115,7 @@ def quick_buy_popup(code, price, name):
     col_info1, col_info2 = st.columns(2)
     col_info1.metric("매수 단가", f"{price:,}")
     
-    current_balance = st.session_state.get('balance_id', 0)
+    current_balance = current_account()['balance_id']
     if price > 0:
         max_buyable = int(current_balance / price)
     else:
@@ -67,8 +135,7 @@ def quick_buy_popup(code, price, name):
     if st.button("매수 체결하기", type="primary", use_container_width=True):
         ok, msg = place_order('BUY', code, price, q_buy)
         if ok:
-            st.success("체결 완료!")
-            time.sleep(1)
+            notify(msg)
             st.rerun()
         else:
             st.error(msg)
@@ -77,12 +144,12 @@ def quick_buy_popup(code, price, name):
 @st.dialog("⚡ 간편 매도 (Quick Sell)")
 def quick_sell_popup(code, price, name):
     user_id = st.session_state['user_info'].get('id')
-    current_portfolio = st.session_state.get('portfolio', {})
+    acct = current_account()
     
-    my_qty = current_portfolio.get(code, {}).get('qty', 0)
+    my_qty = acct['portfolio'].get(code, {}).get('qty', 0)
     
     if code == user_id:
-        my_qty += st.session_state.get('my_elpis_locked', 0)
+        my_qty += acct['my_elpis_locked']
 
     st.markdown(f"<h3 style='text-align:center;'>{name}</h3>", unsafe_allow_html=True)
     st.markdown(f"<p style='text-align:center; color:#8B95A1; font-size:14px;'>{code}</p>", unsafe_allow_html=True)
@@ -99,17 +166,16 @@ def quick_sell_popup(code, price, name):
     st.caption(f"총 정산금액: {total_gain:,.0f} ID")
     
     if st.button("매도 체결하기", type="primary", use_container_width=True):
-        refresh_qty = st.session_state['portfolio'].get(code, {}).get('qty', 0)
+        refresh_qty = acct['portfolio'].get(code, {}).get('qty', 0)
         if code == user_id:
-            refresh_qty += st.session_state.get('my_elpis_locked', 0)
+            refresh_qty += acct['my_elpis_locked']
             
         if refresh_qty < q_sell:
             st.error(f"보유 수량이 부족합니다. (현재: {refresh_qty}주)")
         else:
             ok, msg = place_order('SELL', code, price, q_sell)
             if ok:
-                st.success("매도 체결 완료!")
-                time.sleep(1)
+                notify(msg)
                 st.rerun()
             else:
                 st.error(msg)
@@ -117,19 +183,20 @@ def quick_sell_popup(code, price, name):
 # --- [팝업: 프로필 정보] (JEMI: 화면 딸려감 해결을 위해 모달로 분리) ---
 @st.dialog("👤 프로필 정보")
 def profile_popup(target_id):
-    target_name = st.session_state['user_names'].get(target_id, target_id)
+    state = get_state()
+    target_name = state.user_names.get(target_id, target_id)
     
     p_vision = "정보 없음"
     p_sns = "정보 없음"
     p_photo = None
     
-    if target_id in st.session_state['user_states']:
-        user_data = st.session_state['user_states'][target_id]['my_profile']
+    if target_id in state.user_states:
+        user_data = state.user_states[target_id]['my_profile']
         p_vision = user_data.get('vision', '정보 없음')
         p_sns = user_data.get('sns', '정보 없음')
         p_photo = user_data.get('photo', None)
-    elif target_id in st.session_state['market_data']:
-        p_vision = st.session_state['market_data'][target_id].get('desc', '정보 없음')
+    elif target_id in state.market_data:
+        p_vision = state.market_data[target_id].get('desc', '정보 없음')
     
     st.markdown(f"<div class='profile-card' style='margin-bottom:0px;'><h2>{target_name} <small>({target_id})</small></h2><hr style='border: 0; border-top: 1px solid #F2F4F6;'></div>", unsafe_allow_html=True)
     
@@ -145,99 +212,260 @@ def profile_popup(target_id):
         st.session_state['view_profile_id'] = None
         st.rerun()
 
-# --- [UI 렌더링 메인 함수] ---
-def render_ui():
-    user_id = st.session_state['user_info'].get('id', 'Guest')
-    user_name = st.session_state['user_names'].get(user_id, '사용자')
-
-    if 'uploaded_photo_cache' not in st.session_state:
-        st.session_state['uploaded_photo_cache'] = None
-
-    if 'likes' not in st.session_state['my_profile']:
-        st.session_state['my_profile']['likes'] = []
-
-    # [JEMI FIX] 프로필 뷰를 메인 화면 상단이 아닌 '팝업(Dialog)'으로 처리하여 화면 밀림 방지
-    if st.session_state.get('view_profile_id'):
-        profile_popup(st.session_state['view_profile_id'])
-            
-    tabs = st.tabs(["메인화면", "관심", "현재가", "주문", "잔고", "내역", "거래소"])
-
-    with tabs[0]:
-        with st.container():
-            st.markdown(f"<div style='text-align:center;'>", unsafe_allow_html=True)
-            col_top_spacer, col_top_logout = st.columns([5, 1])
-            with col_top_logout:
-                if st.button("로그아웃", key="logout_btn", type="secondary"):
-                    st.session_state['logged_in'] = False
-                    st.session_state['user_info'] = {}
-                    st.session_state['uploaded_photo_cache'] = None
-                    st.rerun()
-
-            col_profile_info, col_profile_img = st.columns([2.8, 1.2]) 
-            with col_profile_info:
-                st.markdown(f"<h2>{user_name} <span style='font-size:16px; color:#8B95A1'>({user_id})</span></h2>", unsafe_allow_html=True)
-                st.caption(st.session_state['my_profile']['vision'] if st.session_state['my_profile']['vision'] else "나의 비전이 없습니다.")
-            with col_profile_img:
-                profile_img_placeholder = st.empty()
-            st.markdown("</div>", unsafe_allow_html=True)
-        st.markdown("---")
-
-        total_asset = st.session_state['balance_id']
-        for c, d in st.session_state['portfolio'].items():
-            total_asset += (d['qty'] * st.session_state['market_data'][c]['price'])
-
-        with st.container():
-            c1, c2, c3 = st.columns([2, 1, 1])
-            c1.markdown(f"### 💰 총 자산<br><span style='color:#333D4B; font-size:24px; font-weight:bold'>{total_asset:,.0f} ID</span>", unsafe_allow_html=True)
-            c2.metric("보유 이드", f"{st.session_state['balance_id']:,.0f}")
-            c3.metric("내 엘피스", f"{st.session_state['my_elpis_locked']:,}")
-        st.markdown("---")
+# --- [현재가 실시간 조각 (fragment)] ---
+# 가격 헤더, 호가창, 차트는 LIVE_REFRESH초마다 자기 부분만 다시 실행됩니다. (페이지 전체 rerun 없음)
+# 모두 state.market_snapshot()의 버전 붙은 스냅샷을 읽고, 차트 그림은 종목 버전이 바뀔 때만 새로 만듭니다.
+@st.fragment(run_every=LIVE_REFRESH)
+def live_price_header(target):
+    snap = get_state().market_snapshot(target)
+    curr_price = snap['price']
+    change_pct = snap['change']
+
+    # [JEMI FIX] 종목명 텍스트를 버튼으로 변경하여 프로필 팝업 연동
+    if st.button(f"{snap['name']} $ELP-{target}", key="cp_title_btn", type="tertiary"):
+         st.session_state['view_profile_id'] = target
+         st.rerun()
+         
+    pc1, pc2 = st.columns(2)
+    color_cls = "price-up" if change_pct >= 0 else "price-down"
+    pc1.markdown(f"<div class='big-font {color_cls}'>{curr_price:,} ID</div>", unsafe_allow_html=True)
+    pc2.markdown(f"<div class='{color_cls}' style='text-align:right; font-size:18px'>{change_pct}%</div>", unsafe_allow_html=True)
+
+@st.fragment(run_every=LIVE_REFRESH)
+def live_hoga_ladder(target):
+    snap = get_state().market_snapshot(target, levels=5)
+    curr_price = snap['price']
+    is_me = (target == st.session_state['user_info'].get('id'))
+    best_asks = [(p, q) for p, q, _ in reversed(snap['asks'])]
+    best_bids = [(p, q) for p, q, _ in snap['bids']]
+
+    st.markdown("<div class='hoga-container'>", unsafe_allow_html=True)
+    
+    sell_rows_data = []
+    for p, q in best_asks:
+        sell_rows_data.append((p, q))
+    while len(sell_rows_data) < 5:
+        sell_rows_data.insert(0, (None, None))
         
-        st.subheader("📝 프로필 수정")
-        vision = st.text_area("비전", value=st.session_state['my_profile']['vision'])
-        sns = st.text_input("SNS", value=st.session_state['my_profile']['sns'])
+    for p, q in sell_rows_data:
+        c1, c2, c3 = st.columns([1, 1.5, 1], gap="small")
+        with c1: 
+            if q: st.markdown(f"<div class='hoga-row-height' style='text-align:right; padding-right:12px; font-size:12px; color:#4E5968;'>{q:,}</div>", unsafe_allow_html=True)
+            else: st.markdown("", unsafe_allow_html=True)
+        with c2: 
+            if p:
+                if not is_me: 
+                    if st.button(f"{p:,}", key=f"ask_btn_{target}_{p}", type="secondary"):
+                        quick_buy_popup(target, p, snap['name'])
+                else: 
+                     st.markdown(f"<div class='cell-price price-up hoga-row-height'>{p:,}</div>", unsafe_allow_html=True)
+            else:
+                st.markdown("<div class='hoga-row-height'></div>", unsafe_allow_html=True)
+        with c3: 
+            st.markdown("", unsafe_allow_html=True)
+        st.markdown("<hr style='margin:0; border:0; border-bottom:1px solid #F9FAFB;'>", unsafe_allow_html=True)
+
+    st.markdown(f"""
+        <div style='display:flex; height:30px; align-items:center; border-top:1px solid #E5E8EB; border-bottom:1px solid #E5E8EB;'>
+            <div style='flex:1;'></div>
+            <div style='flex:1.2; text-align:center; font-weight:800; font-size:16px; color:#191F28; background-color:#FFF;'>{curr_price:,}</div>
+            <div style='flex:1;'></div>
+        </div>
+    """, unsafe_allow_html=True)
+
+    buy_rows_data = []
+    for p, q in best_bids:
+        buy_rows_data.append((p, q))
+    while len(buy_rows_data) < 5:
+        buy_rows_data.append((None, None))
         
-        if st.button("저장", type="primary"):
-            st.session_state['my_profile']['vision'] = vision
-            st.session_state['my_profile']['sns'] = sns
-            save_current_user_state(user_id) 
+    for p, q in buy_rows_data:
+        c1, c2, c3 = st.columns([1, 1.6, 1], gap="small")
+        with c1: 
+             st.markdown("", unsafe_allow_html=True)
+        with c2: 
+            if p:
+                if is_me: 
+                    if st.button(f"{p:,}", key=f"bid_btn_{target}_{p}", type="secondary"):
+                        quick_sell_popup(target, p, snap['name'])
+                else:
+                    st.markdown(f"<div class='cell-price price-down hoga-row-height'>{p:,}</div>", unsafe_allow_html=True)
+            else:
+                st.markdown("<div class='hoga-row-height'></div>", unsafe_allow_html=True)
+        with c3: 
+            if q: st.markdown(f"<div class='hoga-row-height' style='text-align:left; padding-left:12px; font-size:12px; color:#4E5968;'>{q:,}</div>", unsafe_allow_html=True)
+            else: st.markdown("", unsafe_allow_html=True)
+        st.markdown("<hr style='margin:0; border:0; border-bottom:1px solid #F9FAFB;'>", unsafe_allow_html=True)
+    
+    st.markdown("</div>", unsafe_allow_html=True)
+
+# (종목, 기간, 종목 버전)별로 한 번만 그리고 모든 세션이 같은 그림을 씁니다. (_history는 캐시 키에서 빠집니다)
+# 점은 CHART_POINTS개까지만 WebGL(Scattergl)로 그리므로, 체결이 쌓여도 그리는 시간과 보내는 크기가 일정합니다.
+# 2초마다 다시 돌아도 버전이 그대로면 그림을 새로 만들지 않고 캐시된 것을 그대로 씁니다.
+@st.cache_resource(max_entries=256, show_spinner=False)
+def market_chart(code, chart_range, version, _history):
+    res = CHART_RANGES[chart_range]
+    with get_state().lock:
+        xs, ys = _history.series(res)
+    xs, ys = lttb(xs, ys, CHART_POINTS)
+    if res is not None:
+        xs = [datetime.datetime.fromtimestamp(x, datetime.timezone.utc).replace(tzinfo=None) for x in xs]
+    fig = go.Figure()
+    fig.add_trace(go.Scattergl(x=xs, y=ys, mode='lines', line=dict(color='#E22A2A', width=2), hovertemplate='%{y:,} ID<extra></extra>'))
+    fig.update_layout(height=200, margin=dict(l=10, r=10, t=10, b=10), dragmode=False, paper_bgcolor='white', plot_bgcolor='#F2F4F6')
+    fig.update_xaxes(showticklabels=res is not None)
+    return fig
+
+@st.fragment(run_every=LIVE_REFRESH)
+def live_price_chart(target):
+    state = get_state()
+    snap = state.market_snapshot(target)
+    chart_range = st.radio("기간", list(CHART_RANGES), horizontal=True, key="chart_range", label_visibility="collapsed")
+    st.plotly_chart(market_chart(target, chart_range, snap['version'][0], state.history(target)), use_container_width=True, config={'staticPlot': False, 'displayModeBar': False})
+
+# --- [입력 폼 조각 (fragment)] ---
+# 폼마다 자기 조각만 다시 실행되므로, 주문 한 번에 페이지 전체(다른 탭 포함)를 다시 그리지 않습니다.
+# 성공하면 notify()로 결과를 남기고 그 조각만 rerun해서 잔고/수량을 새 값으로 보여 줍니다.
+@st.fragment
+def profile_form(user_id):
+    show_notices()
+    acct = get_state().account(user_id)
+    st.subheader("📝 프로필 수정")
+    vision = st.text_area("비전", value=acct['my_profile']['vision'])
+    sns = st.text_input("SNS", value=acct['my_profile']['sns'])
+    
+    if st.button("저장", type="primary"):
+        update_profile(user_id, vision=vision, sns=sns)
+        notify("프로필을 저장했습니다.")
+        rerun_fragment()
+
+@st.fragment
+def buy_form(target):
+    show_notices()
+    state = get_state()
+    acct = current_account()
+    market = state.market_data[target]
+    st.markdown(f"#### 가용: <span style='color:#3182F6'>{acct['balance_id']:,.0f} ID</span>", unsafe_allow_html=True)
+    buy_price = st.number_input("매수 희망가 (ID)", min_value=1, value=market['price'], step=100, key="buy_price_main")
+    buy_qty = st.number_input("매수 수량 (주)", min_value=1, value=10, step=1, key="buy_qty_main")
+    
+    if st.button("🔴 매수 주문 전송", type="primary"):
+        ok, msg = place_order('BUY', target, buy_price, buy_qty)
+        if ok: notify(msg); rerun_fragment()
+        else: st.error(msg)
+
+@st.fragment
+def ipo_form(user_id):
+    show_notices()
+    acct = get_state().account(user_id)
+    locked = acct['my_elpis_locked']
+    st.markdown(f"**보유(Lock): {locked:,} 주**")
+    st.markdown(f"**현재 예수금(ID): {acct['balance_id']:,.0f} ID**")
+    
+    if locked < 1:
+        st.caption("상장할 수 있는 물량이 없습니다.")
+        return
+    c1, c2 = st.columns(2)
+    ipo_qty = c1.number_input("상장 수량", 1, locked, min(1000, locked), key="ipo_qty")
+    ipo_price = c2.number_input("상장 가격", 100, value=10000, key="ipo_price")
+    if st.button("내 엘피스 시장에 팔기 (상장)", type="primary"):
+        ok, msg = list_ipo(ipo_price, ipo_qty)
+        if ok:
+            notify(msg); rerun_fragment()
+        else:
+            st.error(msg)
+
+# 보유 종목 한 줄 (평가액/수익률 + 매도). 전량 매도하면 다음 실행에서 사라집니다.
+@st.fragment
+def holding_row(user_id, code):
+    show_notices()
+    state = get_state()
+    info = state.account(user_id)['portfolio'].get(code)
+    if info is None:
+        return
+    curr_p = state.market_data[code]['price']
+    profit = (info['qty'] * curr_p) - (info['qty'] * info['avg_price'])
+    rate = (profit / (info['qty'] * info['avg_price'])) * 100
+    color = "#E22A2A" if profit >= 0 else "#2A6BE2"
+    
+    with st.container():
+        if st.button(f"{state.market_data[code]['name']} ({code})", key=f"pf_n_{code}", type="secondary"):
+            st.session_state['view_profile_id'] = code
+            st.session_state['selected_code'] = code
             st.rerun()
-        
-        st.markdown("<div style='height:10px'></div>", unsafe_allow_html=True)
-        uploaded_file = st.file_uploader("사진", type=['jpg', 'png'], key="profile_upload", label_visibility="collapsed")
-        
-        photo_to_show = None
-        if uploaded_file is not None:
-            st.session_state['uploaded_photo_cache'] = uploaded_file
-            photo_to_show = uploaded_file
-        elif st.session_state['uploaded_photo_cache'] is not None:
-            photo_to_show = st.session_state['uploaded_photo_cache']
             
-        if photo_to_show:
-            profile_img_placeholder.image(photo_to_show, width=110)
-
-        st.divider()
-        if st.button("⛏️ 채굴 (Daily Mining)", type="primary"):
-            ok, reward = mining()
-            if ok: 
-                falling_coins()
-                st.success(f"+{reward:,} ID")
-                time.sleep(2) 
-                st.rerun()
-            else: st.warning("이미 채굴했습니다.")
+        col_info1, col_info2, col_info3 = st.columns(3)
+        col_info1.metric("보유 수량", f"{info['qty']:,}주")
+        col_info2.metric("평가액", f"{info['qty'] * curr_p:,}")
+        col_info3.markdown(f"수익률 <br> <span style='color:{color}; font-weight:bold; font-size:20px'>{rate:.1f}%</span>", unsafe_allow_html=True)
         
-        st.divider()
-        st.markdown(f"<div style='font-size:18px; font-weight:700; color:#191F28; margin-bottom:10px;'>📨 {user_name}님에게 남겨진 메시지</div>", unsafe_allow_html=True)
-        
-        my_messages = [m for m in st.session_state['board_messages'] if m['code'] == user_id]
-        if my_messages:
-            for m in my_messages:
-                st.markdown(f"<div class='chat-box'><div class='chat-user'>{m['user']} <span style='font-weight:normal; color:#888;'>님이 작성</span></div><div class='chat-msg'>{m['msg']}</div><div class='chat-time'>{m['time']}</div></div>", unsafe_allow_html=True)
-        else:
-            st.info("아직 도착한 메시지가 없습니다.")
+        with st.expander("🔵 매도 하기"):
+            c_sell1, c_sell2, c_sell3 = st.columns([1, 1, 1])
+            s_price = c_sell1.number_input("매도가", min_value=1, value=curr_p, step=100, key=f"sell_p_{code}")
+            s_qty = c_sell2.number_input("수량", 1, info['qty'], info['qty'], key=f"sell_q_{code}")
+            if c_sell3.button("매도 주문", key=f"btn_sell_{code}", type="primary"):
+                ok, msg = place_order('SELL', code, s_price, s_qty)
+                if ok: notify(msg); rerun_fragment()
+                else: st.error(msg)
+    st.divider()
 
-    with tabs[1]:
-        st.markdown("""
+@st.fragment
+def pending_orders(user_id):
+    show_notices()
+    state = get_state()
+    my_pending = state.orders_of(user_id)
+    
+    if my_pending:
+        df_pending = pd.DataFrame(my_pending)
+        st.dataframe(df_pending[['code', 'type', 'price', 'qty']], use_container_width=True)
+        
+        c_cancel1, c_cancel2 = st.columns([3, 1])
+        cancel_id = c_cancel1.selectbox("취소할 주문", [o['id'] for o in my_pending], label_visibility="collapsed",
+                                        format_func=lambda oid: next(f"{o['code']} {o['type']} {o['price']:,} x {o['qty']:,}" for o in my_pending if o['id'] == oid))
+        if c_cancel2.button("주문 취소", key="cancel_order_btn", type="secondary"):
+            ok, msg = cancel_order(cancel_id)
+            if ok: notify(msg); rerun_fragment()
+            else: st.error(msg)
+    else:
+        st.info("대기 중인 주문이 없습니다.")
+
+# 토론방: 글쓰기와 목록을 한 조각으로 묶어, 등록/페이지 이동 때 이 부분만 다시 그립니다.
+@st.fragment
+def board_view(target):
+    state = get_state()
+    with st.form(key='msg_form', clear_on_submit=True):
+        user_msg = st.text_input("메시지", placeholder="응원/방명록 남기기")
+        if st.form_submit_button("등록", type="primary") and user_msg:
+            post_message(target, user_msg)
+            st.session_state.pop(f"board_cursor_{target}", None)
+    # 커서(이 순번보다 오래된 메시지부터)를 세션에 두고 한 페이지씩 넘깁니다.
+    cursor_key = f"board_cursor_{target}"
+    before = st.session_state.get(cursor_key)
+    with state.lock:
+        board_page, next_cursor = state.board.page(target, before, BOARD_PAGE_SIZE)
+    if not state.history_loaded:
+        st.caption(history_notice(state))
+    st.markdown("<div style='max-height: 300px; overflow-y: auto;'>", unsafe_allow_html=True)
+    for m in board_page:
+        st.markdown(f"<div class='chat-box'><div class='chat-user'>{m['user']}</div><div class='chat-msg'>{m['msg']}</div><div class='chat-time'>{m['time']}</div></div>", unsafe_allow_html=True)
+    st.markdown("</div>", unsafe_allow_html=True)
+    c_newer, c_older = st.columns(2)
+    if before is not None and c_newer.button("◀ 최신 메시지", key="board_newest"):
+        st.session_state[cursor_key] = None
+        rerun_fragment()
+    if next_cursor is not None and c_older.button("이전 메시지 ▶", key="board_older"):
+        st.session_state[cursor_key] = next_cursor
+        rerun_fragment()
+
+# 예전 체결/메시지를 아직 불러오는 중일 때 보여 줄 안내
+def history_notice(state):
+    if state.history_error is not None:
+        return "이전 기록을 불러오지 못했습니다. 최근 기록만 보여 줍니다."
+    return "이전 기록을 불러오는 중입니다... (최근 기록부터 보여 줍니다)"
+
+# --- [탭 공통 CSS] ---
+# 탭 안에서 넣던 스타일은 페이지 전체에 적용되므로, 어떤 탭이 열려 있든 항상 넣어 둡니다.
+TAB_CSS = """
             <style>
             div[data-testid="column"][style*="flex: 4"] button p {
                 font-size: 19px !important;
@@ -254,68 +482,6 @@ def render_ui():
                 background-color: rgba(112, 72, 232, 0.05) !important;
             }
             </style>
-        """, unsafe_allow_html=True)
-
-        st.markdown("<h4 style='margin-bottom: 15px; font-weight: 800;'>관심 종목</h4>", unsafe_allow_html=True)
-
-        h1, h2, h3, h4 = st.columns([4, 3, 2, 1], gap="small")
-        h1.markdown("<span style='color:#8B95A1; font-size:15px; padding-left:4px;'>종목명</span>", unsafe_allow_html=True)
-        h2.markdown("<span style='color:#8B95A1; font-size:15px; display:block; text-align:right;'>현재가</span>", unsafe_allow_html=True)
-        h3.markdown("<span style='color:#8B95A1; font-size:15px; display:block; text-align:right;'>등락</span>", unsafe_allow_html=True)
-        
-        st.markdown("<hr style='margin: 5px 0 0 0; border: 0; border-top: 1px solid #E5E8EB;'>", unsafe_allow_html=True)
-
-        targets = st.session_state['my_profile']['likes']
-        targets = [t for t in targets if t != user_id]
-
-        if not targets:
-            st.markdown("<div style='text-align:center; padding: 40px 0; color:#8B95A1; font-size:13px;'>관심 종목이 없습니다.</div>", unsafe_allow_html=True)
-
-        for code in targets:
-            if code in st.session_state['market_data']:
-                info = st.session_state['market_data'][code]
-                c_price = info['price']
-                c_change = info['change']
-
-                if c_change > 0:
-                    color = "#E22A2A"; bg_color = "rgba(226, 42, 42, 0.1)"; arrow = "▲"
-                elif c_change < 0:
-                    color = "#2A6BE2"; bg_color = "rgba(42, 107, 226, 0.1)"; arrow = "▼"
-                else:
-                    color = "#333333"; bg_color = "rgba(51, 51, 51, 0.1)"; arrow = "-"
-
-                with st.container():
-                    st.markdown("<div style='height: 6px;'></div>", unsafe_allow_html=True)
-                    
-                    r1, r2, r3, r4 = st.columns([4, 3, 2, 1], gap="small")
-
-                    with r1:
-                        if st.button(f"{info['name']}", key=f"fav_btn_{code}", type="secondary", use_container_width=True):
-                            st.session_state['view_profile_id'] = code
-                            st.session_state['selected_code'] = code 
-                            st.rerun()
-                    with r2:
-                        st.markdown(f"""
-                            <div style='text-align:right; padding-top: 10px; font-weight:700; font-size:18px; color:{color}; letter-spacing:-0.5px;'>
-                                {c_price:,}
-                            </div>
-                        """, unsafe_allow_html=True)
-                    with r3:
-                        st.markdown(f"""
-                            <div style='margin-top: 8px; float:right; background-color: {bg_color}; color: {color}; padding: 2px 4px; border-radius: 4px; font-size:15px; font-weight: 600; white-space: nowrap;'>
-                                {abs(c_change)}%
-                            </div>
-                        """, unsafe_allow_html=True)
-                    with r4:
-                        if st.button("✖", key=f"del_{code}"): 
-                            st.session_state['my_profile']['likes'].remove(code)
-                            save_current_user_state(user_id)
-                            st.rerun()
-
-                    st.markdown("<hr style='margin: 6px 0 0 0; border: 0; border-top: 1px solid #F2F4F6;'>", unsafe_allow_html=True)
-
-    with tabs[2]:
-        st.markdown("""
             <style>
             div[data-testid="column"] { padding: 0px !important; }
             
@@ -358,239 +524,343 @@ def render_ui():
                 justify-content: flex-start !important;
             }
             </style>
-        """, unsafe_allow_html=True)
-
-        col_s1, col_s2 = st.columns([3, 1.05])
-        search_q = col_s1.text_input("검색 (ID/이름)", placeholder="종목 검색...", label_visibility="collapsed")
-        if col_s2.button("🔍"):
-            found = False
-            for k, v in st.session_state['market_data'].items():
-                if search_q in k or search_q in v['name']:
-                    st.session_state['selected_code'] = k
-                    
-                    if k not in st.session_state['my_profile']['likes']:
-                        st.session_state['my_profile']['likes'].append(k)
-                        save_current_user_state(user_id)
-                    
-                    found = True
-                    break
-            if not found: st.toast("검색 결과가 없습니다.")
-            else: st.rerun()
-
-        target = st.session_state['selected_code']
-        market = st.session_state['market_data'][target]
-        curr_price = market['price']
-        change_pct = market['change']
-        
-        is_me = (target == user_id)
-        
-        # [JEMI FIX] 종목명 텍스트를 버튼으로 변경하여 프로필 팝업 연동
-        if st.button(f"{market['name']} $ELP-{target}", key="cp_title_btn", type="tertiary"):
-             st.session_state['view_profile_id'] = target
-             st.rerun()
-             
-        pc1, pc2 = st.columns(2)
-        color_cls = "price-up" if change_pct >= 0 else "price-down"
-        pc1.markdown(f"<div class='big-font {color_cls}'>{curr_price:,} ID</div>", unsafe_allow_html=True)
-        pc2.markdown(f"<div class='{color_cls}' style='text-align:right; font-size:18px'>{change_pct}%</div>", unsafe_allow_html=True)
-        
-        pending_orders = [o for o in st.session_state['pending_orders'] if o['code'] == target]
-        buy_book = {} 
-        sell_book = {} 
-        
-        for o in pending_orders:
-            if o['type'] == 'BUY':
-                buy_book[o['price']] = buy_book.get(o['price'], 0) + o['qty']
-            elif o['type'] == 'SELL':
-                sell_book[o['price']] = sell_book.get(o['price'], 0) + o['qty']
-        
-        best_asks = sorted(sell_book.items(), key=lambda x: x[0])[:5] 
-        best_asks.sort(key=lambda x: x[0], reverse=True) 
-        best_bids = sorted(buy_book.items(), key=lambda x: x[0], reverse=True)[:5]
+"""
+
+# --- [탭: 메인화면] ---
+def tab_home(state, user_id):
+    user_name = state.user_names.get(user_id, '사용자')
+    acct = state.account(user_id)
+    with st.container():
+        st.markdown(f"<div style='text-align:center;'>", unsafe_allow_html=True)
+        col_top_spacer, col_top_logout = st.columns([5, 1])
+        with col_top_logout:
+            if st.button("로그아웃", key="logout_btn", type="secondary"):
+                st.session_state['logged_in'] = False
+                st.session_state['user_info'] = {}
+                st.session_state['uploaded_photo_cache'] = None
+                st.rerun()
 
-        st.markdown("<div class='hoga-container'>", unsafe_allow_html=True)
-        
-        sell_rows_data = []
-        for p, q in best_asks:
-            sell_rows_data.append((p, q))
-        while len(sell_rows_data) < 5:
-            sell_rows_data.insert(0, (None, None))
-            
-        for p, q in sell_rows_data:
-            c1, c2, c3 = st.columns([1, 1.5, 1], gap="small")
-            with c1: 
-                if q: st.markdown(f"<div class='hoga-row-height' style='text-align:right; padding-right:12px; font-size:12px; color:#4E5968;'>{q:,}</div>", unsafe_allow_html=True)
-                else: st.markdown("", unsafe_allow_html=True)
-            with c2: 
-                if p:
-                    if not is_me: 
-                        if st.button(f"{p:,}", key=f"ask_btn_{target}_{p}", type="secondary"):
-                            quick_buy_popup(target, p, market['name'])
-                    else: 
-                         st.markdown(f"<div class='cell-price price-up hoga-row-height'>{p:,}</div>", unsafe_allow_html=True)
-                else:
-                    st.markdown("<div class='hoga-row-height'></div>", unsafe_allow_html=True)
-            with c3: 
-                st.markdown("", unsafe_allow_html=True)
-            st.markdown("<hr style='margin:0; border:0; border-bottom:1px solid #F9FAFB;'>", unsafe_allow_html=True)
-
-        st.markdown(f"""
-            <div style='display:flex; height:30px; align-items:center; border-top:1px solid #E5E8EB; border-bottom:1px solid #E5E8EB;'>
-                <div style='flex:1;'></div>
-                <div style='flex:1.2; text-align:center; font-weight:800; font-size:16px; color:#191F28; background-color:#FFF;'>{curr_price:,}</div>
-                <div style='flex:1;'></div>
-            </div>
-        """, unsafe_allow_html=True)
-
-        buy_rows_data = []
-        for p, q in best_bids:
-            buy_rows_data.append((p, q))
-        while len(buy_rows_data) < 5:
-            buy_rows_data.append((None, None))
-            
-        for p, q in buy_rows_data:
-            c1, c2, c3 = st.columns([1, 1.6, 1], gap="small")
-            with c1: 
-                 st.markdown("", unsafe_allow_html=True)
-            with c2: 
-                if p:
-                    if is_me: 
-                        if st.button(f"{p:,}", key=f"bid_btn_{target}_{p}", type="secondary"):
-                            quick_sell_popup(target, p, market['name'])
-                    else:
-                        st.markdown(f"<div class='cell-price price-down hoga-row-height'>{p:,}</div>", unsafe_allow_html=True)
-                else:
-                    st.markdown("<div class='hoga-row-height'></div>", unsafe_allow_html=True)
-            with c3: 
-                if q: st.markdown(f"<div class='hoga-row-height' style='text-align:left; padding-left:12px; font-size:12px; color:#4E5968;'>{q:,}</div>", unsafe_allow_html=True)
-                else: st.markdown("", unsafe_allow_html=True)
-            st.markdown("<hr style='margin:0; border:0; border-bottom:1px solid #F9FAFB;'>", unsafe_allow_html=True)
-        
+        col_profile_info, col_profile_img = st.columns([2.8, 1.2]) 
+        with col_profile_info:
+            st.markdown(f"<h2>{user_name} <span style='font-size:16px; color:#8B95A1'>({user_id})</span></h2>", unsafe_allow_html=True)
+            st.caption(acct['my_profile']['vision'] if acct['my_profile']['vision'] else "나의 비전이 없습니다.")
+        with col_profile_img:
+            profile_img_placeholder = st.empty()
         st.markdown("</div>", unsafe_allow_html=True)
+    st.markdown("---")
 
-        with st.expander("📊 차트", expanded=True):
-            fig = go.Figure()
-            fig.add_trace(go.Scatter(y=market['history'], mode='lines+markers', line=dict(color='#E22A2A', width=2)))
-            fig.update_layout(height=200, margin=dict(l=10, r=10, t=10, b=10), dragmode=False, paper_bgcolor='white', plot_bgcolor='#F2F4F6')
-            st.plotly_chart(fig, use_container_width=True, config={'staticPlot': False, 'displayModeBar': False})
-
-        st.divider()
-        st.subheader(f"💬 {market['name']} 토론방 (방명록)")
-        with st.form(key='msg_form', clear_on_submit=True):
-            user_msg = st.text_input("메시지", placeholder="응원/방명록 남기기")
-            if st.form_submit_button("등록", type="primary") and user_msg:
-                st.session_state['board_messages'].insert(0, {'code': target, 'user': user_id, 'msg': user_msg, 'time': datetime.datetime.now().strftime("%H:%M")})
-                save_db()
-                st.rerun()
-        st.markdown("<div style='max-height: 300px; overflow-y: auto;'>", unsafe_allow_html=True)
-        for m in st.session_state['board_messages']:
-            if m['code'] == target:
-                st.markdown(f"<div class='chat-box'><div class='chat-user'>{m['user']}</div><div class='chat-msg'>{m['msg']}</div><div class='chat-time'>{m['time']}</div></div>", unsafe_allow_html=True)
-        st.markdown("</div>", unsafe_allow_html=True)
+    total_asset = state.valuation(user_id).total
 
-    with tabs[3]:
-        target = st.session_state['selected_code']
-        market = st.session_state['market_data'][target]
-        st.subheader("🛒 매수 주문")
+    with st.container():
+        c1, c2, c3 = st.columns([2, 1, 1])
+        c1.markdown(f"### 💰 총 자산<br><span style='color:#333D4B; font-size:24px; font-weight:bold'>{total_asset:,.0f} ID</span>", unsafe_allow_html=True)
+        c2.metric("보유 이드", f"{acct['balance_id']:,.0f}")
+        c3.metric("내 엘피스", f"{acct['my_elpis_locked']:,}")
+    st.markdown("---")
+    
+    profile_form(user_id)
+    
+    st.markdown("<div style='height:10px'></div>", unsafe_allow_html=True)
+    uploaded_file = st.file_uploader("사진", type=['jpg', 'png'], key="profile_upload", label_visibility="collapsed")
+    
+    photo_to_show = None
+    if uploaded_file is not None:
+        st.session_state['uploaded_photo_cache'] = uploaded_file
+        photo_to_show = uploaded_file
+    elif st.session_state['uploaded_photo_cache'] is not None:
+        photo_to_show = st.session_state['uploaded_photo_cache']
         
-        if st.button(f"선택 종목: {market['name']} ({target})", type="secondary", use_container_width=True):
-            st.session_state['view_profile_id'] = target
+    if photo_to_show:
+        profile_img_placeholder.image(photo_to_show, width=110)
+
+    st.divider()
+    if st.button("⛏️ 채굴 (Daily Mining)", type="primary"):
+        ok, reward = mining()
+        if ok: 
+            notify(f"+{reward:,} ID", icon="🪙")
+            st.session_state['coin_rain'] = True
             st.rerun()
-        
-        with st.container():
-            st.markdown(f"#### 가용: <span style='color:#3182F6'>{st.session_state['balance_id']:,.0f} ID</span>", unsafe_allow_html=True)
-            buy_price = st.number_input("매수 희망가 (ID)", value=market['price'], step=100, key="buy_price_main")
-            buy_qty = st.number_input("매수 수량 (주)", value=10, step=1, key="buy_qty_main")
-            
-            if st.button("🔴 매수 주문 전송", type="primary"):
-                ok, msg = place_order('BUY', target, buy_price, buy_qty)
-                if ok: st.success(msg); time.sleep(1); st.rerun()
-                else: st.error(msg)
+        else: st.warning("이미 채굴했습니다.")
+    
+    st.divider()
+    st.markdown(f"<div style='font-size:18px; font-weight:700; color:#191F28; margin-bottom:10px;'>📨 {user_name}님에게 남겨진 메시지</div>", unsafe_allow_html=True)
+    
+    with state.lock:
+        my_messages, _ = state.board.page(user_id, limit=BOARD_PAGE_SIZE)
+    if my_messages:
+        for m in my_messages:
+            st.markdown(f"<div class='chat-box'><div class='chat-user'>{m['user']} <span style='font-weight:normal; color:#888;'>님이 작성</span></div><div class='chat-msg'>{m['msg']}</div><div class='chat-time'>{m['time']}</div></div>", unsafe_allow_html=True)
+    else:
+        st.info("아직 도착한 메시지가 없습니다.")
 
-    with tabs[4]:
-        st.subheader("💼 잔고 및 매도")
-        
-        with st.expander("📢 내 엘피스 상장 (IPO)", expanded=True):
-            locked = st.session_state['my_elpis_locked']
-            st.markdown(f"**보유(Lock): {locked:,} 주**")
-            st.markdown(f"**현재 예수금(ID): {st.session_state['balance_id']:,.0f} ID**")
-            
-            c1, c2 = st.columns(2)
-            ipo_qty = c1.number_input("상장 수량", 1, locked, 1000, key="ipo_qty")
-            ipo_price = c2.number_input("상장 가격", 100, value=10000, key="ipo_price")
-            if st.button("내 엘피스 시장에 팔기 (상장)", type="primary"):
-                if locked >= ipo_qty:
-                    st.session_state['my_elpis_locked'] -= ipo_qty
-                    if user_id in st.session_state['market_data']:
-                        st.session_state['market_data'][user_id]['price'] = ipo_price
-                    else:
-                        st.session_state['market_data'][user_id] = {'name': user_id, 'price': ipo_price, 'change': 0.0, 'desc': '신규 상장', 'history': [ipo_price]}
-                    
-                    st.session_state['pending_orders'].append({'code': user_id, 'type': 'SELL', 'price': ipo_price, 'qty': ipo_qty, 'user': user_id})
-                    
-                    save_current_user_state(user_id) 
-                    st.success("상장 주문 등록 완료! (매수자가 나타나면 체결됩니다)"); time.sleep(1.5); st.rerun()
-                else:
-                    st.error("보유 수량이 부족합니다.")
-        
-        st.divider()
+# --- [탭: 관심] ---
+def tab_watchlist(state, user_id):
+    likes = state.account(user_id)['my_profile'].get('likes', [])
+    st.markdown("<h4 style='margin-bottom: 15px; font-weight: 800;'>관심 종목</h4>", unsafe_allow_html=True)
 
-        if not st.session_state['portfolio']: 
-            st.info("보유 중인 주식이 없습니다.")
-        else:
-            for code, info in st.session_state['portfolio'].items():
-                curr_p = st.session_state['market_data'][code]['price']
-                profit = (info['qty'] * curr_p) - (info['qty'] * info['avg_price'])
-                rate = (profit / (info['qty'] * info['avg_price'])) * 100
-                color = "#E22A2A" if profit >= 0 else "#2A6BE2"
+    h1, h2, h3, h4 = st.columns([4, 3, 2, 1], gap="small")
+    h1.markdown("<span style='color:#8B95A1; font-size:15px; padding-left:4px;'>종목명</span>", unsafe_allow_html=True)
+    h2.markdown("<span style='color:#8B95A1; font-size:15px; display:block; text-align:right;'>현재가</span>", unsafe_allow_html=True)
+    h3.markdown("<span style='color:#8B95A1; font-size:15px; display:block; text-align:right;'>등락</span>", unsafe_allow_html=True)
+    
+    st.markdown("<hr style='margin: 5px 0 0 0; border: 0; border-top: 1px solid #E5E8EB;'>", unsafe_allow_html=True)
+
+    targets = likes
+    targets = [t for t in targets if t != user_id]
+
+    if not targets:
+        st.markdown("<div style='text-align:center; padding: 40px 0; color:#8B95A1; font-size:13px;'>관심 종목이 없습니다.</div>", unsafe_allow_html=True)
+
+    for code in targets:
+        if code in state.market_data:
+            info = state.market_data[code]
+            c_price = info['price']
+            c_change = info['change']
+
+            if c_change > 0:
+                color = "#E22A2A"; bg_color = "rgba(226, 42, 42, 0.1)"; arrow = "▲"
+            elif c_change < 0:
+                color = "#2A6BE2"; bg_color = "rgba(42, 107, 226, 0.1)"; arrow = "▼"
+            else:
+                color = "#333333"; bg_color = "rgba(51, 51, 51, 0.1)"; arrow = "-"
+
+            with st.container():
+                st.markdown("<div style='height: 6px;'></div>", unsafe_allow_html=True)
                 
-                with st.container():
-                    if st.button(f"{st.session_state['market_data'][code]['name']} ({code})", key=f"pf_n_{code}", type="secondary"):
+                r1, r2, r3, r4 = st.columns([4, 3, 2, 1], gap="small")
+
+                with r1:
+                    if st.button(f"{info['name']}", key=f"fav_btn_{code}", type="secondary", use_container_width=True):
                         st.session_state['view_profile_id'] = code
-                        st.session_state['selected_code'] = code
+                        st.session_state['selected_code'] = code 
                         st.rerun()
-                        
-                    col_info1, col_info2, col_info3 = st.columns(3)
-                    col_info1.metric("보유 수량", f"{info['qty']:,}주")
-                    col_info2.metric("평가액", f"{info['qty'] * curr_p:,}")
-                    col_info3.markdown(f"수익률 <br> <span style='color:{color}; font-weight:bold; font-size:20px'>{rate:.1f}%</span>", unsafe_allow_html=True)
-                    
-                    with st.expander("🔵 매도 하기"):
-                        c_sell1, c_sell2, c_sell3 = st.columns([1, 1, 1])
-                        s_price = c_sell1.number_input("매도가", value=curr_p, step=100, key=f"sell_p_{code}")
-                        s_qty = c_sell2.number_input("수량", 1, info['qty'], info['qty'], key=f"sell_q_{code}")
-                        if c_sell3.button("매도 주문", key=f"btn_sell_{code}", type="primary"):
-                            ok, msg = place_order('SELL', code, s_price, s_qty)
-                            if ok: st.success(msg); time.sleep(1); st.rerun()
-                            else: st.error(msg)
-                st.divider()
-
-    with tabs[5]:
-        st.subheader("📜 나의 거래 내역")
-
-        st.markdown("#### ⏳ 미체결 주문 (Pending)")
-        my_pending = [o for o in st.session_state['pending_orders'] if o['user'] == user_id]
-        
-        if my_pending:
-            df_pending = pd.DataFrame(my_pending)
-            st.dataframe(df_pending[['code', 'type', 'price', 'qty']], use_container_width=True)
-        else:
-            st.info("대기 중인 주문이 없습니다.")
+                with r2:
+                    st.markdown(f"""
+                        <div style='text-align:right; padding-top: 10px; font-weight:700; font-size:18px; color:{color}; letter-spacing:-0.5px;'>
+                            {c_price:,}
+                        </div>
+                    """, unsafe_allow_html=True)
+                with r3:
+                    st.markdown(f"""
+                        <div style='margin-top: 8px; float:right; background-color: {bg_color}; color: {color}; padding: 2px 4px; border-radius: 4px; font-size:15px; font-weight: 600; white-space: nowrap;'>
+                            {abs(c_change)}%
+                        </div>
+                    """, unsafe_allow_html=True)
+                with r4:
+                    if st.button("✖", key=f"del_{code}"): 
+                        update_profile(user_id, likes=[c for c in likes if c != code])
+                        st.rerun()
+
+                st.markdown("<hr style='margin: 6px 0 0 0; border: 0; border-top: 1px solid #F2F4F6;'>", unsafe_allow_html=True)
+
+# --- [탭: 현재가] ---
+def tab_quote(state, user_id):
+    likes = state.account(user_id)['my_profile'].get('likes', [])
+    col_s1, col_s2 = st.columns([3, 1.05])
+    search_q = col_s1.text_input("검색 (ID/이름/초성)", placeholder="종목 검색... (예: ㅇㅇㅇ)", label_visibility="collapsed")
+    # 검색 인덱스에서 순위대로 상위 몇 개만 받아 바로 고를 수 있게 보여 줍니다. 🔍는 1순위로 이동합니다.
+    hits = state.search_markets(search_q, k=SEARCH_SUGGESTIONS) if search_q else []
+    clicked = col_s2.button("🔍")
+    picked = hits[0] if clicked and hits else None
+    if search_q and not hits:
+        st.caption("검색 결과가 없습니다.")
+    if hits:
+        cols = st.columns(len(hits))
+        for col, code in zip(cols, hits):
+            if col.button(state.market_data[code]['name'], key=f"search_hit_{code}", help=code, use_container_width=True):
+                picked = code
+    if picked:
+        st.session_state['selected_code'] = picked
+        if picked not in likes:
+            update_profile(user_id, likes=likes + [picked])
+        st.rerun()
+
+    target = st.session_state['selected_code']
+    market = state.market_data[target]
+    live_price_header(target)
+    live_hoga_ladder(target)
+    with st.expander("📊 차트", expanded=True):
+        live_price_chart(target)
+
+    st.divider()
+    st.subheader(f"💬 {market['name']} 토론방 (방명록)")
+    board_view(target)
+
+# --- [탭: 주문] ---
+def tab_order(state, user_id):
+    target = st.session_state['selected_code']
+    market = state.market_data[target]
+    st.subheader("🛒 매수 주문")
+    
+    if st.button(f"선택 종목: {market['name']} ({target})", type="secondary", use_container_width=True):
+        st.session_state['view_profile_id'] = target
+        st.rerun()
+    
+    with st.container():
+        buy_form(target)
 
+# --- [탭: 잔고] ---
+def tab_balance(state, user_id):
+    acct = state.account(user_id)
+    st.subheader("💼 잔고 및 매도")
+    
+    with st.expander("📢 내 엘피스 상장 (IPO)", expanded=True):
+        ipo_form(user_id)
+    
+    st.divider()
+
+    if not acct['portfolio']: 
+        st.info("보유 중인 주식이 없습니다.")
+    else:
+        val = state.valuation(user_id)
+        rate = (val.profit / val.cost * 100) if val.cost else 0.0
+        c1, c2, c3 = st.columns(3)
+        c1.metric("총 평가액", f"{val.stock:,.0f}")
+        c2.metric("평가 손익", f"{val.profit:,.0f}")
+        c3.metric("총 수익률", f"{rate:.1f}%")
         st.divider()
+        for code in list(acct['portfolio']):
+            holding_row(user_id, code)
 
-        st.markdown("#### ✅ 체결 완료 (Executed)")
-        if 'trade_history' in st.session_state and st.session_state['trade_history']:
-            my_trades = [t for t in st.session_state['trade_history'] 
-                         if t.get('buyer') == user_id or t.get('seller') == user_id]
-            
-            if my_trades:
-                st.dataframe(pd.DataFrame(my_trades)[['time', 'name', 'type', 'price', 'qty']], use_container_width=True)
-            else:
-                st.caption("아직 체결된 나의 거래 내역이 없습니다.")
+# --- [탭: 내역] ---
+def tab_history(state, user_id):
+    st.subheader("📜 나의 거래 내역")
+
+    st.markdown("#### ⏳ 미체결 주문 (Pending)")
+    pending_orders(user_id)
+
+    st.divider()
+
+    st.markdown("#### ✅ 체결 완료 (Executed)")
+    if not state.history_loaded:
+        st.caption(history_notice(state))
+    if len(state.trades):
+        # 유저별 인덱스에서 최신순으로 한 페이지 분량만 꺼냅니다.
+        my_count = state.trades.count_for_user(user_id)
+        if my_count:
+            pages = (my_count + TRADES_PER_PAGE - 1) // TRADES_PER_PAGE
+            page = st.number_input("페이지", min_value=1, max_value=pages, value=1, step=1, key="trade_page") if pages > 1 else 1
+            with state.lock:
+                my_trades = state.trades.for_user(user_id, offset=(page - 1) * TRADES_PER_PAGE, limit=TRADES_PER_PAGE)
+            st.dataframe(pd.DataFrame(my_trades)[['time', 'name', 'type', 'price', 'qty']], use_container_width=True)
+            st.caption(f"{page} / {pages} 페이지 · 총 {my_count:,}건")
         else:
-            st.caption("거래 내역이 생성되지 않았습니다.")
-    
-    with tabs[6]:
-        st.subheader("💱 거래소")
-        st.info("Coming Soon")
+            st.caption("아직 체결된 나의 거래 내역이 없습니다.")
+    else:
+        st.caption("거래 내역이 생성되지 않았습니다.")
+
+# --- [탭: 거래소] ---
+# 시장 동향: 순위는 체결 때 미리 정렬해 둔 목록에서 k개씩만 꺼냅니다.
+@st.fragment(run_every=LIVE_REFRESH)
+def live_market_movers():
+    movers = get_state().market_movers(MOVERS_SIZE)
+    st.markdown("#### 📈 시장 동향 (최근 24시간)")
+    for col, (kind, title) in zip(st.columns(3), (('gainers', "🔺 상승"), ('losers', "🔻 하락"), ('volume', "🔥 거래량"))):
+        with col:
+            st.markdown(f"**{title}**")
+            if not movers[kind]:
+                st.caption("최근 24시간 체결이 없습니다.")
+                continue
+            st.dataframe(pd.DataFrame([{'종목': name, '현재가': price, '등락(%)': stats['change'], '거래량': stats['volume'],
+                                        '거래대금': stats['turnover'], '체결': stats['count']}
+                                       for _, name, price, stats in movers[kind]]),
+                         use_container_width=True, hide_index=True,
+                         column_config={c: st.column_config.NumberColumn(format="localized") for c in ('현재가', '거래량', '거래대금')})
+
+# 순위는 평가액 캐시(state.valuations)의 유저별 배열에서 배열 연산으로 뽑으므로 유저 수가 많아도 이 조각만 가볍게 다시 돕니다.
+@st.fragment(run_every=LIVE_REFRESH)
+def live_leaderboard(user_id):
+    state = get_state()
+    summary = state.asset_summary()
+    board = state.leaderboard(LEADERBOARD_SIZE)
+    rank = state.asset_rank(user_id)
+
+    c1, c2, c3 = st.columns(3)
+    c1.metric("참여자", f"{summary['users']:,}명")
+    c2.metric("유통 ID (잔고 합계)", f"{summary['supply']:,.0f}")
+    c3.metric("내 순위", f"{rank:,}위" if rank else "-")
+
+    st.markdown("#### 🏆 총 자산 순위")
+    names = state.user_names
+    st.dataframe(pd.DataFrame([{'순위': i + 1, '이름': names.get(uid, uid), '아이디': uid, '잔고': balance, '평가액': stock, '총 자산': total}
+                               for i, (uid, balance, stock, total) in enumerate(board)]),
+                 use_container_width=True, hide_index=True,
+                 column_config={col: st.column_config.NumberColumn(format="localized") for col in ('잔고', '평가액', '총 자산')})
+    st.caption(f"전체 보유 주식 평가액 {summary['stock']:,.0f} ID · {LIVE_REFRESH}초마다 갱신")
+
+def tab_exchange(state, user_id):
+    st.subheader("💱 거래소")
+    live_market_movers()
+    st.divider()
+    live_leaderboard(user_id)
+
+# --- [탭: 운영 (관리자 전용)] ---
+# ELPIS_METRICS=1 로 띄웠을 때 모인 구간 시간 / 카운터 / 게이지와 저장기 상태를 보여 줍니다.
+def tab_admin(state, user_id):
+    st.subheader("🛠️ 운영 지표")
+    if not metrics.ENABLED:
+        st.info("지표 수집이 꺼져 있습니다. ELPIS_METRICS=1 로 실행하면 모읍니다.")
+
+    writer = get_writer()
+    c1, c2, c3 = st.columns(3)
+    c1.metric("대기 중인 저장", f"{writer.pending:,}")
+    c2.metric("완료된 업로드", f"{writer.done:,}")
+    c3.metric("연속 실패", f"{writer.failures:,}")
+    if writer.last_error is not None:
+        st.error(f"마지막 저장 오류: {writer.last_error}")
+
+    spans, counters, gauges = metrics.snapshot()
+    st.markdown("#### ⏱️ 구간 시간")
+    if spans:
+        st.dataframe(pd.DataFrame([{'구간': name, '라벨': ', '.join(f"{k}={v}" for k, v in labels.items()), '횟수': n,
+                                    '평균(ms)': round(total / n * 1000, 3), '최대(ms)': round(longest * 1000, 3)}
+                                   for name, labels, n, total, longest in spans]), use_container_width=True, hide_index=True)
+    else:
+        st.caption("아직 잰 구간이 없습니다.")
+
+    st.markdown("#### 🔢 카운터 / 게이지")
+    rows = [{'이름': name, '라벨': ', '.join(f"{k}={v}" for k, v in labels.items()), '값': value} for name, labels, value in counters]
+    rows += [{'이름': name, '라벨': '', '값': value} for name, value in gauges]
+    st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+
+    c1, c2 = st.columns(2)
+    if c1.button("Prometheus 파일 쓰기", use_container_width=True):
+        try:
+            notify(f"{metrics.write_prometheus()} 에 기록했습니다.", icon="📝")
+        except OSError as e:
+            st.error(f"기록 실패: {e}")
+        st.rerun()
+    if c2.button("지표 초기화", use_container_width=True):
+        metrics.reset()
+        st.rerun()
+    with st.expander("Prometheus 텍스트"):
+        st.code(metrics.prometheus_text(), language="text")
+
+# --- [UI 렌더링 메인 함수] ---
+# 탭은 on_change="rerun"으로 선택 상태를 서버가 알게 하고, 선택된 탭 하나만 실행합니다.
+TABS = [("메인화면", tab_home), ("관심", tab_watchlist), ("현재가", tab_quote), ("주문", tab_order),
+        ("잔고", tab_balance), ("내역", tab_history), ("거래소", tab_exchange)]
+
+def render_ui():
+    state = get_state()
+    user_id = st.session_state['user_info'].get('id', 'Guest')
+
+    if 'uploaded_photo_cache' not in st.session_state:
+        st.session_state['uploaded_photo_cache'] = None
+
+    show_notices()
+    show_revisions(state, user_id)
+    if st.session_state.pop('coin_rain', False):
+        falling_coins()
+    st.markdown(TAB_CSS, unsafe_allow_html=True)
+
+    # [JEMI FIX] 프로필 뷰를 메인 화면 상단이 아닌 '팝업(Dialog)'으로 처리하여 화면 밀림 방지
+    if st.session_state.get('view_profile_id'):
+        profile_popup(st.session_state['view_profile_id'])
+
+    views = TABS + [("운영", tab_admin)] if user_id in ADMINS else TABS
+    tabs = st.tabs([name for name, _ in views], key="main_tab", on_change="rerun")
+    for tab, (name, view) in zip(tabs, views):
+        if tab.open:
+            with tab, metrics.span('render_tab', tab=name):
+                view(state, user_id)